@@ -0,0 +1,159 @@
+"""Async PostgREST (Supabase ``/rest/v1``) client for concurrent reads and RPCs.
+
+One ``httpx.AsyncClient`` with a keep-alive connection pool lives on a
+private event loop thread for the whole process, so synchronous callers
+(the Streamlit script thread, job workers) submit coroutines with ``run``
+and independent requests go out together instead of one after another.
+Concurrency is capped by a semaphore; transient failures are retried with
+the same backoff policy as bulk_writer.
+"""
+import asyncio
+import random
+import re
+import threading
+
+import httpx
+
+from bulk_writer import BACKOFF_BASE, BACKOFF_MAX, MAX_ATTEMPTS, is_retry_safe_error, is_transient_error
+
+MAX_CONCURRENCY = 8
+MAX_CONNECTIONS = 16
+TIMEOUT_SECONDS = 30.0
+CONNECT_TIMEOUT_SECONDS = 10.0
+PAGE_SIZE = 1000  # PostgREST max-rows on Supabase
+
+
+class RestError(Exception):
+    """Non-2xx response; ``code`` is the PostgREST/Postgres error code or the HTTP status."""
+
+    def __init__(self, response):
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        if not isinstance(body, dict):
+            body = {}
+        self.status = response.status_code
+        self.code = body.get("code") or str(response.status_code)
+        super().__init__(f"{response.status_code} {body.get('message') or response.text[:200]}")
+
+
+class AsyncRest:
+    def __init__(self, url, key, max_concurrency=MAX_CONCURRENCY, max_connections=MAX_CONNECTIONS,
+                 timeout=TIMEOUT_SECONDS, max_attempts=MAX_ATTEMPTS, transport=None):
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self._client_args = {
+            "base_url": url.rstrip("/") + "/rest/v1",
+            "headers": {"apikey": key, "Authorization": f"Bearer {key}"},
+            "timeout": httpx.Timeout(timeout, connect=min(timeout, CONNECT_TIMEOUT_SECONDS)),
+            "limits": httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            "transport": transport
+        }
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="async-rest", daemon=True).start()
+        self.run(self._open())
+
+    async def _open(self):
+        # client and semaphore must be created on the loop that uses them
+        self._client = httpx.AsyncClient(**self._client_args)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    def run(self, coro, timeout=None):
+        """Run ``coro`` on the client's loop from synchronous code and return its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    def close(self):
+        self.run(self._client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    async def request(self, method, path, params=None, json=None, headers=None, should_retry=is_transient_error):
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                async with self._semaphore:
+                    response = await self._client.request(method, path, params=params, json=json, headers=headers)
+                if response.status_code >= 400:
+                    raise RestError(response)
+                return response
+            except Exception as e:
+                if attempt >= self.max_attempts or not should_retry(e):
+                    raise
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+    async def select(self, table, columns, filters=(), order=None, limit=None, offset=None):
+        """One GET; ``filters`` are ``(column, "op.value")`` pairs, e.g. ``("farmer_id", "eq.abc")``."""
+        params = [("select", ",".join(columns))] + list(filters)
+        if order:
+            params.append(("order", order))
+        if limit is not None:
+            params.append(("limit", str(limit)))
+        if offset:
+            params.append(("offset", str(offset)))
+        return (await self.request("GET", f"/{table}", params=params)).json()
+
+    async def select_all(self, table, columns, filters=(), order=None, page_size=PAGE_SIZE):
+        """Every matching row, page by page (for filters expected to match few pages)."""
+        rows = []
+        offset = 0
+        while True:
+            page = await self.select(table, columns, filters, order, page_size, offset)
+            rows.extend(page)
+            if len(page) < page_size:
+                return rows
+            offset += page_size
+
+    async def count(self, table, filters=()):
+        response = await self.request("HEAD", f"/{table}", params=[("select", "*")] + list(filters),
+                                      headers={"Prefer": "count=exact"})
+        # Content-Range: 0-999/12345 or */0
+        match = re.search(r"/(\d+)$", response.headers.get("content-range", ""))
+        return int(match.group(1)) if match else None
+
+    async def select_key_range(self, table, columns, key, low=None, high=None, filters=(), page_size=PAGE_SIZE):
+        """Rows with ``low <= key < high`` (either bound optional), walked in key order page by page."""
+        bounds = list(filters) + ([(key, f"lt.{high}")] if high is not None else [])
+        rows = []
+        lower = (key, f"gte.{low}") if low is not None else None
+        while True:
+            page = await self.select(table, columns, bounds + ([lower] if lower else []), order=key, limit=page_size)
+            rows.extend(page)
+            if len(page) < page_size:
+                return rows
+            lower = (key, f"gt.{page[-1][key]}")
+
+    async def select_ranges(self, table, columns, key, filters=(), page_size=PAGE_SIZE):
+        """A large table in parallel, split into ranges of the unique ``key``.
+
+        Range boundaries are sampled with one-row offset probes, then every
+        range is walked by key concurrently. Rows inserted or deleted while
+        this runs can move a boundary but never make a range skip a row, as
+        offset pages would: every key falls in the range after the last
+        boundary not above it. Boundaries keep the database's order (its
+        collation, not Python's), and rows are deduplicated by ``key`` in
+        case concurrent deletes made the probes out of order.
+        """
+        total = await self.count(table, filters)
+        # ranges a bit smaller than a page usually come back in one request even after a few inserts
+        stride = max(1, page_size - page_size // 10)
+        probes = await asyncio.gather(*(
+            self.select(table, [key], filters, order=key, limit=1, offset=offset)
+            for offset in range(stride, total or 0, stride)
+        ))
+        boundaries = list(dict.fromkeys(page[0][key] for page in probes if page))
+        ranges = zip([None] + boundaries, boundaries + [None])
+        parts = await asyncio.gather(*(
+            self.select_key_range(table, columns, key, low, high, filters, page_size) for low, high in ranges
+        ))
+        return list({row[key]: row for part in parts for row in part}.values())
+
+    async def insert(self, table, rows):
+        # a plain insert is not idempotent: retried only when it certainly was not written
+        await self.request("POST", f"/{table}", json=rows, headers={"Prefer": "return=minimal"},
+                           should_retry=is_retry_safe_error)
+
+    async def rpc(self, name, params=None):
+        response = await self.request("POST", f"/rpc/{name}", json=params or {})
+        return response.json() if response.content else None
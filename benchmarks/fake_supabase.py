@@ -0,0 +1,273 @@
+"""In-process stand-in for the Supabase client used by the benchmarks.
+
+Implements only the PostgREST calls the app makes (select with in/gt/gte/eq
+filters, order, limit, range, insert) and the RPCs from sql/, over plain
+Python rows indexed by farmer_id. ``latency`` adds a fixed sleep to every
+request to mimic the network round-trip. ``transport()`` serves the same
+data over HTTP for async_rest.AsyncRest.
+"""
+import asyncio
+import bisect
+import json
+import re
+import threading
+import time
+from collections import defaultdict
+
+import httpx
+
+from benchmarks.synthetic import QUOTA_PER_HA
+
+TRACEABILITY_KEY = ('exporter', 'export_lot', 'farmer_id')
+
+
+class _Response:
+    def __init__(self, data):
+        self.data = data
+
+
+def _unquote(value):
+    value = str(value)
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        value = value[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+    return value
+
+
+class _Table:
+    def __init__(self, rows=(), sorted_by=None):
+        self.rows = []
+        self.by_farmer = defaultdict(list)
+        self.sorted_by = sorted_by
+        self.extend(rows)
+
+    def extend(self, rows):
+        for row in rows:
+            self.rows.append(row)
+            self.by_farmer[row.get('farmer_id')].append(row)
+        if self.sorted_by:
+            self.rows.sort(key=lambda r: r[self.sorted_by])
+            self.sort_keys = [r[self.sorted_by] for r in self.rows]
+
+    def replace_rows(self, rows):
+        self.rows = []
+        self.by_farmer = defaultdict(list)
+        self.extend(rows)
+
+
+class _Query:
+    def __init__(self, client, table):
+        self.client = client
+        self.table_name = table
+        self.columns = None
+        self.filters = []
+        self.order_by = None
+        self.limit_n = None
+        self.row_range = None
+        self.payload = None
+
+    def select(self, columns="*", **kwargs):
+        self.columns = None if columns == "*" else columns.split(",")
+        return self
+
+    def in_(self, column, values):
+        self.filters.append(('in', column, {_unquote(v) for v in values}))
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(('eq', column, value))
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(('gt', column, value))
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(('gte', column, value))
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(('lt', column, value))
+        return self
+
+    def order(self, column, **kwargs):
+        self.order_by = column
+        return self
+
+    def limit(self, n):
+        self.limit_n = n
+        return self
+
+    def range(self, start, end):
+        self.row_range = (start, end)
+        return self
+
+    def insert(self, rows, **kwargs):
+        self.payload = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def _candidates(self, table):
+        for op, column, value in self.filters:
+            if op == 'in' and column == 'farmer_id':
+                return [row for farmer_id in value for row in table.by_farmer.get(farmer_id, ())]
+        for op, column, value in self.filters:
+            if op in ('gt', 'gte') and column == table.sorted_by:
+                bisect_at = bisect.bisect_right if op == 'gt' else bisect.bisect_left
+                start = bisect_at(table.sort_keys, value)
+                # keyset paging (farmer_registry): only the next page is needed
+                if self.limit_n is not None and all(f[1] == table.sorted_by for f in self.filters):
+                    return table.rows[start:start + self.limit_n]
+                return table.rows[start:]
+        return table.rows
+
+    def execute(self):
+        self.client._round_trip()
+        return self._run()
+
+    def _run(self):
+        with self.client.lock:
+            table = self.client.tables.setdefault(self.table_name, _Table())
+            if self.payload is not None:
+                table.extend(dict(row) for row in self.payload)
+                return _Response([])
+            rows = self._candidates(table)
+            for op, column, value in self.filters:
+                if op == 'in':
+                    rows = [r for r in rows if str(r.get(column)) in value]
+                elif op == 'eq':
+                    rows = [r for r in rows if r.get(column) == value]
+                elif op == 'gt':
+                    rows = [r for r in rows if r.get(column) is not None and r[column] > value]
+                elif op == 'gte':
+                    rows = [r for r in rows if r.get(column) is not None and r[column] >= value]
+                elif op == 'lt':
+                    rows = [r for r in rows if r.get(column) is not None and r[column] < value]
+            if self.order_by and self.order_by != table.sorted_by:
+                rows = sorted(rows, key=lambda r: r[self.order_by])
+            if self.row_range:
+                rows = rows[self.row_range[0]:self.row_range[1] + 1]
+            if self.limit_n is not None:
+                rows = rows[:self.limit_n]
+            if self.columns:
+                rows = [{c: r.get(c) for c in self.columns} for r in rows]
+            else:
+                rows = [dict(r) for r in rows]
+            return _Response(rows)
+
+
+def _in_values(value):
+    # ("a","b",c) -> ['"a"', '"b"', 'c']; _Query.in_ unquotes them
+    return re.findall(r'"(?:[^"\\]|\\.)*"|[^,]+', value[1:-1])
+
+
+def _query_from_request(client, request):
+    query = _Query(client, request.url.path.rsplit("/", 1)[-1])
+    offset = 0
+    for column, value in request.url.params.multi_items():
+        if column == "select":
+            query.select(value)
+        elif column == "order":
+            query.order(value)
+        elif column == "limit":
+            query.limit(int(value))
+        elif column == "offset":
+            offset = int(value)
+        else:
+            op, _, operand = value.partition(".")
+            if op == "in":
+                query.in_(column, _in_values(operand))
+            else:
+                getattr(query, op)(column, operand)
+    if offset:
+        # limit/offset paging maps onto the row range
+        query.row_range = (offset, offset + (query.limit_n or 10 ** 9) - 1)
+        query.limit_n = None
+    return query
+
+
+class _Rpc:
+    def __init__(self, client, name, params):
+        self.client = client
+        self.name = name
+        self.params = params or {}
+
+    def execute(self):
+        self.client._round_trip()
+        return self._run()
+
+    def _run(self):
+        with self.client.lock:
+            return _Response(getattr(self.client, "_rpc_" + self.name)(**self.params))
+
+
+class FakeSupabase:
+    def __init__(self, farmers, latency=0.0):
+        self.latency = latency
+        self.lock = threading.RLock()
+        self.requests = 0
+        farmer_rows = farmers[['farmer_id', 'updated_at']].to_dict(orient="records")
+        self.max_quota = dict(zip(farmers['farmer_id'], farmers['area_ha'] * QUOTA_PER_HA))
+        self.tables = {
+            'farmers': _Table(farmer_rows, sorted_by='farmer_id'),
+            'traceability': _Table(),
+            'approvals': _Table(),
+            'quota_view': _Table()
+        }
+        self._rpc_refresh_quota_view()
+
+    def _round_trip(self):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def table(self, name):
+        return _Query(self, name)
+
+    def rpc(self, name, params=None):
+        return _Rpc(self, name, params)
+
+    def transport(self):
+        """``httpx.MockTransport`` answering async_rest's /rest/v1 requests from these tables."""
+        async def handle(request):
+            self.requests += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            path = request.url.path.removeprefix("/rest/v1")
+            if path.startswith("/rpc/"):
+                params = json.loads(request.content or b"{}")
+                with self.lock:
+                    return httpx.Response(200, json=getattr(self, "_rpc_" + path[len("/rpc/"):])(**params))
+            query = _query_from_request(self, request)
+            if request.method == "POST":
+                query.insert(json.loads(request.content))
+            elif request.method == "HEAD":
+                query.select("farmer_id")
+                total = len(query._run().data)
+                return httpx.Response(200, headers={"Content-Range": f"*/{total}"})
+            return httpx.Response(201 if request.method == "POST" else 200, json=query._run().data)
+        return httpx.MockTransport(handle)
+
+    def _rpc_refresh_quota_view(self):
+        totals = defaultdict(float)
+        for row in self.tables['traceability'].rows:
+            totals[row['farmer_id']] += float(row.get('net_weight_kg') or 0)
+        self.tables['quota_view'].replace_rows(
+            {'farmer_id': farmer_id, 'max_quota_kg': max_quota, 'total_net_weight_kg': totals.get(farmer_id, 0.0)}
+            for farmer_id, max_quota in self.max_quota.items()
+        )
+
+    def _delete_keys(self, keys):
+        table = self.tables['traceability']
+        kept = [r for r in table.rows if tuple(str(r[c]) for c in TRACEABILITY_KEY) not in keys]
+        deleted = len(table.rows) - len(kept)
+        table.replace_rows(kept)
+        return deleted
+
+    def _rpc_replace_delivery(self, rows):
+        self._delete_keys({tuple(str(r[c]) for c in TRACEABILITY_KEY) for r in rows})
+        self.tables['traceability'].extend(dict(r) for r in rows)
+        return len(rows)
+
+    def _rpc_delete_delivery(self, lots):
+        return self._delete_keys({
+            (lot['exporter'], lot['export_lot'], farmer_id) for lot in lots for farmer_id in lot['farmer_ids']
+        })
@@ -0,0 +1,79 @@
+"""Measure the cost of an idle rerun of the Streamlit page.
+
+    python -m benchmarks.rerun                    # 30 reruns, fails above the budget
+    python -m benchmarks.rerun --reruns 100 --budget-ms 150
+
+Runs main.py through Streamlit's AppTest against the in-process Supabase
+stand-in with no file uploaded: the first run pays for imports, registry
+sync and logo downscaling, later runs are what every widget interaction
+costs. Reports the "rerun" stage main.py records itself (script start up to
+file handling) and the AppTest wall time, and exits non-zero when the p95
+of the stage is over the budget.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _p95(values):
+    return statistics.quantiles(values, n=20)[-1] if len(values) > 1 else values[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reruns", type=int, default=30, help="warm reruns after the first run")
+    parser.add_argument("--farmers", type=int, default=10_000, help="size of the synthetic farmer registry")
+    parser.add_argument("--budget-ms", type=float, help="p95 budget (default: instrumentation.RERUN_BUDGET_MS)")
+    args = parser.parse_args(argv)
+
+    # caches/metrics of the app go to a scratch directory, read at import time
+    os.environ["CLOUDIA_CACHE_DIR"] = tempfile.mkdtemp(prefix="cloudia-bench-")
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)  # logos are opened relative to the app directory
+    import supabase as supabase_pkg
+    from streamlit.testing.v1 import AppTest
+
+    import async_rest
+    import instrumentation
+    from benchmarks.fake_supabase import FakeSupabase
+    from benchmarks.synthetic import make_registry
+
+    fake = FakeSupabase(make_registry(args.farmers))
+    # connections.py looks create_client up when first imported, during the first run
+    supabase_pkg.create_client = lambda url, key: fake
+    async_client = async_rest.AsyncRest
+    async_rest.AsyncRest = lambda url, key, **kwargs: async_client(url, key, transport=fake.transport(), **kwargs)
+    budget = args.budget_ms or instrumentation.RERUN_BUDGET_MS
+
+    app = AppTest.from_file(os.path.join(ROOT, "main.py"), default_timeout=120)
+    app.secrets["supabase"] = {"url": "http://localhost", "key": "benchmark"}
+    wall = []
+    for _ in range(args.reruns + 1):
+        started = time.perf_counter()
+        app.run()
+        wall.append((time.perf_counter() - started) * 1000)
+        if app.exception:
+            print(f"main.py raised: {app.exception[0].value}", file=sys.stderr)
+            return 2
+
+    timings = instrumentation.recent_timings(run_id=None)
+    stage_ms = timings.loc[timings["stage"] == "rerun", "duration_ms"].iloc[::-1].tolist()
+    first, warm = stage_ms[0], stage_ms[1:]
+    p95 = _p95(warm)
+    print(f"first run: {first:.1f} ms in script, {wall[0]:.1f} ms wall")
+    print(f"{len(warm)} warm reruns: p50 {statistics.median(warm):.1f} ms, p95 {p95:.1f} ms in script; "
+          f"p50 {statistics.median(wall[1:]):.1f} ms wall (incl. AppTest)")
+    if p95 > budget:
+        print(f"p95 {p95:.1f} ms is over the {budget:.0f} ms budget")
+        return 1
+    print(f"within the {budget:.0f} ms budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""Benchmark the delivery verification pipeline on synthetic data.
+
+    python -m benchmarks.run                      # 1k, 10k, 100k and 1M rows
+    python -m benchmarks.run --sizes 1000 10000 --latency-ms 20
+    python -m benchmarks.run --format csv         # or parquet
+
+Each size runs in a fresh process against the in-process Supabase stand-in
+(benchmarks/fake_supabase.py; reads go over async_rest like in the app):
+registry sync, file parse, dedupe, farmer lookup, quota read, verification
+and the batched write. Per-stage seconds, throughput and peak RSS are
+printed, saved under benchmarks/results/ and compared with the previous
+saved run.
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT, "benchmarks", ".data")
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+# A stage (or the total) this much slower than the previous run is flagged.
+REGRESSION_THRESHOLD = 0.10
+
+
+def _rss_mb():
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_size(path, rows, params):
+    """Run the pipeline once on ``path``; executed in its own process so peak RSS is per size."""
+    # local_cache reads CLOUDIA_CACHE_DIR at import time
+    os.environ["CLOUDIA_CACHE_DIR"] = tempfile.mkdtemp(prefix="cloudia-bench-")
+    sys.path.insert(0, ROOT)
+    import async_rest
+    import farmer_registry
+    import quota
+    import verification
+    from benchmarks.fake_supabase import FakeSupabase
+    from benchmarks.synthetic import make_registry
+    from bulk_writer import insert_in_batches
+    from delivery_reader import normalize_for_insert, read_delivery, to_records
+
+    farmers = make_registry(params["farmers"], seed=params["seed"])
+    supabase = FakeSupabase(farmers, latency=params["latency_ms"] / 1000)
+    # reads go through the async client the app uses (main.py/connections.py)
+    rest = async_rest.AsyncRest("http://benchmark", "benchmark", transport=supabase.transport())
+    setup_rss = _rss_mb()
+    stages = {}
+
+    @contextmanager
+    def timed(name):
+        started = time.perf_counter()
+        yield
+        stages[name] = round(time.perf_counter() - started, 4)
+
+    started = time.perf_counter()
+    with timed("registry_load"):
+        known_farmer_ids = frozenset(farmer_registry.load_registry(supabase, ttl_seconds=3600, force=True, rest=rest)['farmer_id'])
+    with timed("parse"):
+        uploaded_df = read_delivery(path)
+    with timed("prepare"):
+        uploaded_df = verification.prepare_delivery(uploaded_df)
+    with timed("farmer_lookup"):
+        unknown = verification.find_unknown_farmers(uploaded_df, known_farmer_ids)
+
+    status, reasons = "rejected", ["unknown_farmers"]
+    if unknown.size == 0:
+        with timed("quota_read"):
+            quota_rows, replaced_kg = rest.run(quota.fetch_delivery_quota_async(rest, uploaded_df))
+        with timed("verify"):
+            verdict = verification.verify(uploaded_df, known_farmer_ids, quota_rows, replaced_kg)
+        status, reasons = verdict["status"], [reason["code"] for reason in verdict["reasons"]]
+        if status == "approved":
+            with timed("write"):
+                insert_in_batches(supabase, "traceability", to_records(normalize_for_insert(uploaded_df)))
+            with timed("quota_refresh"):
+                supabase.rpc("refresh_quota_view").execute()
+    total = time.perf_counter() - started
+    rest.close()
+
+    return {
+        "rows": rows,
+        "rows_after_dedupe": int(len(uploaded_df)),
+        "status": status,
+        "reasons": reasons,
+        "stages": stages,
+        "total_s": round(total, 4),
+        "rows_per_s": round(rows / total, 1),
+        "requests": supabase.requests,
+        "setup_rss_mb": setup_rss,
+        "peak_rss_mb": _rss_mb()
+    }
+
+
+def _git_version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _previous_results(file_format):
+    # latest saved run of the same file format; parse times are not comparable across formats
+    for path in sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json")), reverse=True):
+        with open(path) as f:
+            saved = json.load(f)
+        if saved["params"].get("format", "xlsx") == file_format:
+            return path, saved
+    return None, None
+
+
+def _print_result(result, baseline):
+    def delta(new, old):
+        if not old:
+            return ""
+        change = (new - old) / old
+        flag = "  <-- slower" if change > REGRESSION_THRESHOLD else ""
+        return f" ({change:+.0%}{flag})"
+
+    status = result['status'] if not result['reasons'] else f"{result['status']}: {', '.join(result['reasons'])}"
+    print(f"\n{result['rows']:,} rows ({status}): {result['total_s']:.2f}s total"
+          f"{delta(result['total_s'], baseline and baseline['total_s'])}, "
+          f"{result['rows_per_s']:,.0f} rows/s, peak RSS {result['peak_rss_mb']} MB"
+          f"{delta(result['peak_rss_mb'], baseline and baseline['peak_rss_mb'])}, {result['requests']} requests")
+    for name, seconds in result["stages"].items():
+        old = baseline and baseline["stages"].get(name)
+        print(f"  {name:<15} {seconds:>9.3f}s{delta(seconds, old)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="delivery sizes in rows")
+    parser.add_argument("--farmers", type=int, default=300_000, help="size of the synthetic farmer registry")
+    parser.add_argument("--format", default="xlsx", choices=["xlsx", "csv", "parquet"], help="delivery file format")
+    parser.add_argument("--rows-per-lot", type=int, default=100)
+    parser.add_argument("--exporters", type=int, default=3)
+    parser.add_argument("--duplicate-rate", type=float, default=0.01, help="share of exact duplicate rows")
+    parser.add_argument("--unknown-rate", type=float, default=0.0, help="share of rows with unregistered farmers")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated round-trip per request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", help="results file to compare with (default: the latest saved run)")
+    parser.add_argument("--no-save", action="store_true", help="do not write a results file")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, ROOT)
+    from benchmarks.synthetic import cached_delivery, make_registry
+
+    params = {
+        "format": args.format, "farmers": args.farmers, "rows_per_lot": args.rows_per_lot, "exporters": args.exporters,
+        "duplicate_rate": args.duplicate_rate, "unknown_rate": args.unknown_rate,
+        "latency_ms": args.latency_ms, "seed": args.seed
+    }
+    farmers = make_registry(args.farmers, seed=args.seed)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline_path, baseline = args.baseline, json.load(f)
+    else:
+        baseline_path, baseline = _previous_results(args.format)
+    baseline_by_rows = {r["rows"]: r for r in baseline["results"]} if baseline else {}
+    if baseline_path:
+        print(f"comparing with {os.path.relpath(baseline_path, ROOT)} ({baseline['version']})")
+
+    results = []
+    # spawn: every size starts from an empty process, so peak RSS is not carried over
+    context = multiprocessing.get_context("spawn")
+    for rows in args.sizes:
+        print(f"generating {rows:,}-row {args.format} delivery...", file=sys.stderr)
+        path = cached_delivery(DATA_DIR, farmers, rows, args.format, rows_per_lot=args.rows_per_lot, exporters=args.exporters,
+                               duplicate_rate=args.duplicate_rate, unknown_rate=args.unknown_rate, seed=args.seed)
+        with context.Pool(1) as pool:
+            result = pool.apply(run_size, (path, rows, params))
+        results.append(result)
+        _print_result(result, baseline_by_rows.get(rows))
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        version = _git_version()
+        path = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{version}.json")
+        with open(path, "w") as f:
+            json.dump({
+                "version": version,
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "params": params,
+                "results": results
+            }, f, indent=2)
+        print(f"\nsaved {os.path.relpath(path, ROOT)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""Seeded generators for benchmark inputs: a farmer registry and delivery files."""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+# Header row exactly as exporters send it (delivery_reader lowercases it).
+DELIVERY_HEADERS = ['Cooperative Name', 'Export Lot N°/Connaissement', 'Date of purchase from cooperative',
+                    'Certification', 'Farmer_ID', 'farm_id', 'Net Weight (kg)', 'Exporter']
+CERTIFICATIONS = ['RA', 'Fairtrade', 'Organic', 'N/A', None]
+QUOTA_PER_HA = 800
+
+
+def make_registry(n_farmers, seed=0):
+    """Farmers with hectares (quota = area_ha * QUOTA_PER_HA) and a change-tracking timestamp.
+
+    Areas are generous so that the default deliveries stay within quota and
+    every stage, including the write, is exercised.
+    """
+    rng = np.random.default_rng(seed)
+    farmer_ids = np.char.add('bf', np.char.zfill(np.arange(n_farmers).astype(str), 7))
+    area_ha = rng.uniform(10, 40, n_farmers).round(2)
+    updated_at = pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, 365, n_farmers), unit='D')
+    farmers = pd.DataFrame({
+        'farmer_id': farmer_ids,
+        'area_ha': area_ha,
+        'updated_at': updated_at.strftime('%Y-%m-%dT%H:%M:%S')
+    })
+    return farmers
+
+
+def make_delivery(farmers, rows, rows_per_lot=100, exporters=3, duplicate_rate=0.01, unknown_rate=0.0, seed=0):
+    """A delivery frame with the workbook headers.
+
+    ``duplicate_rate`` of the rows are exact repeats of other rows (removed by
+    the dedupe step); ``unknown_rate`` of them use farmer IDs missing from
+    the registry (the file is then rejected, as in the app).
+    """
+    rng = np.random.default_rng(seed)
+    n_unique = max(1, rows - int(rows * duplicate_rate))
+    n_lots = max(1, n_unique // rows_per_lot)
+    lot = rng.integers(0, n_lots, n_unique)
+    exporter = lot % exporters
+    # each lot draws its farmers from a small pool, like a real cooperative
+    farmer_pool = min(len(farmers), max(rows // 4, 1))
+    farmer_ids = farmers['farmer_id'].to_numpy()[rng.integers(0, farmer_pool, n_unique)].astype(object)
+    unknown = rng.random(n_unique) < unknown_rate
+    farmer_ids[unknown] = np.char.add('unknown', rng.integers(0, 10**6, unknown.sum()).astype(str))
+
+    delivery = pd.DataFrame({
+        'Cooperative Name': np.char.add('COOP ', (lot % 40).astype(str)),
+        'Export Lot N°/Connaissement': np.char.add('LOT-', lot.astype(str)),
+        # Excel serial dates, as most files store them
+        'Date of purchase from cooperative': 45292 + rng.integers(0, 300, n_unique),
+        'Certification': rng.choice(np.array(CERTIFICATIONS, dtype=object), n_unique),
+        'Farmer_ID': [f.upper() for f in farmer_ids],
+        'farm_id': np.char.add('FM', rng.integers(0, 10**6, n_unique).astype(str)),
+        'Net Weight (kg)': rng.integers(200, 600, n_unique),
+        'Exporter': np.char.add('EXPORTER ', exporter.astype(str))
+    })
+    if rows > n_unique:
+        repeats = delivery.iloc[rng.integers(0, n_unique, rows - n_unique)]
+        delivery = pd.concat([delivery, repeats], ignore_index=True)
+    return delivery.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def write_workbook(delivery, path):
+    # write-only mode streams rows; a 1M-row file would not fit comfortably otherwise
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(DELIVERY_HEADERS)
+    for row in delivery[DELIVERY_HEADERS].itertuples(index=False, name=None):
+        ws.append([None if isinstance(v, float) and np.isnan(v) else v for v in row])
+    wb.save(path)
+
+
+def write_delivery(delivery, path, file_format):
+    if file_format == "xlsx":
+        write_workbook(delivery, path)
+    elif file_format == "csv":
+        delivery[DELIVERY_HEADERS].to_csv(path, index=False)
+    elif file_format == "parquet":
+        delivery[DELIVERY_HEADERS].to_parquet(path, index=False)
+    else:
+        raise ValueError(f"unknown format {file_format!r}")
+
+
+def cached_delivery(data_dir, farmers, rows, file_format="xlsx", **params):
+    """Generate the delivery file once per parameter set and reuse it on later runs."""
+    key = hashlib.sha1(json.dumps(dict(params, rows=rows, farmers=len(farmers)), sort_keys=True).encode()).hexdigest()[:10]
+    path = os.path.join(data_dir, f"delivery_{rows}_{key}.{file_format}")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        tmp = path + ".tmp"
+        write_delivery(make_delivery(farmers, rows, **params), tmp, file_format)
+        os.replace(tmp, path)
+    return path
@@ -0,0 +1,149 @@
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import httpx
+
+BATCH_MAX_ROWS = 2000
+BATCH_MAX_BYTES = 1_500_000  # well under the PostgREST/gateway request body limit
+MAX_WORKERS = 4
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+
+# 408/429/5xx from the gateway plus Postgres statement timeout,
+# serialization failure and deadlock are worth retrying.
+TRANSIENT_CODES = {"408", "429", "500", "502", "503", "504", "57014", "40001", "40P01"}
+TRANSIENT_MESSAGES = ("timeout", "timed out", "temporarily", "too many requests", "connection reset",
+                      "server disconnected", "bad gateway", "service unavailable")
+# Failures that prove the write never committed: the gateway turned the
+# request away, or Postgres aborted (rolled back) its transaction.
+NOT_COMMITTED_CODES = {"429", "503", "57014", "40001", "40P01"}
+# Gateway answers that can arrive after PostgREST already committed.
+LOST_RESPONSE_CODES = {"502", "504"}
+
+
+def split_batches(records, max_rows=BATCH_MAX_ROWS, max_bytes=BATCH_MAX_BYTES):
+    """Split records into batches bounded both by row count and by JSON payload size."""
+    batches = []
+    current = []
+    current_bytes = 2  # "[]"
+    for record in records:
+        record_bytes = len(json.dumps(record, default=str)) + 1
+        if current and (len(current) >= max_rows or current_bytes + record_bytes > max_bytes):
+            batches.append(current)
+            current = []
+            current_bytes = 2
+        current.append(record)
+        current_bytes += record_bytes
+    if current:
+        batches.append(current)
+    return batches
+
+
+def is_transient_error(exc):
+    if isinstance(exc, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)):
+        return True
+    if str(getattr(exc, "code", "") or "") in TRANSIENT_CODES:
+        return True
+    message = str(exc).lower()
+    return any(token in message for token in TRANSIENT_MESSAGES)
+
+
+def is_retry_safe_error(exc):
+    """Transient failure after which the write certainly did not commit.
+
+    Only these are retried for plain inserts: a read timeout or a dropped
+    connection can come after PostgREST committed the batch, and sending it
+    again would duplicate the rows.
+    """
+    if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    return str(getattr(exc, "code", "") or "") in NOT_COMMITTED_CODES
+
+
+def may_have_committed(exc):
+    """Whether a failed write may still have been applied (its response was lost, it was not rejected)."""
+    if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return False
+    if isinstance(exc, httpx.TransportError):
+        return True
+    return str(getattr(exc, "code", "") or "") in LOST_RESPONSE_CODES
+
+
+def _send_batch(send, batch, max_attempts, idempotent):
+    should_retry = is_transient_error if idempotent else is_retry_safe_error
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            send(batch)
+            return attempt, None
+        except Exception as e:
+            if attempt >= max_attempts or not should_retry(e):
+                return attempt, e
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+            time.sleep(delay * random.uniform(0.5, 1.0))
+
+
+def run_batches(send, batches, previous_results=None, max_workers=MAX_WORKERS,
+                max_attempts=MAX_ATTEMPTS, on_progress=None, on_result=None, idempotent=True):
+    """Send batches over a bounded thread pool, retrying transient errors.
+
+    ``send(batch)`` performs one write. Returns one result dict per batch
+    (``batch``, ``rows``, ``status``, ``attempts``, ``error``), ordered by
+    batch index. Passing the results of an earlier run as
+    ``previous_results`` resumes it: batches already marked ``ok`` are not
+    sent again. ``on_progress(done, total)`` and ``on_result(result)`` are
+    called from the calling thread after each batch finishes.
+
+    With ``idempotent=False`` (plain inserts) a batch is only retried when
+    the failure proves it was not written, and a batch whose response was
+    lost gets status ``unknown`` instead of ``failed``: it may be in the
+    table, so resending it alone could duplicate its rows.
+    """
+    results = {}
+    if previous_results:
+        results = {r["batch"]: r for r in previous_results if r["status"] == "ok"}
+    pending = [i for i in range(len(batches)) if i not in results]
+
+    total = len(batches)
+    done = len(results)
+    if on_progress:
+        on_progress(done, total)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(_send_batch, send, batches[i], max_attempts, idempotent): i for i in pending}
+        for future in as_completed(futures):
+            i = futures[future]
+            attempts, error = future.result()
+            if error is None:
+                status = "ok"
+            elif not idempotent and may_have_committed(error):
+                status = "unknown"
+            else:
+                status = "failed"
+            results[i] = {
+                "batch": i,
+                "rows": len(batches[i]),
+                "status": status,
+                "attempts": attempts,
+                "error": None if error is None else str(error),
+            }
+            done += 1
+            if on_result:
+                on_result(results[i])
+            if on_progress:
+                on_progress(done, total)
+
+    return [results[i] for i in range(total)]
+
+
+def insert_in_batches(supabase, table, records, **kwargs):
+    batches = split_batches(records)
+
+    def send(batch):
+        supabase.table(table).insert(batch, returning="minimal").execute()
+
+    return batches, run_batches(send, batches, idempotent=False, **kwargs)
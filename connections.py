@@ -0,0 +1,38 @@
+import streamlit as st
+from supabase import create_client, Client
+
+import async_rest
+import pg_backend
+
+# Klienci współdzieleni przez wszystkie strony aplikacji (main.py, pages/),
+# tworzeni raz na proces.
+
+
+@st.cache_resource
+def get_supabase() -> Client:
+    url = st.secrets["supabase"]["url"]
+    key = st.secrets["supabase"]["key"]
+    return create_client(url, key)
+
+
+@st.cache_resource
+def get_pg_engine():
+    # opcjonalnie: bezpośrednie połączenie z Postgresem ([postgres] url w secrets), inaczej REST
+    try:
+        url = st.secrets["postgres"]["url"]
+    except (KeyError, FileNotFoundError):
+        return None
+    return pg_backend.make_engine(url)
+
+
+@st.cache_resource
+def get_async_rest():
+    # asynchroniczny klient /rest/v1 (async_rest.py) dla odczytów wysyłanych równolegle;
+    # limity opcjonalnie w [supabase]: max_concurrency, timeout, max_attempts
+    config = st.secrets["supabase"]
+    return async_rest.AsyncRest(
+        config["url"], config["key"],
+        max_concurrency=int(config.get("max_concurrency", async_rest.MAX_CONCURRENCY)),
+        timeout=float(config.get("timeout", async_rest.TIMEOUT_SECONDS)),
+        max_attempts=int(config.get("max_attempts", async_rest.MAX_ATTEMPTS))
+    )
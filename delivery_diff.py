@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+# Row-level diff between the traceability rows already stored under a
+# delivery's (exporter, lot, farmer) keys and a corrected re-upload, so only
+# the delta is written (sql/apply_delivery_diff.sql applies it).
+
+ROW_COLUMNS = ['cooperative_name', 'export_lot', 'purchase_date', 'certification',
+               'farmer_id', 'farm_id', 'net_weight_kg', 'exporter']
+TEXT_COLUMNS = ['cooperative_name', 'export_lot', 'certification', 'farmer_id', 'farm_id', 'exporter']
+WEIGHT_DECIMALS = 3
+
+
+def _canonical(df):
+    """Comparable form of the row columns: stripped text ('' for null), ISO dates, rounded weights."""
+    out = pd.DataFrame(index=df.index)
+    for col in TEXT_COLUMNS:
+        values = df[col].astype(object)
+        out[col] = values.where(values.notna(), '').astype(str).str.strip()
+    out['farmer_id'] = out['farmer_id'].str.lower()
+    dates = df['purchase_date'].astype(object)
+    out['purchase_date'] = pd.to_datetime(dates, errors='coerce').dt.strftime('%Y-%m-%d').fillna(
+        dates.where(dates.notna(), '').astype(str)
+    )
+    out['net_weight_kg'] = pd.to_numeric(df['net_weight_kg'], errors='coerce').round(WEIGHT_DECIMALS)
+    # identical rows may legitimately repeat; number them so they pair up one to one
+    out['occurrence'] = out.groupby(ROW_COLUMNS, sort=False, dropna=False).cumcount()
+    out['position'] = np.arange(len(df))
+    return out
+
+
+def diff_delivery(existing_df, uploaded_df):
+    """Compare stored rows with the cleaned upload (both with ROW_COLUMNS).
+
+    Returns a dict with ``removed`` (positions into ``existing_df`` to
+    delete), ``added`` (positions into ``uploaded_df`` to insert), and the
+    ``changed``/``unchanged`` row counts. A changed weight is one removed
+    plus one added row under the same key.
+    """
+    old = _canonical(existing_df)
+    new = _canonical(uploaded_df)
+    merged = old.merge(new, on=ROW_COLUMNS + ['occurrence'], how='outer',
+                       suffixes=('_old', '_new'), indicator=True)
+    removed = merged[merged['_merge'] == 'left_only']
+    added = merged[merged['_merge'] == 'right_only']
+
+    # changed = same row apart from the weight
+    key_columns = [col for col in ROW_COLUMNS if col != 'net_weight_kg']
+    removed_keys = removed[key_columns].assign(n=removed.groupby(key_columns, sort=False).cumcount())
+    added_keys = added[key_columns].assign(n=added.groupby(key_columns, sort=False).cumcount())
+    changed = len(removed_keys.merge(added_keys, on=key_columns + ['n']))
+
+    return {
+        'removed': removed['position_old'].astype(int).tolist(),
+        'added': added['position_new'].astype(int).tolist(),
+        'changed': changed,
+        'unchanged': int((merged['_merge'] == 'both').sum())
+    }
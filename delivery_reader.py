@@ -0,0 +1,267 @@
+import csv
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from openpyxl import load_workbook
+
+EXPECTED_COLUMNS = ['cooperative name', 'export lot n°/connaissement', 'date of purchase from cooperative',
+                    'certification', 'farmer_id', 'farm_id', 'net weight (kg)', 'exporter']
+
+COLUMN_RENAMES = {
+    'export lot n°/connaissement': 'export_lot',
+    'net weight (kg)': 'net_weight_kg',
+    'date of purchase from cooperative': 'purchase_date'
+}
+
+# ERP exports often use the database column names directly.
+HEADER_ALIASES = {renamed: original for original, renamed in COLUMN_RENAMES.items()}
+HEADER_ALIASES['cooperative_name'] = 'cooperative name'
+
+CHUNK_ROWS = 50_000
+
+SUPPORTED_EXTENSIONS = ['xlsx', 'csv', 'parquet']
+XLSX_MAGIC = b'PK\x03\x04'  # xlsx is a zip container
+PARQUET_MAGIC = b'PAR1'
+CSV_DELIMITERS = [',', ';', '\t', '|']
+
+# Repeated across many rows of a delivery, so stored as categoricals.
+CATEGORICAL_COLUMNS = ['farmer_id', 'exporter', 'export_lot', 'cooperative name']
+
+
+# Reader column names -> traceability column names.
+DB_COLUMN_RENAMES = {'cooperative name': 'cooperative_name'}
+REQUIRED_DB_COLUMNS = ['export_lot', 'exporter', 'farmer_id', 'net_weight_kg']
+NA_TOKENS = ['N/A', 'n/a', 'na', 'NA', 'NaN', 'nan', '', 'None']
+EXCEL_EPOCH = pd.Timestamp('1899-12-30')
+
+
+class MissingColumnsError(ValueError):
+    def __init__(self, missing):
+        super().__init__(f"Missing columns: {', '.join(missing)}")
+        self.missing = missing
+
+
+class UnsupportedFormatError(ValueError):
+    pass
+
+
+def _normalize_header(value):
+    header = str(value).strip().lower() if value is not None else ""
+    return HEADER_ALIASES.get(header, header)
+
+
+def _check_headers(headers):
+    missing = [col for col in EXPECTED_COLUMNS if col not in headers]
+    if missing:
+        raise MissingColumnsError(missing)
+
+
+def _typed_chunk(rows):
+    chunk = pd.DataFrame(rows, columns=EXPECTED_COLUMNS).rename(columns=COLUMN_RENAMES)
+    chunk['farmer_id'] = chunk['farmer_id'].astype(str).str.strip().str.lower()
+    chunk['net_weight_kg'] = pd.to_numeric(chunk['net_weight_kg'], errors='coerce')
+    exporter = chunk['exporter']
+    chunk['exporter'] = exporter.where(exporter.isna(), exporter.astype(str).str.strip())
+    return chunk
+
+
+def iter_excel_chunks(file, chunk_rows=CHUNK_ROWS):
+    """Stream the first sheet of a delivery workbook as typed DataFrame chunks.
+
+    The workbook is opened in read-only mode and parsed once; only the
+    expected columns are kept, with headers lower-cased and ``farmer_id``
+    normalized. Raises ``MissingColumnsError`` before any rows are read if
+    the header row lacks one of ``EXPECTED_COLUMNS``.
+    """
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        headers = [_normalize_header(value) for value in next(rows, ())]
+        _check_headers(headers)
+
+        positions = [headers.index(col) for col in EXPECTED_COLUMNS]
+        width = len(headers)
+        buffer = []
+        for row in rows:
+            if len(row) < width:
+                row = row + (None,) * (width - len(row))
+            values = [row[i] for i in positions]
+            if all(value is None for value in values):
+                continue
+            buffer.append(values)
+            if len(buffer) >= chunk_rows:
+                yield _typed_chunk(buffer)
+                buffer = []
+        if buffer:
+            yield _typed_chunk(buffer)
+    finally:
+        workbook.close()
+
+
+def to_categoricals(df):
+    for col in CATEGORICAL_COLUMNS:
+        df[col] = df[col].astype('category')
+    return df
+
+
+def _concat_chunks(chunks):
+    chunks = list(chunks)
+    if not chunks:
+        return to_categoricals(_typed_chunk([]))
+    # categoricals only after concat – chunks with different categories would fall back to object
+    return to_categoricals(pd.concat(chunks, ignore_index=True))
+
+
+def read_delivery_excel(file, chunk_rows=CHUNK_ROWS):
+    return _concat_chunks(iter_excel_chunks(file, chunk_rows))
+
+
+def _rewind(file):
+    if hasattr(file, 'seek'):
+        file.seek(0)
+
+
+def _peek(file, size):
+    if hasattr(file, 'read'):
+        _rewind(file)
+        head = file.read(size)
+        _rewind(file)
+        return head
+    with open(file, 'rb') as f:
+        return f.read(size)
+
+
+def iter_csv_chunks(file, chunk_rows=CHUNK_ROWS):
+    """Stream a delivery CSV as typed DataFrame chunks, like iter_excel_chunks.
+
+    The delimiter is taken from the header line (``,``, ``;``, tab or ``|``)
+    and the encoding is UTF-8 with a cp1252 fallback for files saved by
+    Excel on Windows. Only empty cells count as missing; all values are read
+    as text, so IDs keep their leading zeros.
+    """
+    head = _peek(file, 64 * 1024)
+    try:
+        head.decode('utf-8')
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError as e:
+        # a multi-byte character cut at the 64 KiB boundary is still UTF-8
+        encoding = 'utf-8-sig' if e.start >= len(head) - 3 else 'cp1252'
+    first_line = head.decode(encoding, errors='replace').splitlines()[0] if head else ''
+    delimiter = max(CSV_DELIMITERS, key=first_line.count)
+    headers = [_normalize_header(value) for value in next(csv.reader([first_line], delimiter=delimiter), [])]
+    _check_headers(headers)
+
+    _rewind(file)
+    reader = pd.read_csv(
+        file, sep=delimiter, encoding=encoding, dtype=str, keep_default_na=False, na_values=[''],
+        usecols=lambda column: _normalize_header(column) in EXPECTED_COLUMNS, chunksize=chunk_rows
+    )
+    with reader:
+        for chunk in reader:
+            chunk.columns = [_normalize_header(column) for column in chunk.columns]
+            chunk = chunk.loc[:, ~chunk.columns.duplicated()][EXPECTED_COLUMNS].dropna(how='all')
+            # serial numbers stay numeric so they are converted like Excel dates
+            dates = chunk['date of purchase from cooperative']
+            serial = pd.to_numeric(dates, errors='coerce')
+            if serial.count() == dates.count():
+                chunk['date of purchase from cooperative'] = serial
+            else:
+                chunk['date of purchase from cooperative'] = serial.astype(object).where(serial.notna(), dates)
+            yield _typed_chunk(chunk)
+
+
+def read_delivery_csv(file, chunk_rows=CHUNK_ROWS):
+    return _concat_chunks(iter_csv_chunks(file, chunk_rows))
+
+
+def read_delivery_parquet(file):
+    """Read only the expected columns of a Parquet delivery straight into pandas."""
+    _rewind(file)
+    parquet = pq.ParquetFile(file)
+    columns = {}
+    for name in parquet.schema_arrow.names:
+        columns.setdefault(_normalize_header(name), name)
+    _check_headers(columns)
+    table = parquet.read(columns=[columns[col] for col in EXPECTED_COLUMNS])
+    df = table.rename_columns(EXPECTED_COLUMNS).to_pandas()
+    return _concat_chunks([_typed_chunk(df.dropna(how='all'))])
+
+
+def detect_format(file, name=None):
+    """``xlsx``, ``parquet`` or ``csv``, from the file's magic bytes and then its extension."""
+    magic = _peek(file, 4)
+    if magic == PARQUET_MAGIC:
+        return 'parquet'
+    if magic == XLSX_MAGIC:
+        return 'xlsx'
+    name = name or getattr(file, 'name', None) or (file if isinstance(file, (str, os.PathLike)) else '')
+    extension = os.path.splitext(str(name))[1].lower().lstrip('.')
+    if extension in ('xlsx', 'parquet'):
+        raise UnsupportedFormatError(f"{os.path.basename(str(name))} is not a valid .{extension} file")
+    if extension not in ('csv', 'txt', ''):
+        raise UnsupportedFormatError(f"Unsupported file type: .{extension}")
+    return 'csv'
+
+
+def read_delivery(file, name=None, chunk_rows=CHUNK_ROWS):
+    """Parse an .xlsx, .csv or .parquet delivery into the same canonical frame."""
+    file_format = detect_format(file, name)
+    if file_format == 'parquet':
+        return read_delivery_parquet(file)
+    _rewind(file)
+    if file_format == 'xlsx':
+        return read_delivery_excel(file, chunk_rows)
+    return read_delivery_csv(file, chunk_rows)
+
+
+def _purchase_dates(dates):
+    """Purchase dates as ``YYYY-MM-DD`` strings; Excel serial numbers are converted in one pass.
+
+    Text that is not a serial number is passed through unchanged, as before.
+    """
+    dates = dates.fillna(datetime.today().strftime('%Y-%m-%d'))
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return dates.dt.strftime('%Y-%m-%d')
+    values = dates.astype(object)
+    kinds = values.map(type)
+    serial = pd.to_numeric(values.where(kinds.isin([int, float, np.int64, np.float64])), errors='coerce')
+    stamps = pd.to_datetime(values.where(kinds.isin([datetime, pd.Timestamp])), errors='coerce')
+    converted = (EXCEL_EPOCH + pd.to_timedelta(serial, unit='D')).dt.strftime('%Y-%m-%d')
+    converted = converted.fillna(stamps.dt.strftime('%Y-%m-%d'))
+    return converted.fillna(values.astype(str))
+
+
+def normalize_for_insert(df):
+    """Map a prepared delivery to ``traceability`` columns and values in one vectorized pass.
+
+    Returns a new frame (the input is not modified): one rename, dates as
+    ``YYYY-MM-DD`` text, certification NA tokens as None. Raises
+    ``MissingColumnsError`` if a required column is absent.
+    """
+    df = df.rename(columns={**COLUMN_RENAMES, **DB_COLUMN_RENAMES})
+    missing = [col for col in REQUIRED_DB_COLUMNS if col not in df.columns]
+    if missing:
+        raise MissingColumnsError(missing)
+
+    df['purchase_date'] = _purchase_dates(df['purchase_date'])
+    certification = df['certification'].astype(object)
+    is_na = certification.isna() | certification.astype(str).isin(NA_TOKENS)
+    df['certification'] = certification.where(~is_na, None)
+    return df
+
+
+def to_records(df):
+    """Row dicts for the JSON payload, built from whole columns (no per-row pandas objects).
+
+    Values are plain Python types and missing values are None, so the
+    records serialize directly.
+    """
+    columns = []
+    for col in df.columns:
+        values = df[col].astype(object)
+        columns.append(values.where(values.notna(), None).tolist())
+    names = list(df.columns)
+    return [dict(zip(names, row)) for row in zip(*columns)]
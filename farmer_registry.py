@@ -0,0 +1,111 @@
+import os
+import time
+
+import pandas as pd
+
+from local_cache import cache_path, read_json, write_json, write_parquet
+
+# Local, on-disk snapshot of the `farmers` table. Only the columns the app
+# actually uses are kept; later syncs pull just the rows changed since the
+# stored watermark instead of paging through the whole registry again.
+SNAPSHOT_PATH = cache_path("farmers.parquet")
+META_PATH = cache_path("farmers_meta.json")
+
+FARMER_COLUMNS = ["farmer_id"]
+WATERMARK_COLUMN = "updated_at"
+PAGE_SIZE = 1000
+
+# A delta sync cannot see deleted farmers, so the snapshot is rebuilt from
+# scratch once it gets older than this.
+FULL_RESYNC_AFTER = 7 * 24 * 3600
+
+
+def _normalize(df):
+    df.columns = df.columns.str.lower()
+    df['farmer_id'] = df['farmer_id'].astype(str).str.strip().str.lower()
+    return df.drop_duplicates(subset='farmer_id', keep='last').reset_index(drop=True)
+
+
+def _fetch_rows(supabase, columns, since=None):
+    all_rows = []
+    last_farmer_id = None
+    while True:
+        query = supabase.table("farmers").select(",".join(columns)).limit(PAGE_SIZE).order("farmer_id")
+        if since is not None:
+            query = query.gte(WATERMARK_COLUMN, since)
+        if last_farmer_id:
+            query = query.gt("farmer_id", last_farmer_id)
+        rows = query.execute().data
+        if not rows:
+            break
+        all_rows.extend(rows)
+        last_farmer_id = rows[-1]["farmer_id"]
+    return all_rows
+
+
+def _watermark(df):
+    if WATERMARK_COLUMN not in df.columns or df[WATERMARK_COLUMN].isna().all():
+        return None
+    return str(df[WATERMARK_COLUMN].dropna().max())
+
+
+def _write_snapshot(df, meta):
+    # Both files are replaced atomically, so concurrent workers never read a torn snapshot.
+    write_parquet(SNAPSHOT_PATH, df)
+    write_json(META_PATH, meta)
+
+
+def _fetch_all_pages(rest, columns):
+    # farmer_id ranges fetched at once over the async client; each range is keyset-paged,
+    # so farmers added or removed meanwhile cannot shift a page and drop someone
+    return rest.run(rest.select_ranges("farmers", columns, key="farmer_id", page_size=PAGE_SIZE))
+
+
+def full_sync(supabase, rest=None):
+    fetch = (lambda columns: _fetch_all_pages(rest, columns)) if rest is not None \
+        else (lambda columns: _fetch_rows(supabase, columns))
+    try:
+        rows = fetch(FARMER_COLUMNS + [WATERMARK_COLUMN])
+    except Exception:
+        # Registry without a change-tracking column: snapshot still saves the
+        # cold-start scan, but every sync has to be a full one.
+        rows = fetch(FARMER_COLUMNS)
+    df = _normalize(pd.DataFrame(rows) if rows else pd.DataFrame(columns=FARMER_COLUMNS))
+    now = time.time()
+    meta = {"watermark": _watermark(df), "synced_at": now, "full_synced_at": now}
+    _write_snapshot(df, meta)
+    return df
+
+
+def delta_sync(supabase, df, meta):
+    rows = _fetch_rows(supabase, FARMER_COLUMNS + [WATERMARK_COLUMN], since=meta["watermark"])
+    if rows:
+        df = _normalize(pd.concat([df, pd.DataFrame(rows)], ignore_index=True))
+    meta = dict(meta, synced_at=time.time(), watermark=_watermark(df) or meta["watermark"])
+    _write_snapshot(df, meta)
+    return df
+
+
+def load_registry(supabase, ttl_seconds, force=False, rest=None):
+    """Return the farmers registry, syncing the local snapshot when it is stale.
+
+    A snapshot younger than ``ttl_seconds`` is used as-is; an older one is
+    topped up with a delta query. ``force=True`` rebuilds it from scratch.
+    With an ``async_rest.AsyncRest`` client as ``rest``, full rebuilds fetch
+    their pages concurrently instead of walking the keyset one page at a time.
+    """
+    meta = read_json(META_PATH)
+    if force or meta is None or not os.path.exists(SNAPSHOT_PATH):
+        return full_sync(supabase, rest)
+
+    try:
+        df = pd.read_parquet(SNAPSHOT_PATH)
+    except Exception:
+        return full_sync(supabase, rest)
+
+    now = time.time()
+    if now - meta.get("synced_at", 0) < ttl_seconds:
+        return df
+    if meta.get("watermark") is None or now - meta.get("full_synced_at", 0) > FULL_RESYNC_AFTER:
+        return full_sync(supabase, rest)
+    return delta_sync(supabase, df, meta)
@@ -0,0 +1,204 @@
+import json
+import sqlite3
+import time
+import zlib
+from contextlib import closing
+
+from local_cache import cache_path, connect_sqlite
+
+JOURNAL_DB_PATH = cache_path("imports.sqlite3")
+
+# A 'running' import not touched for this long belongs to a dead worker.
+STALE_AFTER = 120
+# Finished imports keep their summary row; payloads are dropped.
+KEEP_FINISHED = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS imports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_hash TEXT NOT NULL,
+    exporter TEXT,
+    label TEXT,
+    status TEXT NOT NULL DEFAULT 'running',
+    lots TEXT NOT NULL,
+    previous_rows BLOB,
+    lots_deleted INTEGER NOT NULL DEFAULT 0,
+    total_batches INTEGER NOT NULL,
+    total_rows INTEGER NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS imports_file_hash ON imports (file_hash, exporter);
+CREATE TABLE IF NOT EXISTS import_batches (
+    import_id INTEGER NOT NULL,
+    batch INTEGER NOT NULL,
+    rows INTEGER NOT NULL,
+    payload BLOB,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    PRIMARY KEY (import_id, batch)
+);
+"""
+
+
+def _pack(value):
+    return zlib.compress(json.dumps(value, default=str).encode(), 1)
+
+
+def _unpack(blob):
+    return json.loads(zlib.decompress(blob))
+
+
+class ImportJournal:
+    """Write-ahead journal for batched (non-transactional) imports.
+
+    Before anything is written, ``begin`` stores the delivery's lot keys,
+    the rows about to be replaced and the normalized insert batches. The
+    writer then records the lot delete and every batch result as they
+    happen, so an import interrupted by a failed request or a dead worker
+    can be resumed from the batches still missing, or rolled back to the
+    previous rows, without re-parsing the file.
+    """
+
+    def __init__(self, path=JOURNAL_DB_PATH):
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = connect_sqlite(self.path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def begin(self, file_hash, exporter, lots, batches, previous_rows=None, label=None):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            import_id = conn.execute(
+                "INSERT INTO imports (file_hash, exporter, label, lots, previous_rows, total_batches, total_rows, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (file_hash, exporter, label, json.dumps(lots), None if previous_rows is None else _pack(previous_rows),
+                 len(batches), sum(len(batch) for batch in batches), now, now)
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO import_batches (import_id, batch, rows, payload) VALUES (?, ?, ?, ?)",
+                ((import_id, i, len(batch), _pack(batch)) for i, batch in enumerate(batches))
+            )
+            conn.execute("COMMIT")
+            return import_id
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def get(self, import_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT id, file_hash, exporter, label, status, lots, lots_deleted, total_batches, total_rows, "
+                "last_error, created_at, updated_at, previous_rows IS NOT NULL AS has_previous_rows "
+                "FROM imports WHERE id = ?", (import_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        entry = dict(row)
+        entry["lots"] = json.loads(entry["lots"])
+        return entry
+
+    def find_unfinished(self, file_hash, exporter):
+        """The latest failed or abandoned import of this file and exporter, if any."""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT id FROM imports WHERE file_hash = ? AND exporter IS ? "
+                "AND (status = 'failed' OR (status = 'running' AND updated_at < ?)) ORDER BY id DESC LIMIT 1",
+                (file_hash, exporter, time.time() - STALE_AFTER)
+            ).fetchone()
+        return None if row is None else self.get(row["id"])
+
+    def unfinished(self, limit=20):
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT i.id, i.label, i.exporter, i.status, i.total_batches, i.total_rows, i.last_error, i.updated_at, "
+                "(SELECT count(*) FROM import_batches b WHERE b.import_id = i.id AND b.status = 'ok') AS committed_batches "
+                "FROM imports i WHERE i.status = 'failed' OR (i.status = 'running' AND i.updated_at < ?) "
+                "ORDER BY i.id DESC LIMIT ?", (time.time() - STALE_AFTER, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def claim(self, import_id):
+        """Mark an unfinished import as running again; False if another worker holds it or it is finished."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            claimed = conn.execute(
+                "UPDATE imports SET status = 'running', updated_at = ? WHERE id = ? "
+                "AND (status = 'failed' OR (status = 'running' AND updated_at < ?))",
+                (time.time(), import_id, time.time() - STALE_AFTER)
+            ).rowcount
+            conn.execute("COMMIT")
+            return claimed == 1
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def batches(self, import_id):
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT payload FROM import_batches WHERE import_id = ? AND payload IS NOT NULL ORDER BY batch",
+                (import_id,)
+            ).fetchall()
+        return [_unpack(row["payload"]) for row in rows]
+
+    def batch_results(self, import_id):
+        """Batch results in bulk_writer.run_batches form, for ``previous_results``."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT batch, rows, status, attempts, error FROM import_batches WHERE import_id = ? ORDER BY batch",
+                (import_id,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def previous_rows(self, import_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT previous_rows FROM imports WHERE id = ?", (import_id,)).fetchone()
+        return None if row is None or row["previous_rows"] is None else _unpack(row["previous_rows"])
+
+    def set_lots_deleted(self, import_id, deleted=True):
+        with closing(self._connect()) as conn:
+            conn.execute("UPDATE imports SET lots_deleted = ?, updated_at = ? WHERE id = ?",
+                         (int(deleted), time.time(), import_id))
+
+    def reset_batches(self, import_id):
+        with closing(self._connect()) as conn:
+            conn.execute("UPDATE import_batches SET status = 'pending', error = NULL WHERE import_id = ?", (import_id,))
+
+    def record_batch(self, import_id, result):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE import_batches SET status = ?, attempts = attempts + ?, error = ? WHERE import_id = ? AND batch = ?",
+                (result["status"], result["attempts"], result["error"], import_id, result["batch"])
+            )
+            conn.execute("UPDATE imports SET updated_at = ? WHERE id = ?", (time.time(), import_id))
+
+    def finish(self, import_id, status, error=None):
+        """Close an import as 'committed', 'failed' or 'rolled_back'; finished ones drop their payloads."""
+        with closing(self._connect()) as conn:
+            conn.execute("UPDATE imports SET status = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                         (status, error, time.time(), import_id))
+            if status != "failed":
+                conn.execute("UPDATE imports SET previous_rows = NULL WHERE id = ?", (import_id,))
+                conn.execute("UPDATE import_batches SET payload = NULL WHERE import_id = ?", (import_id,))
+                conn.execute(
+                    "DELETE FROM import_batches WHERE import_id IN (SELECT id FROM imports "
+                    "WHERE status IN ('committed', 'rolled_back') ORDER BY id DESC LIMIT -1 OFFSET ?)", (KEEP_FINISHED,)
+                )
+                conn.execute(
+                    "DELETE FROM imports WHERE status IN ('committed', 'rolled_back') AND id NOT IN "
+                    "(SELECT id FROM imports WHERE status IN ('committed', 'rolled_back') ORDER BY id DESC LIMIT ?)",
+                    (KEEP_FINISHED,)
+                )
@@ -0,0 +1,177 @@
+import contextvars
+import json
+import logging
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+from local_cache import cache_path, connect_sqlite
+
+METRICS_DB_PATH = cache_path("metrics.sqlite3")
+# Only the most recent timings are kept; percentiles are computed over them.
+MAX_RECORDS = 20_000
+# Older timings are trimmed when the store is opened and then every this many inserts.
+TRIM_EVERY = 500
+# Target for the p95 of "rerun" (everything a script run does before touching
+# an uploaded file); shown in the admin panel and checked by benchmarks/rerun.py.
+RERUN_BUDGET_MS = 250
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stage_timings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    run_id TEXT,
+    stage TEXT NOT NULL,
+    duration_ms REAL NOT NULL,
+    rows INTEGER,
+    bytes INTEGER,
+    ok INTEGER NOT NULL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS stage_timings_run_id ON stage_timings (run_id);
+"""
+
+# Upload the current script run belongs to (first 12 hex chars of its hash);
+# set by main.py so stages deep in helpers are grouped without passing it around.
+_run_id = contextvars.ContextVar("cloudia_run_id", default=None)
+_logger = None
+_init_lock = threading.Lock()
+# One metrics connection for the whole process: Streamlit runs every rerun on
+# a new script thread, so per-thread connections would be reopened each time.
+# Access is serialized by _db_lock.
+_conn = None
+_db_lock = threading.Lock()
+_inserts = 0
+
+
+def get_logger():
+    """JSON-lines logger on stderr, independent of Streamlit's own logging setup."""
+    global _logger
+    with _init_lock:
+        if _logger is None:
+            logger = logging.getLogger("cloudia")
+            if not logger.handlers:
+                handler = logging.StreamHandler(sys.stderr)
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            _logger = logger
+    return _logger
+
+
+def log_event(event, level=logging.INFO, **fields):
+    entry = {"ts": round(time.time(), 3), "level": logging.getLevelName(level).lower(), "event": event}
+    entry.update((key, value) for key, value in fields.items() if value is not None)
+    get_logger().log(level, json.dumps(entry, default=str))
+
+
+def set_run_id(run_id):
+    _run_id.set(run_id)
+
+
+def _trim(conn):
+    conn.execute("DELETE FROM stage_timings WHERE id <= (SELECT max(id) FROM stage_timings) - ?", (MAX_RECORDS,))
+
+
+def _connect(path=METRICS_DB_PATH):
+    global _conn
+    if _conn is not None:
+        return _conn
+    with _init_lock:
+        if _conn is None:
+            conn = connect_sqlite(path, timeout=10, check_same_thread=False)
+            # WAL + NORMAL: no fsync per insert; a crash can lose the last timings, never corrupt the file
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            _trim(conn)
+            _conn = conn
+    return _conn
+
+
+def _store(entry):
+    global _inserts
+    try:
+        conn = _connect()
+        with _db_lock:
+            conn.execute(
+                "INSERT INTO stage_timings (ts, run_id, stage, duration_ms, rows, bytes, ok, error) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (entry["ts"], entry.get("run_id"), entry["stage"], entry["duration_ms"],
+                 entry.get("rows"), entry.get("bytes"), int(entry["ok"]), entry.get("error"))
+            )
+            _inserts += 1
+            if _inserts % TRIM_EVERY == 0:
+                _trim(conn)
+    except sqlite3.Error as e:
+        # metrics must never break the pipeline
+        log_event("metrics_store_failed", logging.WARNING, error=repr(e))
+
+
+@contextmanager
+def stage(name, run_id=None, rows=None, nbytes=None):
+    """Time a pipeline stage, log it as JSON and keep it for the p50/p95 view.
+
+    Yields a dict; set ``rows``/``bytes`` on it inside the block when they
+    are only known after the work is done. An exception marks the stage as
+    failed and is re-raised.
+    """
+    record = {"rows": rows, "bytes": nbytes}
+    started = time.perf_counter()
+    error = None
+    try:
+        yield record
+    except Exception as e:
+        error = repr(e)
+        raise
+    finally:
+        record_stage(name, started, run_id, record.get("rows"), record.get("bytes"), error)
+
+
+def record_stage(name, started, run_id=None, rows=None, nbytes=None, error=None):
+    """Log and store a stage that began at ``started`` (a ``time.perf_counter()`` value).
+
+    For spans that do not fit in a ``with`` block, such as a whole script run.
+    """
+    entry = {
+        "ts": round(time.time(), 3),
+        "run_id": run_id or _run_id.get(),
+        "stage": name,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        "rows": None if rows is None else int(rows),
+        "bytes": None if nbytes is None else int(nbytes),
+        "ok": error is None,
+        "error": error
+    }
+    log_event("stage", logging.INFO if error is None else logging.ERROR, **entry)
+    _store(entry)
+
+
+def recent_timings(limit=MAX_RECORDS, run_id=None):
+    query = "SELECT ts, run_id, stage, duration_ms, rows, bytes, ok, error FROM stage_timings"
+    params = ()
+    if run_id is not None:
+        query += " WHERE run_id = ?"
+        params = (run_id,)
+    conn = _connect()
+    with _db_lock:
+        return pd.read_sql_query(query + " ORDER BY id DESC LIMIT ?", conn, params=params + (limit,))
+
+
+def stage_summary(limit=MAX_RECORDS):
+    """Count, p50, p95 and max duration per stage over the most recent ``limit`` timings."""
+    timings = recent_timings(limit)
+    if timings.empty:
+        return pd.DataFrame(columns=["stage", "runs", "p50_ms", "p95_ms", "max_ms", "failed"])
+    durations = timings.groupby("stage")["duration_ms"]
+    return pd.DataFrame({
+        "runs": durations.size(),
+        "p50_ms": durations.quantile(0.5),
+        "p95_ms": durations.quantile(0.95),
+        "max_ms": durations.max(),
+        "failed": (timings["ok"] == 0).groupby(timings["stage"]).sum()
+    }).round(1).reset_index().sort_values("p95_ms", ascending=False, ignore_index=True)
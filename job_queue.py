@@ -0,0 +1,150 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from instrumentation import log_event
+from local_cache import cache_path, connect_sqlite
+
+JOBS_DB_PATH = cache_path("jobs.sqlite3")
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 5.0
+BACKOFF_MAX = 300.0
+POLL_INTERVAL = 2.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    label TEXT,
+    payload TEXT NOT NULL,
+    blob BLOB,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    run_after REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_run_after ON jobs (status, run_after);
+"""
+
+
+class JobQueue:
+    """Persistent, SQLite-backed queue for side effects that must not block the page.
+
+    ``handlers`` maps a job kind to ``handler(payload, blob)``; a handler
+    signals failure by raising, and the job is retried with exponential
+    backoff up to ``max_attempts`` times. Jobs survive restarts: anything
+    left ``running`` by a dead process is queued again on startup.
+    """
+
+    def __init__(self, handlers, path=JOBS_DB_PATH, workers=2, max_attempts=MAX_ATTEMPTS):
+        self.handlers = handlers
+        self.path = path
+        self.max_attempts = max_attempts
+        # enqueue() bumps the counter and wakes every idle worker; a worker
+        # only sleeps if nothing was enqueued since it last looked for jobs
+        self._wake = threading.Condition()
+        self._enqueued = 0
+
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+            conn.execute("UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running'", (time.time(),))
+
+        for i in range(workers):
+            threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True).start()
+
+    def _connect(self):
+        conn = connect_sqlite(self.path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def enqueue(self, kind, payload, blob=None, label=None):
+        now = time.time()
+        with closing(self._connect()) as conn:
+            job_id = conn.execute(
+                "INSERT INTO jobs (kind, label, payload, blob, created_at, updated_at, run_after) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (kind, label, json.dumps(payload, default=str), blob, now, now, now)
+            ).lastrowid
+        with self._wake:
+            self._enqueued += 1
+            self._wake.notify_all()
+        return job_id
+
+    def recent(self, limit=20):
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT id, kind, label, status, attempts, last_error, created_at, updated_at "
+                "FROM jobs ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _claim(self):
+        conn = self._connect()
+        try:
+            # BEGIN IMMEDIATE takes the write lock up front, so two workers
+            # (or two processes) can never claim the same job.
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id, kind, payload, blob, attempts FROM jobs "
+                "WHERE status = 'queued' AND run_after <= ? ORDER BY id LIMIT 1", (time.time(),)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (time.time(), row["id"])
+                )
+            conn.execute("COMMIT")
+            return row
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _finish(self, job_id, attempts, error):
+        now = time.time()
+        with closing(self._connect()) as conn:
+            if error is None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'done', blob = NULL, last_error = NULL, updated_at = ? WHERE id = ?",
+                    (now, job_id)
+                )
+            elif attempts < self.max_attempts:
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', last_error = ?, updated_at = ?, run_after = ? WHERE id = ?",
+                    (error, now, now + delay, job_id)
+                )
+            else:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', last_error = ?, updated_at = ? WHERE id = ?",
+                    (error, now, job_id)
+                )
+
+    def _run(self):
+        while True:
+            with self._wake:
+                seen = self._enqueued
+            try:
+                job = self._claim()
+            except sqlite3.OperationalError:
+                job = None
+            if job is None:
+                with self._wake:
+                    self._wake.wait_for(lambda: self._enqueued != seen, POLL_INTERVAL)
+                continue
+
+            error = None
+            try:
+                handler = self.handlers[job["kind"]]
+                handler(json.loads(job["payload"]), job["blob"])
+            except Exception as e:
+                error = repr(e)
+                log_event("job_failed", logging.WARNING, job_id=job["id"], kind=job["kind"], error=error)
+            self._finish(job["id"], job["attempts"] + 1, error)
@@ -0,0 +1,58 @@
+import json
+import os
+import sqlite3
+import tempfile
+
+# Process-local files shared by every module that keeps state on disk:
+# registry and rollup snapshots, the job queue, the import journal, the
+# stage timings and print-sized logos. Read at import time, so tests and
+# benchmarks set CLOUDIA_CACHE_DIR before importing the app modules.
+CACHE_DIR = os.environ.get("CLOUDIA_CACHE_DIR", ".cloudia_cache")
+
+
+def cache_path(name):
+    return os.path.join(CACHE_DIR, name)
+
+
+def replace_file(path, write):
+    """Write a file through ``write(binary_file)`` and move it into place atomically.
+
+    Each writer gets its own temp file next to ``path``, so concurrent
+    writers (two app workers, or the CLI while the app runs) never rename
+    each other's half-written copy and readers never see a torn file.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def write_parquet(path, df):
+    replace_file(path, lambda f: df.to_parquet(f, index=False))
+
+
+def write_json(path, value):
+    replace_file(path, lambda f: f.write(json.dumps(value).encode()))
+
+
+def read_json(path):
+    """The JSON document at ``path``, or None when it is missing or unreadable."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def connect_sqlite(path, timeout=30, **kwargs):
+    """Autocommit connection to a WAL-mode SQLite file, creating its directory if needed."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, **kwargs)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
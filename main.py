@@ -4,114 +4,41 @@ from datetime import datetime
 from fpdf import FPDF
 from io import BytesIO
 from PIL import Image
-from supabase import create_client, Client
 import re
 import time
 import base64
-import math
-from office365.runtime.auth.client_credential import ClientCredential
-from office365.sharepoint.client_context import ClientContext
+import hashlib
+import os
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import farmer_registry
+import sharepoint_client
+import pg_backend
+from delivery_reader import (read_delivery, normalize_for_insert, to_records, MissingColumnsError,
+                             UnsupportedFormatError, SUPPORTED_EXTENSIONS)
+from bulk_writer import insert_in_batches, run_batches, split_batches
+import quota
+import verification
+from quota_tracker import QuotaTracker
+from job_queue import JobQueue
+from import_journal import ImportJournal
+import delivery_diff
+import instrumentation
+import local_cache
+import logging
+from connections import get_supabase, get_pg_engine, get_async_rest
+from translations import LANGUAGES, translate
 st.set_page_config(page_title="CloudIA Quota Verifier", layout="centered")
+# pomiar kosztu reruna: od początku skryptu do obsługi wgranego pliku
+rerun_started = time.perf_counter()
+instrumentation.set_run_id(None)
 # Language switcher
-lang = st.sidebar.radio("🌐 Language / Langue", ["English", "Français"])
+# wybór języka w session_state, żeby przetrwał przejście między stronami (pages/)
+lang = st.sidebar.radio("🌐 Language / Langue", LANGUAGES, index=LANGUAGES.index(st.session_state.get("ui_lang", LANGUAGES[0])))
+st.session_state["ui_lang"] = lang
 
-# Translation dictionary
 def t(key):
-    translations = {
-        "upload_title": {
-            "English": "📤 Drag and drop a verification file here",
-            "Français": "📤 Glissez-déposez un fichier de vérification ici"
-        },
-        "or": {
-            "English": "or",
-            "Français": "ou"
-        },
-        "file_format_caption": {
-            "English": "✅ Format: .xlsx | Max size: 200MB",
-            "Français": "✅ Format : .xlsx | Taille max : 200 Mo"
-        },
-        "title": {
-            "English": "☁️ CloudIA – Farmer Quota Verification System",
-            "Français": "☁️ CloudIA – Système de Vérification des Quotas"
-        },
-        "generate_pdf": {
-            "English": "Generate Approval PDF",
-            "Français": "Générer le certificat PDF"
-        },
-        "download_pdf": {
-            "English": "Download Approval PDF",
-            "Français": "Télécharger le certificat PDF"
-        },
-        "insert_success": {
-            "English": "✅ Data successfully inserted! {} new records added.",
-            "Français": "✅ Données insérées avec succès ! {} nouveaux enregistrements ajoutés."
-        },
-        "insert_error": {
-            "English": "❌ Error while inserting into traceability table",
-            "Français": "❌ Erreur lors de l'insertion dans la table de traçabilité"
-        },
-        "approval_save_error": {
-            "English": "❌ Error saving approval to the database",
-            "Français": "❌ Erreur lors de l'enregistrement de l'approbation dans la base de données"
-        },
-        "file_approved": {
-            "English": "✅ File approved. All farmers valid, quotas OK, and delivered kg per lot within allowed range.",
-            "Français": "✅ Fichier approuvé. Tous les producteurs sont valides, les quotas sont respectés et les kg par lot sont dans la plage autorisée."
-        },
-        "rollback_error": {
-            "English": "❌ Uploaded delivery has been rolled back due to validation errors. PDF cannot be generated.",
-            "Français": "❌ La livraison téléversée a été annulée en raison d'erreurs de validation. Le certificat PDF ne peut pas être généré."
-        },
-        "lot_status_out_of_range": {
-            "English": "### Lot Status Overview - Out of Range",
-            "Français": "### Aperçu de l'état des lots - Hors plage autorisée"
-        },
-        "quota_warning_count": {
-            "English": "⚠️ {} farmers in the uploaded file have quota warnings or exceeded limits.",
-            "Français": "⚠️ {} producteurs du fichier ont des avertissements de quota ou ont dépassé les limites."
-        },
-        "quota_ok": {
-            "English": "✅ All farmers in the uploaded file are within their assigned quotas.",
-            "Français": "✅ Tous les producteurs du fichier respectent leurs quotas assignés."
-        },
-        "quota_overview_title": {
-            "English": "### Quota Overview (Only Warnings and Exceeded)",
-            "Français": "### Aperçu des quotas (avertissements et dépassements uniquement)"
-        },
-        "missing_farmer_id_column": {
-            "English": "❌ quota_view does not contain 'farmer_id'. Columns returned: {}",
-            "Français": "❌ La vue quota_view ne contient pas 'farmer_id'. Colonnes retournées : {}"
-        },
-        "unknown_farmers_error": {
-            "English": "❌ The following farmers are NOT in the database:",
-            "Français": "❌ Les producteurs suivants ne sont PAS présents dans la base de données :"
-        },
-        "missing_columns": {
-            "English": "❌ Missing columns: {}",
-            "Français": "❌ Colonnes manquantes : {}"
-        },
-        "missing_exporter_column": {
-            "English": "❌ Missing 'exporter' column in the Excel file.",
-            "Français": "❌ La colonne 'exporter' est manquante dans le fichier Excel."
-        },
-        "lot_too_low": {
-            "English": "Too low",
-            "Français": "Trop faible"
-        },
-        "lot_within_range": {
-            "English": "Within range",
-            "Français": "Dans la plage autorisée"
-        },
-        "saving": {
-            "English": "💾 Saving data...",
-            "Français": "💾 Sauvegarde des données..."
-        }
-
-
-    }
-    return translations.get(key, {}).get(lang, key)
-
-
+    return translate(key, lang)
 
 
 st.markdown("""
@@ -137,212 +64,579 @@ st.markdown("""
 QUOTA_PER_HA = 800
 LOGO_PATH = "cloudia_logo.png"
 LOGO_COCOA = "cocoasourcelogo.jpg"
-
-@st.cache_resource
-def get_supabase() -> Client:
-    url = st.secrets["supabase"]["url"]
-    key = st.secrets["supabase"]["key"]
-    return create_client(url, key)
+FARMERS_SYNC_TTL = 15 * 60  # sekundy między delta-sync rejestru producentów
+REPLACE_MAX_ROWS = 20_000  # górna granica wierszy na jedno RPC; o wyborze ścieżki decyduje rozmiar payloadu
+EXPORTER_WORKERS = 4  # eksporterzy z pliku zbiorczego zapisywani równolegle
+LOGO_PRINT_DPI = 300
+QUOTA_REFRESH_INTERVAL = 5 * 60  # quota_view odświeżany najwyżej raz na tyle sekund, tylko po zapisach
 
 supabase = get_supabase()
+pg_engine = get_pg_engine()
+rest = get_async_rest() if pg_engine is None else None
 
-@st.cache_data
+@st.cache_resource(ttl=FARMERS_SYNC_TTL)
 def load_all_farmers():
-    all_rows = []
-    page_size = 1000
-    last_farmer_id = None
-    while True:
-        query = supabase.table("farmers").select("*").limit(page_size).order("farmer_id")
-        if last_farmer_id:
-            query = query.gt("farmer_id", last_farmer_id)
-        result = query.execute()
-        rows = result.data
-        if not rows:
-            break
-        all_rows.extend(rows)
-        last_farmer_id = rows[-1]["farmer_id"]
-    farmers_df = pd.DataFrame(all_rows)
-    farmers_df.columns = farmers_df.columns.str.lower()
-    farmers_df['farmer_id'] = farmers_df['farmer_id'].astype(str).str.strip().str.lower()
-    return farmers_df
-
-def delete_existing_delivery_rpc(export_lot, exporter_name, farmer_ids):
-    export_lot = str(export_lot)
-    exporter_name = str(exporter_name)
-    if hasattr(farmer_ids, 'tolist'):
-        farmer_ids = farmer_ids.tolist()
-    farmer_ids = [str(farmer_id) for farmer_id in farmer_ids]
-    try:
-        supabase.rpc('delete_traceability_records', {
-            'lot': export_lot,
-            'exporter_param': exporter_name,
-            'farmer_ids': farmer_ids
-        }).execute()
-    except Exception as e:
-        st.error(f"❌ RPC Delete Error: {e}")
-
-
-def save_delivery_to_supabase(df):
-    column_mapping = {
-        'cooperative name': 'cooperative_name',
-        'export lot n°/connaissement': 'export_lot',
-        'date of purchase from cooperative': 'purchase_date',
-        'certification': 'certification',
-        'farmer_id': 'farmer_id',
-        'net weight (kg)': 'net_weight_kg',
-        'exporter': 'exporter'
-    }
-    df = df.rename(columns=column_mapping)
-    required_columns = ['export_lot', 'exporter', 'farmer_id', 'net_weight_kg']
-    missing_columns = [col for col in required_columns if col not in df.columns]
-    if missing_columns:
-        st.error(f"{t('missing_columns')}: {', '.join(missing_columns)}")
-        return False
+    # jeden frozenset ID na wersję rejestru, współdzielony przez sesje (cache_data kopiowałby go co rerun)
+    with instrumentation.stage("registry_load") as timing:
+        if pg_engine is not None:
+            farmers_df = pg_backend.load_farmers(pg_engine)
+        else:
+            farmers_df = farmer_registry.load_registry(supabase, ttl_seconds=FARMERS_SYNC_TTL, rest=rest)
+        timing["rows"] = len(farmers_df)
+    return frozenset(farmers_df['farmer_id'])
 
-    df_cleaned = df.copy()
-    df_cleaned['farmer_id'] = df_cleaned['farmer_id'].str.strip().str.lower()
-    df_cleaned['purchase_date'] = df_cleaned['purchase_date'].fillna(datetime.today().strftime('%Y-%m-%d'))
-    # Najpierw zamień na string, żeby nie było błędów typu "float" -> np. nan
-    df_cleaned['certification'] = df_cleaned['certification'].astype(str)
+def delivery_lot_keys(df):
+    lots = df.groupby(['exporter', 'export_lot'], sort=False, observed=True)['farmer_id'].unique()
+    return [
+        {'exporter': str(exporter), 'export_lot': str(lot), 'farmer_ids': [str(f) for f in farmer_ids]}
+        for (exporter, lot), farmer_ids in lots.items()
+    ]
 
-# Następnie wszystko, co wygląda na puste/N/A/nan, zamień na None
-    df_cleaned['certification'] = df_cleaned['certification'].replace(
-        ['N/A', 'n/a', 'na', 'NA', 'NaN', 'nan', '', 'None'], None
-    )
 
+def fits_one_request(records):
+    # jedno RPC (jedna transakcja) tylko gdy cały JSON mieści się w limicie batcha (BATCH_MAX_BYTES);
+    # większe dostawy idą przez dziennik i insert w batchach
+    return len(records) <= REPLACE_MAX_ROWS and len(split_batches(records, max_rows=REPLACE_MAX_ROWS)) == 1
 
 
+def _delete_lot_keys(lots):
+    with instrumentation.stage("delete", rows=sum(len(lot['farmer_ids']) for lot in lots)):
+        if pg_engine is not None:
+            pg_backend.delete_lots(pg_engine, lots)
+            return
+        supabase.rpc('delete_delivery', {'lots': lots}).execute()
 
-    def excel_date_to_date(excel_date):
-        if isinstance(excel_date, (int, float)):
-            return (pd.to_datetime('1899-12-30') + pd.to_timedelta(excel_date, unit='D')).strftime('%Y-%m-%d')
-        return excel_date
 
-    df_cleaned['purchase_date'] = df_cleaned['purchase_date'].apply(excel_date_to_date)
-    df_cleaned['purchase_date'] = df_cleaned['purchase_date'].astype(str)
-    data = df_cleaned.to_dict(orient="records")
+def load_existing_rows(df):
+    if pg_engine is not None:
+        return pg_backend.fetch_existing_rows(pg_engine, df, delivery_diff.ROW_COLUMNS)
+    return rest.run(quota.fetch_existing_rows_async(rest, df, delivery_diff.ROW_COLUMNS))
 
-    # Sprawdź, czy są puste wymagane pola w jakimkolwiek wierszu
-    required_fields = ['export_lot', 'exporter', 'farmer_id', 'net_weight_kg']
-    missing_values = df_cleaned[required_fields].isnull().any(axis=1)
 
-    if missing_values.any():
-        st.error("❌ Some rows have missing values in required fields:")
-        st.dataframe(df_cleaned[missing_values])
-        return False
+def apply_delivery_diff(removed_rows, added_rows):
+    # usunięcie + wstawienie w jednej transakcji (sql/apply_delivery_diff.sql)
+    if pg_engine is not None:
+        return pg_backend.apply_diff(pg_engine, removed_rows, added_rows)
+    return supabase.rpc('apply_delivery_diff', {'removed': removed_rows, 'added': added_rows}).execute().data
 
 
+@st.cache_resource
+def get_import_journal():
+    return ImportJournal()
+
+
+def run_journaled_import(import_id, on_progress=None, abandoned=False):
+    """Delete + insert w batchach według dziennika (import_journal.py), bez wywołań Streamlit.
+
+    Batche zapisane wcześniej nie są wysyłane ponownie. ``abandoned``: import
+    przerwany przez martwy proces – batche w locie mogły się zapisać albo nie,
+    więc zaczynamy od ponownego usunięcia lotów. Tak samo, gdy któryś batch ma
+    status ``unknown`` (odpowiedź zginęła po wysłaniu insertu).
+    """
+    journal = get_import_journal()
+    entry = journal.get(import_id)
+    result = {'exporter': entry['exporter'], 'status': 'ok', 'mode': 'batched', 'rows': entry['total_rows'],
+              'added': entry['total_rows'], 'removed': 0, 'changed': 0, 'unchanged': 0, 'error': None,
+              'import_id': import_id}
+    batches = journal.batches(import_id)
+    previous_results = journal.batch_results(import_id)
+    result['kg_delta'] = journal_kg_delta(import_id, batches)
+    # ponowne wysłanie samego batcha "unknown" mogłoby zdublować wiersze – wstawiamy wszystko od nowa
+    abandoned = abandoned or any(r['status'] == 'unknown' for r in previous_results)
     try:
-        with st.spinner(t("saving")):
-            supabase.table("traceability").insert(data).execute()
-        st.success(t("insert_success").format(len(data)))
-        return True
+        if entry['lots_deleted'] and abandoned:
+            journal.reset_batches(import_id)
+            journal.set_lots_deleted(import_id, False)
+            entry['lots_deleted'] = False
+        if not entry['lots_deleted']:
+            _delete_lot_keys(entry['lots'])
+            journal.set_lots_deleted(import_id)
+            previous_results = None
+
+        def send(batch):
+            supabase.table("traceability").insert(batch, returning="minimal").execute()
+
+        with instrumentation.stage("insert", rows=entry['total_rows']):
+            batch_results = run_batches(send, batches, previous_results=previous_results, on_progress=on_progress,
+                                        on_result=lambda batch_result: journal.record_batch(import_id, batch_result),
+                                        idempotent=False)
+    except Exception as e:
+        journal.finish(import_id, 'failed', str(e))
+        result.update(status='failed', error=str(e))
+        return result
+
+    failed = [r for r in batch_results if r["status"] != "ok"]
+    if failed:
+        # zapisane batche zostają; ponowne wgranie pliku (albo "Wznów" w panelu) dośle brakujące
+        journal.finish(import_id, 'failed', failed[0]['error'])
+        result.update(status='failed', error=failed[0]['error'], batches=batch_results)
+    else:
+        journal.finish(import_id, 'committed')
+    return result
+
+
+def journal_kg_delta(import_id, batches):
+    # kg per rolnik: wiersze importu minus zastąpione; bez poprzednich wierszy liczymy wszystko jako nowe
+    # (tracker może chwilowo zawyżyć sumę, nigdy jej nie zaniża)
+    new_kg = quota.weights_by_farmer(pd.DataFrame([row for batch in batches for row in batch],
+                                                  columns=['farmer_id', 'net_weight_kg']))
+    previous_rows = get_import_journal().previous_rows(import_id)
+    if not previous_rows:
+        return new_kg
+    return new_kg.sub(quota.weights_by_farmer(pd.DataFrame(previous_rows)), fill_value=0)
+
+
+def written_kg_delta(results):
+    # delta kg tylko z zapisów, które się udały ('unchanged' nic nie zmienił)
+    deltas = [r['kg_delta'] for r in results if r['status'] == 'ok' and r.get('kg_delta') is not None]
+    return pd.concat(deltas).groupby(level=0).sum() if deltas else None
+
+
+def resume_journaled_import(import_id, on_progress=None):
+    journal = get_import_journal()
+    entry = journal.get(import_id)
+    if entry is None or not journal.claim(import_id):
+        return None
+    return run_journaled_import(import_id, on_progress, abandoned=entry['status'] == 'running')
+
+
+def rollback_journaled_import(import_id):
+    """Przywraca stan sprzed importu: usuwa loty i wstawia z powrotem zapamiętane poprzednie wiersze."""
+    journal = get_import_journal()
+    entry = journal.get(import_id)
+    if entry is None or not journal.claim(import_id):
+        return False
+    previous_rows = journal.previous_rows(import_id)
+    try:
+        if previous_rows is None:
+            # poprzednie wiersze nieznane (odczyt się nie udał) – można tylko usunąć to, co wstawiono
+            if entry['lots_deleted']:
+                _delete_lot_keys(entry['lots'])
+        else:
+            # usunięcie + przywrócenie nie jest atomowe: od tej chwili wznowienie zaczyna od usunięcia lotów
+            journal.reset_batches(import_id)
+            journal.set_lots_deleted(import_id, False)
+            _delete_lot_keys(entry['lots'])
+            if previous_rows:
+                with instrumentation.stage("rollback_restore", rows=len(previous_rows)):
+                    _, batch_results = insert_in_batches(supabase, "traceability", previous_rows)
+                failed = [r for r in batch_results if r["status"] != "ok"]
+                if failed:
+                    raise RuntimeError(failed[0]['error'])
     except Exception as e:
-        st.error(f"{t('insert_error')}: {e}")
+        journal.finish(import_id, 'failed', f"rollback: {e}")
+        instrumentation.log_event("rollback_failed", logging.ERROR, import_id=import_id, error=repr(e))
         return False
+    journal.finish(import_id, 'rolled_back')
+    return True
 
 
-def upload_file_to_sharepoint(site_url, client_id, client_secret, folder_path, file_name, file_content):
+def write_delivery(df_cleaned, exporter=None, on_progress=None, file_hash=None, file_name=None):
+    """Zapis jednej (części) dostawy bez wywołań Streamlit – może działać w wątku roboczym.
+
+    Zwraca słownik z wynikiem do wyświetlenia: status (ok/unchanged/failed),
+    tryb zapisu, liczby wierszy i ewentualny błąd, oraz ``kg_delta`` – zmianę kg
+    per rolnik względem wierszy odczytanych tuż przed zapisem (dla QuotaTracker).
+    """
+    # przerwany import tego samego pliku: dokończ z dziennika, bez liczenia wszystkiego od nowa
+    unfinished = get_import_journal().find_unfinished(file_hash, exporter) if file_hash else None
+    if unfinished is not None:
+        resumed = resume_journaled_import(unfinished['id'], on_progress)
+        if resumed is not None:
+            return dict(resumed, resumed=True)
+
+    result = {'exporter': exporter, 'status': 'ok', 'mode': None, 'rows': len(df_cleaned),
+              'added': 0, 'removed': 0, 'changed': 0, 'unchanged': 0, 'error': None}
+
+    # --- korekta już zapisanej dostawy: zapisz tylko różnicę (dodane / usunięte / zmienione wiersze) ---
     try:
-        print("📡 START upload_file_to_sharepoint()")
-        print("🌐 site_url:", site_url)
-        print("📁 folder_path:", folder_path)
-        print("📄 file_name:", file_name)
+        with instrumentation.stage("existing_rows_read") as timing:
+            existing_df = load_existing_rows(df_cleaned)
+            timing["rows"] = len(existing_df)
+    except Exception as e:
+        instrumentation.log_event("existing_rows_read_failed", logging.WARNING, exporter=exporter, error=repr(e))
+        existing_df = None
+
+    result['kg_delta'] = quota.weights_by_farmer(df_cleaned)
+    if existing_df is not None and not existing_df.empty:
+        result['kg_delta'] = result['kg_delta'].sub(quota.weights_by_farmer(existing_df), fill_value=0)
+
+    # pierwsze wgranie (nic jeszcze nie zapisano) idzie zwykłą ścieżką poniżej
+    if existing_df is not None and not existing_df.empty:
+        with instrumentation.stage("diff", rows=len(df_cleaned)):
+            diff = delivery_diff.diff_delivery(existing_df, df_cleaned)
+        result.update(added=len(diff["added"]), removed=len(diff["removed"]),
+                      changed=diff["changed"], unchanged=diff["unchanged"])
+        if not diff["removed"] and not diff["added"]:
+            result.update(status='unchanged', mode='diff')
+            return result
+        if len(diff["removed"]) + len(diff["added"]) <= REPLACE_MAX_ROWS:
+            removed_df = existing_df.iloc[diff["removed"]].astype(object)
+            removed_rows = removed_df.where(removed_df.notna(), None).to_dict(orient="records")
+            added_rows = to_records(df_cleaned.iloc[diff["added"]])
+            if fits_one_request(removed_rows + added_rows):
+                result['mode'] = 'diff'
+                try:
+                    with instrumentation.stage("diff_apply", rows=len(removed_rows) + len(added_rows)):
+                        apply_delivery_diff(removed_rows, added_rows)
+                except Exception as e:
+                    result.update(status='failed', error=str(e))
+                return result
+        # duża zmiana (nie mieści się w jednym żądaniu) – podmiana całej dostawy
+        result.update(added=len(df_cleaned), removed=len(existing_df), changed=0, unchanged=0)
+    else:
+        result['added'] = len(df_cleaned)
 
-        ctx = ClientContext(site_url).with_credentials(ClientCredential(client_id, client_secret))
-        print("🔑 Auth OK")
-        web = ctx.web
-        ctx.load(web)
-        ctx.execute_query()
-        print("🌍 Web title:", web.properties.get("Title"))
-        print("📎 ServerRelativeUrl (web):", web.properties.get("ServerRelativeUrl"))
+    if pg_engine is not None:
+        # COPY do tabeli tymczasowej + delete/insert w jednej transakcji
+        result['mode'] = 'copy'
+        try:
+            with instrumentation.stage("insert", rows=len(df_cleaned)):
+                pg_backend.replace_delivery(pg_engine, df_cleaned)
+        except Exception as e:
+            result.update(status='failed', error=str(e))
+        return result
 
+    # payload JSON budowany z całych kolumn, dopiero gdy idzie przez REST
+    data = to_records(df_cleaned)
+    if fits_one_request(data):
+        # delete + insert w jednej transakcji po stronie bazy (sql/replace_delivery.sql)
+        result['mode'] = 'replace'
 
-        folder = ctx.web.get_folder_by_server_relative_url(folder_path)
-        print("📁 Got folder object:", folder)
+        def send(rows):
+            supabase.rpc('replace_delivery', {'rows': rows}).execute()
 
-        ctx.load(folder)
-        ctx.execute_query()
-        print("✅ Folder exists:", folder.properties.get("ServerRelativeUrl", "NO URL"))
+        with instrumentation.stage("insert", rows=len(data)):
+            batch_results = run_batches(send, [data])
+    else:
+        # delete + wiele batchy to nie jedna transakcja: najpierw dziennik (loty, poprzednie wiersze,
+        # batche), żeby przerwany import dało się wznowić albo dokładnie wycofać
+        previous_rows = None
+        if existing_df is not None:
+            previous_df = existing_df.astype(object)
+            previous_rows = previous_df.where(previous_df.notna(), None).to_dict(orient="records")
+        try:
+            with instrumentation.stage("journal_write", rows=len(data)):
+                import_id = get_import_journal().begin(file_hash, exporter, delivery_lot_keys(df_cleaned),
+                                                       split_batches(data), previous_rows, label=file_name)
+        except Exception as e:
+            result.update(status='failed', mode='batched', error=str(e))
+            return result
+        return run_journaled_import(import_id, on_progress)
+
+    failed = [r for r in batch_results if r["status"] != "ok"]
+    if failed:
+        result.update(status='failed', error=failed[0]['error'], batches=batch_results)
+    return result
+
+
+def write_exporters(df_cleaned, file_hash=None, file_name=None):
+    # podział pliku raz (groupby), każdy eksporter zapisywany równolegle w ograniczonej puli wątków;
+    # zapisy per eksporter są niezależne (różne klucze exporter/lot/farmer)
+    parts = [(str(exporter), part) for exporter, part in df_cleaned.groupby('exporter', sort=False, observed=True)]
+    with ThreadPoolExecutor(max_workers=min(EXPORTER_WORKERS, len(parts))) as pool:
+        # każdy wątek dostaje kopię kontekstu (run_id dla instrumentacji)
+        futures = [pool.submit(contextvars.copy_context().run, write_delivery, part, exporter, None, file_hash, file_name)
+                   for exporter, part in parts]
+        results = []
+        for (exporter, part), future in zip(parts, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append({'exporter': exporter, 'status': 'failed', 'mode': None, 'rows': len(part), 'error': str(e)})
+    return results
+
+
+def save_delivery_to_supabase(df, file_hash=None, file_name=None):
+    # zwraca (czy zapisano, delta kg per rolnik z faktycznie zapisanych wierszy albo None)
+    # jedno wektorowe przejście: rename, daty seryjne Excela, tokeny N/A (bez apply per wiersz i kopii)
+    try:
+        with instrumentation.stage("clean", rows=len(df)):
+            df_cleaned = normalize_for_insert(df)
+    except MissingColumnsError as e:
+        st.error(t("missing_columns").format(', '.join(e.missing)))
+        return False, None
 
-        folder.upload_file(file_name, file_content).execute_query()
-        print("✅ File uploaded")
+    # Sprawdź, czy są puste wymagane pola w jakimkolwiek wierszu
+    required_fields = ['export_lot', 'exporter', 'farmer_id', 'net_weight_kg']
+    missing_values = df_cleaned[required_fields].isnull().any(axis=1)
 
-        folders = web.folders
-        ctx.load(folders)
-        ctx.execute_query()
-        print("📂 Folders in site:")
-        print("✅ Full SharePoint URL:", site_url + "/" + folder_path)
+    if missing_values.any():
+        st.error("❌ Some rows have missing values in required fields:")
+        st.dataframe(df_cleaned[missing_values])
+        return False, None
 
-        for f in folders:
-            print(" -", f.properties["Name"])
+    if df_cleaned['exporter'].nunique() > 1:
+        # plik zbiorczy: czas zapisu ≈ największy eksporter, nie suma
+        with st.spinner(t("saving")):
+            results = write_exporters(df_cleaned, file_hash, file_name)
+        st.write(t("exporter_write_title"))
+        st.dataframe(pd.DataFrame(results)[['exporter', 'status', 'mode', 'rows', 'added', 'removed', 'unchanged', 'error']],
+                     use_container_width=True)
+        failed = [r for r in results if r['status'] == 'failed']
+        if failed:
+            st.error(t("exporter_write_failed").format(', '.join(r['exporter'] for r in failed)))
+            # zapisy pozostałych eksporterów zostają w bazie – ich kg muszą trafić do QuotaTracker
+            return False, written_kg_delta(results)
+        if all(r['status'] == 'unchanged' for r in results):
+            st.info(t("no_changes"))
+        elif all(r['mode'] == 'diff' for r in results):
+            st.success(t("diff_applied").format(*(sum(r[key] for r in results) for key in ('added', 'removed', 'changed', 'unchanged'))))
+        else:
+            st.success(t("insert_success").format(sum(r['added'] for r in results)))
+        return True, written_kg_delta(results)
+
+    progress = None
+
+    def on_progress(done, total):
+        # pasek postępu tylko dla zapisu w batchach
+        nonlocal progress
+        if progress is None:
+            progress = st.progress(0.0, text=t("saving"))
+        progress.progress(done / total if total else 1.0, text=f"{t('saving')} {done}/{total}")
+
+    with st.spinner(t("saving")):
+        result = write_delivery(df_cleaned, str(df_cleaned['exporter'].iloc[0]), on_progress, file_hash, file_name)
+    if progress is not None:
+        progress.empty()
+
+    if result.get('resumed'):
+        st.info(t("import_resumed"))
+    if result['status'] == 'failed':
+        st.error(f"{t('insert_error')}: {result['error']}")
+        if len(result.get('batches', [])) > 1:
+            st.dataframe(pd.DataFrame(result['batches']), use_container_width=True)
+        if result.get('import_id'):
+            st.info(t("import_resumable"))
+        return False, None
+    if result['status'] == 'unchanged':
+        st.info(t("no_changes"))
+    elif result['mode'] == 'diff':
+        st.success(t("diff_applied").format(result['added'], result['removed'], result['changed'], result['unchanged']))
+    else:
+        st.success(t("insert_success").format(result['rows']))
+    return True, written_kg_delta([result])
 
 
+def upload_file_to_sharepoint(site_url, client_id, client_secret, folder_path, file_name, file_content):
+    try:
+        with instrumentation.stage("sharepoint_upload", nbytes=len(file_content)):
+            sharepoint_client.upload(site_url, client_id, client_secret, folder_path, file_name, file_content)
+        instrumentation.log_event("sharepoint_uploaded", url=site_url + "/" + folder_path + "/" + file_name)
         return True
     except Exception as e:
-        print("❌ Exception:", repr(e))  # <--- bardzo ważne!
+        instrumentation.log_event("sharepoint_upload_failed", logging.ERROR, file_name=file_name, error=repr(e))
         return False
 
 
-
-    
 def refresh_quota_view():
     try:
-        supabase.rpc("refresh_quota_view").execute()
-        print("✅ quota_view successfully refreshed.")
+        with instrumentation.stage("quota_refresh"):
+            supabase.rpc("refresh_quota_view").execute()
+        return True
     except Exception as e:
-        print("❌ Failed to refresh quota_view:", e)
+        instrumentation.log_event("quota_refresh_failed", logging.ERROR, error=repr(e))
+        return False
 
-refresh_quota_view()
 
-def generate_pdf_confirmation(lot_numbers, exporter_name, farmer_count, total_kg, lot_kg_summary, logo_path, logo_cocoa, cooperative_names, uploaded_file_content, delivery_file_name):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", "B", 14)
-    pdf.cell(200, 10, "Delivery Approval Certificate", ln=True, align="C")
+@st.cache_resource
+def get_quota_tracker():
+    return QuotaTracker(refresh_quota_view, QUOTA_REFRESH_INTERVAL)
 
-    if logo_path:
-        try:
-            pdf.image(logo_path, x=10, y=20, w=40)
-        except Exception as e:
-            st.warning(f"Could not embed logo from {logo_path}: {e}")
-    if logo_cocoa:
+def run_approval_insert_job(payload, blob):
+    with instrumentation.stage("approval_insert", rows=1):
         try:
-            pdf.image(logo_cocoa, x=(210 - 110) / 2, y=20, w=110)
+            supabase.table("approvals").insert(payload).execute()
         except Exception as e:
-            st.warning(f"Could not embed logo from {logo_cocoa}: {e}")
-
-
-    pdf.set_y(70)
-    pdf.set_font("Arial", "", 12)
-    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    pdf.multi_cell(0, 10, f"Generated on: {now}")
-    pdf.multi_cell(0, 10, f"Exporter: {exporter_name}")
-    pdf.multi_cell(0, 10, f"Cooperatives: {', '.join(sorted(set(cooperative_names)))}")
-    pdf.multi_cell(0, 10, f"Lots: {', '.join(str(l) for l in lot_numbers)}")
-    pdf.multi_cell(0, 10, f"Total Farmers: {farmer_count}")
-    pdf.multi_cell(0, 10, f"Total Net Weight: {round(total_kg / 1000, 2)} MT")
-
-    pdf.ln(5)
-    pdf.set_font("Arial", "B", 12)
-    pdf.cell(0, 10, "Lot Summary", ln=True)
-    pdf.set_font("Arial", "", 12)
-    for lot, kg in lot_kg_summary.items():
-        pdf.cell(0, 10, f"{lot}: {round(kg / 1000, 2)} MT", ln=True)
-
-    pdf.ln(5)
-    pdf.cell(0, 10, "Approved by CloudIA", ln=True)
-
-    reference_number = lot_numbers[0] if len(lot_numbers) == 1 else "MULTI"
-    reference_number = re.sub(r"[^\w\-]", "_", str(reference_number))
-    today_str = datetime.now().strftime('%Y%m%d')
-    exporter_clean = exporter_name.replace(" ", "_").replace("/", "_")[:20]
-    total_volume_mt = round(total_kg / 1000, 2)
-
-    filename = f"Approval_{reference_number}_{today_str}_{exporter_clean}_{total_volume_mt}MT.pdf"
-    pdf.output(filename)
-
-    # --- ZAPISZ DO TABELI approvals ---
+            # approvals bez kolumny file_hash (sql/approvals_file_hash.sql jeszcze nie uruchomione)
+            if "file_hash" not in payload or "file_hash" not in str(e):
+                raise
+            supabase.table("approvals").insert({k: v for k, v in payload.items() if k != "file_hash"}).execute()
+
+
+def find_approved_file(file_hash):
+    # ten sam plik (SHA-256) już zatwierdzony? -> dict z approvals albo None
+    try:
+        rows = (
+            supabase.table("approvals").select("file_name,created_at")
+            .eq("file_hash", file_hash).limit(1).execute().data
+        )
+    except Exception as e:
+        instrumentation.log_event("approval_lookup_failed", logging.WARNING, error=repr(e))
+        return None
+    return rows[0] if rows else None
+
+
+def run_sharepoint_upload_job(payload, blob):
+    upload_success = upload_file_to_sharepoint(
+        site_url=st.secrets["sharepoint"]["site_url"],
+        client_id=st.secrets["sharepoint"]["client_id"],
+        client_secret=st.secrets["sharepoint"]["client_secret"],
+        folder_path=payload["folder_path"],
+        file_name=payload["file_name"],
+        file_content=blob
+    )
+    if not upload_success:
+        # upload_file_to_sharepoint already prints the error; raising makes the queue retry
+        raise RuntimeError(f"SharePoint upload of '{payload['file_name']}' failed")
+
+
+@st.cache_resource
+def get_job_queue():
+    return JobQueue({
+        "approval_insert": run_approval_insert_job,
+        "sharepoint_upload": run_sharepoint_upload_job
+    })
+
+
+@st.fragment(run_every=5)
+def render_job_status():
+    recent_jobs = get_job_queue().recent(10)
+    if not recent_jobs:
+        return
+    active = any(job["status"] in ("queued", "running") for job in recent_jobs)
+    with st.expander(t("background_jobs"), expanded=active):
+        jobs_df = pd.DataFrame(recent_jobs)
+        jobs_df['updated_at'] = pd.to_datetime(jobs_df['updated_at'], unit='s').dt.strftime('%H:%M:%S')
+        st.dataframe(jobs_df[['label', 'kind', 'status', 'attempts', 'updated_at', 'last_error']],
+                     hide_index=True, use_container_width=True)
+
+
+@st.fragment(run_every=5)
+def render_unfinished_imports():
+    # importy w batchach przerwane błędem albo śmiercią procesu – wznowienie/wycofanie z dziennika, bez pliku
+    unfinished = get_import_journal().unfinished(10)
+    if not unfinished:
+        return
+    with st.expander(t("unfinished_imports"), expanded=True):
+        for entry in unfinished:
+            st.caption(t("unfinished_import_line").format(
+                entry['label'] or entry['id'], entry['exporter'], entry['committed_batches'], entry['total_batches'],
+                entry['last_error'] or "-"
+            ))
+            resume_col, rollback_col = st.columns(2)
+            if resume_col.button(t("resume_import"), key=f"resume_import_{entry['id']}"):
+                with st.spinner(t("saving")):
+                    result = resume_journaled_import(entry['id'])
+                get_quota_tracker().record(written_kg_delta([result]) if result is not None else None)
+                if result is not None and result['status'] == 'ok':
+                    st.success(t("insert_success").format(result['rows']))
+                else:
+                    st.error(f"{t('insert_error')}: {result['error'] if result else '-'}")
+            if rollback_col.button(t("rollback_import"), key=f"rollback_import_{entry['id']}"):
+                with st.spinner(t("saving")):
+                    rolled_back = rollback_journaled_import(entry['id'])
+                get_quota_tracker().record()
+                if rolled_back:
+                    st.success(t("import_rolled_back"))
+                else:
+                    st.error(t("import_rollback_failed"))
+
+
+def show_admin_panel():
+    # panel z czasami etapów tylko dla adminów: ?admin=1 w adresie
+    return st.query_params.get("admin") == "1"
+
+
+@st.fragment
+def render_pipeline_timings():
+    with st.expander(t("pipeline_timings")):
+        summary = instrumentation.stage_summary()
+        rerun = summary[summary['stage'] == 'rerun']
+        if not rerun.empty:
+            rerun_p95 = rerun['p95_ms'].iloc[0]
+            message = t("rerun_budget").format(rerun_p95, instrumentation.RERUN_BUDGET_MS)
+            if rerun_p95 > instrumentation.RERUN_BUDGET_MS:
+                st.warning(message)
+            else:
+                st.caption(message)
+        st.dataframe(summary, hide_index=True, use_container_width=True)
+        if st.session_state.get("pipeline_hash"):
+            last_run = instrumentation.recent_timings(50, run_id=st.session_state["pipeline_hash"][:12])
+            if not last_run.empty:
+                st.caption(t("last_run_timings"))
+                st.dataframe(last_run[['stage', 'duration_ms', 'rows', 'bytes', 'ok']].iloc[::-1],
+                             hide_index=True, use_container_width=True)
+
+
+@st.cache_resource
+def get_print_logo(path, width_mm):
+    # dekodowanie, zmniejszenie do rozdzielczości druku i zapis jako JPEG, który fpdf osadza
+    # bez ponownego dekodowania; fpdf 1.7 przyjmuje obraz tylko jako ścieżkę, więc plik leży
+    # w katalogu cache (local_cache) pod stałą nazwą i kolejne procesy używają go ponownie
+    source = os.stat(path)
+    name, _ = os.path.splitext(os.path.basename(path))
+    cached_path = local_cache.cache_path(f"print_{name}_{width_mm}mm_{LOGO_PRINT_DPI}dpi_{int(source.st_mtime)}.jpg")
+    if os.path.exists(cached_path):
+        return cached_path
+    image = Image.open(path)
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    image = image.convert("RGB")
+    max_width_px = round(width_mm / 25.4 * LOGO_PRINT_DPI)
+    if image.width > max_width_px:
+        image = image.resize((max_width_px, round(image.height * max_width_px / image.width)), Image.LANCZOS)
+    local_cache.replace_file(cached_path, lambda f: image.save(f, format="JPEG", quality=90, optimize=True))
+    return cached_path
+
+
+def generate_pdf_confirmation(lot_numbers, exporter_name, farmer_count, total_kg, lot_kg_summary, logo_path, logo_cocoa, cooperative_names, uploaded_file_content, delivery_file_name, file_hash=None):
+    with instrumentation.stage("pdf_render") as timing:
+        pdf = FPDF()
+        pdf.add_page()
+        pdf.set_font("Arial", "B", 14)
+        pdf.cell(200, 10, "Delivery Approval Certificate", ln=True, align="C")
+
+        if logo_path:
+            try:
+                pdf.image(get_print_logo(logo_path, 40), x=10, y=20, w=40)
+            except Exception as e:
+                st.warning(f"Could not embed logo from {logo_path}: {e}")
+        if logo_cocoa:
+            try:
+                pdf.image(get_print_logo(logo_cocoa, 110), x=(210 - 110) / 2, y=20, w=110)
+            except Exception as e:
+                st.warning(f"Could not embed logo from {logo_cocoa}: {e}")
+
+
+        pdf.set_y(70)
+        pdf.set_font("Arial", "", 12)
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        pdf.multi_cell(0, 10, f"Generated on: {now}")
+        pdf.multi_cell(0, 10, f"Exporter: {exporter_name}")
+        pdf.multi_cell(0, 10, f"Cooperatives: {', '.join(sorted(set(cooperative_names)))}")
+        pdf.multi_cell(0, 10, f"Lots: {', '.join(str(l) for l in lot_numbers)}")
+        pdf.multi_cell(0, 10, f"Total Farmers: {farmer_count}")
+        pdf.multi_cell(0, 10, f"Total Net Weight: {round(total_kg / 1000, 2)} MT")
+
+        pdf.ln(5)
+        pdf.set_font("Arial", "B", 12)
+        pdf.cell(0, 10, "Lot Summary", ln=True)
+        pdf.set_font("Arial", "", 12)
+        for lot, kg in lot_kg_summary.items():
+            pdf.cell(0, 10, f"{lot}: {round(kg / 1000, 2)} MT", ln=True)
+
+        pdf.ln(5)
+        pdf.cell(0, 10, "Approved by CloudIA", ln=True)
+
+        reference_number = lot_numbers[0] if len(lot_numbers) == 1 else "MULTI"
+        reference_number = re.sub(r"[^\w\-]", "_", str(reference_number))
+        today_str = datetime.now().strftime('%Y%m%d')
+        exporter_clean = exporter_name.replace(" ", "_").replace("/", "_")[:20]
+        total_volume_mt = round(total_kg / 1000, 2)
+
+        filename = f"Approval_{reference_number}_{today_str}_{exporter_clean}_{total_volume_mt}MT.pdf"
+        # PDF tylko w pamięci – bez zapisu na dysk i kolizji nazw między sesjami
+        pdf_bytes = pdf.output(dest="S")
+        if isinstance(pdf_bytes, str):  # fpdf 1.x zwraca str w latin-1
+            pdf_bytes = pdf_bytes.encode("latin-1")
+        pdf_bytes = bytes(pdf_bytes)
+        timing["bytes"] = len(pdf_bytes)
+
+    # --- approvals + SharePoint w tle (job queue), download dostępny od razu ---
     data = {
         "created_at": now,
         "lot_number": ", ".join(str(l) for l in lot_numbers),
@@ -350,81 +644,79 @@ def generate_pdf_confirmation(lot_numbers, exporter_name, farmer_count, total_kg
         "approved_by": "CloudIA",
         "file_name": filename
     }
-    try:
-        supabase.table("approvals").insert(data).execute()
-    except Exception as e:
-        st.error(f"{t('approval_save_error')}: {e}")
+    if file_hash:
+        data["file_hash"] = file_hash
+    jobs = get_job_queue()
+    jobs.enqueue("approval_insert", data, label=filename)
 
-    # --- SharePoint Upload with Error Handling ---
-    sharepoint_folder_path = st.secrets["sharepoint"]["library_name"]
     excel_file_name = delivery_file_name # Use the passed file name
-
     try:
-        # Retrieve SharePoint credentials from Streamlit secrets
-        sharepoint_site_url = st.secrets["sharepoint"]["site_url"]
-        sharepoint_client_id = st.secrets["sharepoint"]["client_id"]
-        sharepoint_client_secret = st.secrets["sharepoint"]["client_secret"]
-
-        # Call the function to upload the file to SharePoint
-        upload_success = upload_file_to_sharepoint(
-            site_url=sharepoint_site_url,
-            client_id=sharepoint_client_id,
-            client_secret=sharepoint_client_secret,
-            folder_path=sharepoint_folder_path,
-            file_name=excel_file_name,
-            file_content=uploaded_file_content
-        )
-
-        # Display success or error message based on upload result
-        if upload_success:
-            st.success(f"✅ Excel file '{excel_file_name}' successfully uploaded to SharePoint.")
-        else:
-            # upload_file_to_sharepoint already prints the error to console,
-            # so we display a generic error message in the app.
-            st.error(f"❌ Failed to upload Excel file '{excel_file_name}' to SharePoint. See logs for details.")
-
+        sharepoint_folder_path = st.secrets["sharepoint"]["library_name"]
+        # credentials are read by the worker; check they exist before queueing
+        for key in ("site_url", "client_id", "client_secret"):
+            st.secrets["sharepoint"][key]
+        jobs.enqueue("sharepoint_upload", {"folder_path": sharepoint_folder_path, "file_name": excel_file_name},
+                     blob=uploaded_file_content, label=excel_file_name)
+        st.info(t("approval_queued").format(excel_file_name))
     except KeyError as e:
         st.error(f"❌ SharePoint credentials not found in Streamlit secrets: {e}. Make sure 'sharepoint.site_url', 'sharepoint.client_id', and 'sharepoint.client_secret' are set.")
-    # Handle any other unexpected errors during the preparation phase
-    except Exception as e:
-        st.error(f"❌ An unexpected error occurred during SharePoint upload preparation: {e}")
 
+    return filename, pdf_bytes
 
-    return filename
 
+def get_pipeline_run(delivery_hash):
+    # Wyniki etapów trzymane w session_state per hash pliku: rerun z tym samym
+    # plikiem (np. klik "Generate Approval PDF") wznawia od ostatniego etapu
+    if st.session_state.get("pipeline_hash") != delivery_hash:
+        st.session_state["pipeline_hash"] = delivery_hash
+        st.session_state["pipeline_run"] = {}
+    return st.session_state["pipeline_run"]
 
-def load_quota_view():
-    result = supabase.table("quota_view").select("*").execute()
-    return pd.DataFrame(result.data)
 
-# --- UI Layout ---
-def image_to_base64(path):
-    with open(path, "rb") as f:
-        return base64.b64encode(f.read()).decode()
-
-logo_1 = image_to_base64(LOGO_PATH)      # np. cloudia_logo.png
-logo_2 = image_to_base64(LOGO_COCOA)     # np. cocoasourcelogo.jpg
+def load_delivery_quota(uploaded_df):
+    # bez cache między sesjami: wynik dla pliku trzyma tylko checkpoint sesji (run["verdict"]),
+    # a overlay z QuotaTracker jest nakładany przy każdej weryfikacji
+    if pg_engine is not None:
+        return pg_backend.fetch_delivery_quota(pg_engine, uploaded_df)
+    # wszystkie batche obu odczytów naraz przez async_rest (keep-alive, limit współbieżności)
+    return rest.run(quota.fetch_delivery_quota_async(rest, uploaded_df))
 
 # --- UI Layout ---
-def image_to_base64(path):
-    with open(path, "rb") as f:
-        return base64.b64encode(f.read()).decode()
+@st.cache_resource
+def get_logo_data_uri(path, height_px):
+    # raz na proces: zmniejszenie do 2x wysokości wyświetlania (ekrany retina) zamiast ~1 MB oryginałów w każdym rerunie
+    image = Image.open(path)
+    target_height = height_px * 2
+    if image.height > target_height:
+        image = image.resize((round(image.width * target_height / image.height), target_height), Image.LANCZOS)
+    buffer = BytesIO()
+    if image.mode in ("RGBA", "LA", "P"):
+        image.save(buffer, format="PNG", optimize=True)
+        mime = "image/png"
+    else:
+        image.convert("RGB").save(buffer, format="JPEG", quality=85, optimize=True)
+        mime = "image/jpeg"
+    return f"data:{mime};base64,{base64.b64encode(buffer.getvalue()).decode()}"
 
-logo_1 = image_to_base64(LOGO_PATH)
-logo_2 = image_to_base64(LOGO_COCOA)
 
-st.markdown(f"""
+@st.cache_resource
+def get_header_html(title):
+    # HTML nagłówka składany raz na język
+    return f"""
     <h1 style='text-align: center; font-size: 60px; color: #1c2b4a; margin-top: 10px; margin-bottom: 10px; letter-spacing: 6px;'>EXPORT</h1>
 
     <div style="display: flex; justify-content: center; align-items: center; gap: 80px; margin-bottom: 30px;">
-        <img src="data:image/png;base64,{logo_1}" alt="CloudIA" style="height: 140px;">
-        <img src="data:image/png;base64,{logo_2}" alt="Cocoa Source" style="height: 180px;">
+        <img src="{get_logo_data_uri(LOGO_PATH, 140)}" alt="CloudIA" style="height: 140px;">
+        <img src="{get_logo_data_uri(LOGO_COCOA, 180)}" alt="Cocoa Source" style="height: 180px;">
     </div>
 
     <h2 style='text-align: center; color: #1c2b4a; font-size: 30px;'>
-        {t('title')}
+        {title}
     </h2>
-""", unsafe_allow_html=True)
+"""
+
+
+st.markdown(get_header_html(t('title')), unsafe_allow_html=True)
 
 
 
@@ -437,40 +729,56 @@ st.markdown(f"""
 """, unsafe_allow_html=True)
 
 
-delivery_file = st.file_uploader(" ", type=["xlsx"], label_visibility="collapsed")
+delivery_file = st.file_uploader(" ", type=SUPPORTED_EXTENSIONS, label_visibility="collapsed")
 st.caption(t("file_format_caption"))
 
-farmers_df = load_all_farmers()
-
-if delivery_file:
-    uploaded_excel_file = delivery_file # Store the file object
-    uploaded_df = pd.read_excel(uploaded_excel_file) # Read from the file object
-    uploaded_df = pd.read_excel(delivery_file)
-    uploaded_df.columns = uploaded_df.columns.str.strip().str.lower()
-    uploaded_df['farmer_id'] = uploaded_df['farmer_id'].astype(str).str.strip().str.lower()
+if st.sidebar.button(t("force_resync")):
+    resynced_df = farmer_registry.load_registry(supabase, ttl_seconds=FARMERS_SYNC_TTL, force=True, rest=rest)
+    load_all_farmers.clear()
+    st.sidebar.success(t("registry_resynced").format(len(resynced_df)))
 
-    if 'exporter' not in uploaded_df.columns:
-        st.error(t("missing_exporter_column"))
-        st.stop()
+with st.sidebar:
+    render_job_status()
+    render_unfinished_imports()
+    if show_admin_panel():
+        render_pipeline_timings()
 
-    exporter_names = uploaded_df['exporter'].dropna().astype(str).str.strip().unique()
+known_farmer_ids = load_all_farmers()
+instrumentation.record_stage("rerun", rerun_started)
 
-    expected_columns = ['cooperative name', 'export lot n°/connaissement', 'date of purchase from cooperative',
-                        'certification', 'farmer_id', 'farm_id', 'net weight (kg)', 'exporter']
-    missing_columns = [col for col in expected_columns if col not in uploaded_df.columns]
-    if missing_columns:
-        st.error(t("missing_columns").format(', '.join(missing_columns)))
+if delivery_file:
+    uploaded_excel_file = delivery_file # Store the file object
+    delivery_hash = hashlib.sha256(uploaded_excel_file.getvalue()).hexdigest()
+    run = get_pipeline_run(delivery_hash)
+    instrumentation.set_run_id(delivery_hash[:12])
+
+    # identyczny plik był już zatwierdzony – pomiń całe przetwarzanie
+    if "approved_before" not in run:
+        run["approved_before"] = find_approved_file(delivery_hash)
+    if run["approved_before"]:
+        st.info(t("already_approved").format(run["approved_before"]["file_name"], run["approved_before"]["created_at"]))
         st.stop()
 
-    uploaded_df.rename(columns={
-        'export lot n°/connaissement': 'export_lot',
-        'net weight (kg)': 'net_weight_kg',
-        'date of purchase from cooperative': 'purchase_date'
-    }, inplace=True)
-
-    uploaded_df['purchase_date'] = uploaded_df['purchase_date'].fillna(datetime.today().strftime('%Y-%m-%d'))
-
-    uploaded_df = uploaded_df.drop_duplicates(subset=['export_lot', 'exporter', 'farmer_id', 'net_weight_kg'], keep='last')
+    # --- Etap 1: wczytanie pliku ---
+    if "uploaded_df" not in run:
+        try:
+            # format z magic bytes/rozszerzenia; nagłówki (brakujące kolumny) sprawdzane w trakcie parsowania
+            with instrumentation.stage("file_parse", nbytes=uploaded_excel_file.size) as timing:
+                uploaded_df = read_delivery(uploaded_excel_file, uploaded_excel_file.name)
+                timing["rows"] = len(uploaded_df)
+        except UnsupportedFormatError as e:
+            st.error(t("unsupported_format").format(e))
+            st.stop()
+        except MissingColumnsError as e:
+            if 'exporter' in e.missing:
+                st.error(t("missing_exporter_column"))
+            else:
+                st.error(t("missing_columns").format(', '.join(e.missing)))
+            st.stop()
+
+        with instrumentation.stage("prepare", rows=len(uploaded_df)):
+            run["uploaded_df"] = verification.prepare_delivery(uploaded_df)
+    uploaded_df = run["uploaded_df"]
 
     # ZABEZPIECZENIE: blokuj puste pliki
     if uploaded_df.empty:
@@ -478,9 +786,10 @@ if delivery_file:
         st.stop()
 
 
-    unknown_farmers = uploaded_df[
-        ~uploaded_df['farmer_id'].str.lower().isin(farmers_df['farmer_id'].str.lower())
-    ]['farmer_id'].unique()
+    if "unknown_farmers" not in run:
+        with instrumentation.stage("farmer_lookup", rows=len(uploaded_df)):
+            run["unknown_farmers"] = verification.find_unknown_farmers(uploaded_df, known_farmer_ids)
+    unknown_farmers = run["unknown_farmers"]
 
     if unknown_farmers.size > 0:
         st.error(t("unknown_farmers_error"))
@@ -488,39 +797,22 @@ if delivery_file:
         st.stop()
 
 
-# --- Process each exporter separately ---
-    for exporter_name in exporter_names:
-        exporter_df = uploaded_df[uploaded_df['exporter'].str.strip() == exporter_name]
-        exporter_df['exporter'] = exporter_name  # re-assign clean name
-
-        lot_numbers = exporter_df['export_lot'].unique()
-        for lot in lot_numbers:
-            farmer_ids_for_lot = exporter_df[exporter_df['export_lot'] == lot]['farmer_id'].unique().tolist()
-            delete_existing_delivery_rpc(lot, exporter_name, farmer_ids_for_lot)
-
-    # dalej: inserted_ok = ..., quota_df = ..., PDF...
-
-
-# ... (wszystko przed tym zostaje bez zmian)
-
-    inserted_ok = save_delivery_to_supabase(uploaded_df)
-    if not inserted_ok:
-        st.stop()
-
-    time.sleep(1)  # daj czas na propagację danych
-    quota_df = load_quota_view()
-
-    # Diagnoza – sprawdź czy kolumna farmer_id istnieje
-    if 'farmer_id' not in quota_df.columns:
-        st.error(t("missing_farmer_id_column").format(list(quota_df.columns)))
-        st.stop()
-
-    # Czyszczenie i filtrowanie
-    uploaded_ids = pd.Series(uploaded_df['farmer_id']).astype(str).str.strip().str.lower()
-    quota_df['farmer_id'] = quota_df['farmer_id'].astype(str).str.strip().str.lower()
-    quota_df = quota_df[quota_df['farmer_id'].isin(uploaded_ids)]
+    # --- Etap 2: walidacja przed zapisem – kwoty liczone lokalnie, odrzucony plik = zero zapisów ---
+    if "verdict" not in run:
+        try:
+            with instrumentation.stage("quota_read", rows=uploaded_df['farmer_id'].nunique()):
+                quota_rows, replaced_kg = load_delivery_quota(uploaded_df)
+        except Exception as e:
+            st.error(t("quota_read_error").format(e))
+            st.stop()
+        # zapisy z tego procesu, których quota_view jeszcze nie widzi
+        quota_rows = get_quota_tracker().overlay(quota_rows)
+        with instrumentation.stage("verify", rows=len(uploaded_df)):
+            run["verdict"] = verification.verify(uploaded_df, known_farmer_ids, quota_rows, replaced_kg)
+    verdict = run["verdict"]
+    quota_df = verdict["quota_df"]
 
-    quota_filtered = quota_df[quota_df['quota_status'].isin(['EXCEEDED', 'WARNING'])]
+    quota_filtered = quota_df[quota_df['quota_status'].isin(['EXCEEDED', 'WARNING', 'NO_QUOTA'])]
 
 
     if not quota_filtered.empty:
@@ -529,7 +821,7 @@ if delivery_file:
         def highlight_status(val):
             if val == 'EXCEEDED':
                 return 'background-color: #ffcccc'
-            elif val == 'WARNING':
+            elif val in ('WARNING', 'NO_QUOTA'):
                 return 'background-color: #fff3cd'
             return ''
 
@@ -539,55 +831,47 @@ if delivery_file:
             'max_quota_kg': '{:.0f}',
             'total_net_weight_kg': '{:.0f}',
             'quota_used_pct': '{:.2f}'
-        })
+        }, na_rep='–')
 
         st.dataframe(styled_quota, use_container_width=True)
         st.warning(t("quota_warning_count").format(len(quota_filtered)))
     else:
         st.success(t("quota_ok"))
 
-    all_ids_valid = len(unknown_farmers) == 0
-    any_quota_exceeded = 'EXCEEDED' in quota_filtered['quota_status'].values
-    lot_totals = uploaded_df.groupby('export_lot')['net_weight_kg'].sum()
-
-    def check_lot_status(weight_in_kg):
-        weight_in_mt = weight_in_kg / 1000
-        if math.floor(weight_in_mt * 100) < 2100:
-            return t("lot_too_low")
-        return t("lot_within_range")
-
-
-    lot_status = lot_totals.apply(check_lot_status)
-    lot_status_ok = lot_status == t("lot_within_range")
-
-
-    lot_status_info = pd.DataFrame({
-        'export_lot': lot_totals.index,
-        'total_net_weight_kg': lot_totals.values,
-        'lot_status': lot_status
-    })
+    lot_status_info = verdict["lots"].copy()
+    lot_status_info['lot_status'] = lot_status_info.pop('lot_ok').map({True: t("lot_within_range"), False: t("lot_too_low")})
+    lot_status_ok = lot_status_info['lot_status'] == t("lot_within_range")
 
     if not lot_status_ok.all():
         st.write(t("lot_status_out_of_range"))
         st.dataframe(lot_status_info[~lot_status_ok])
 
-    def rollback_delivery(uploaded_df):
-        lot_numbers = uploaded_df['export_lot'].unique()
-        exporter_name = uploaded_df['exporter'].iloc[0]
-        for lot in lot_numbers:
-            farmer_ids_for_lot = uploaded_df[uploaded_df['export_lot'] == lot]['farmer_id'].unique().tolist()
-            delete_existing_delivery_rpc(lot, exporter_name, farmer_ids_for_lot)
-        st.error(t("rollback_error"))
-    
-    final_lot_totals = uploaded_df.groupby('export_lot')['net_weight_kg'].sum()
+    exporter_summary = verdict["exporters"]
+    if len(exporter_summary) > 1:
+        st.write(t("exporter_summary_title"))
+        st.dataframe(exporter_summary, use_container_width=True)
+
+    final_lot_totals = uploaded_df.groupby('export_lot', observed=True)['net_weight_kg'].sum()
     final_exporter_names = ", ".join(sorted(set(uploaded_df['exporter'].dropna().astype(str).str.strip())))
     total_kg = int(final_lot_totals.sum())
 
-    if all_ids_valid and not any_quota_exceeded and lot_status_ok.all():
+    if verdict["status"] == "approved":
+        # --- Etap 3: zapis (tylko raz na plik) ---
+        if "inserted_rows" not in run:
+            inserted_ok, kg_delta = save_delivery_to_supabase(uploaded_df, delivery_hash, uploaded_excel_file.name)
+            # delta tylko z wierszy faktycznie zapisanych (względem stanu odczytanego tuż przed zapisem);
+            # nieudany zapis mógł coś usunąć – wtedy samo odświeżenie widoku
+            get_quota_tracker().record(kg_delta)
+            if not inserted_ok:
+                st.stop()
+            run["inserted_rows"] = len(uploaded_df)
+        else:
+            st.success(t("insert_success").format(run["inserted_rows"]))
+
         st.success(t("file_approved"))
-        if st.button(t("generate_pdf")):
-            total_kg = int(final_lot_totals.sum())
-            pdf_file = generate_pdf_confirmation(
+        # --- Etap 4: certyfikat PDF ---
+        if "pdf_file" not in run and st.button(t("generate_pdf")):
+            run["pdf_file"] = generate_pdf_confirmation(
                 lot_numbers=final_lot_totals.index.tolist(),
                 exporter_name=final_exporter_names,
                 farmer_count=uploaded_df['farmer_id'].nunique(),
@@ -597,10 +881,11 @@ if delivery_file:
                 logo_path=LOGO_PATH,
                 logo_cocoa=LOGO_COCOA,
                 uploaded_file_content=uploaded_excel_file.getvalue(), # Pass the file content
-                delivery_file_name=uploaded_excel_file.name # Pass the file name
+                delivery_file_name=uploaded_excel_file.name, # Pass the file name
+                file_hash=delivery_hash
             )
-            with open(pdf_file, "rb") as f:
-                st.download_button(t("download_pdf"), data=f, file_name=pdf_file, mime="application/pdf")
+        if "pdf_file" in run:
+            pdf_file, pdf_bytes = run["pdf_file"]
+            st.download_button(t("download_pdf"), data=pdf_bytes, file_name=pdf_file, mime="application/pdf")
     else:
-        rollback_delivery(uploaded_df)
-
+        st.error(t("validation_rejected"))
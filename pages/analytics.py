@@ -0,0 +1,78 @@
+import streamlit as st
+from datetime import date, datetime
+
+import instrumentation
+import pg_backend
+import quota
+import rollups
+from connections import get_supabase, get_pg_engine
+from translations import LANGUAGES, translate
+
+ROLLUP_TTL = 10 * 60  # sekundy między odczytami agregatów z bazy
+
+st.set_page_config(page_title="CloudIA Analytics", layout="wide")
+lang = st.sidebar.radio("🌐 Language / Langue", LANGUAGES, index=LANGUAGES.index(st.session_state.get("ui_lang", LANGUAGES[0])))
+st.session_state["ui_lang"] = lang
+instrumentation.set_run_id(None)
+
+
+def t(key):
+    return translate(key, lang)
+
+
+supabase = get_supabase()
+pg_engine = get_pg_engine()
+
+
+def fetch_rollup(table):
+    if pg_engine is not None:
+        return pg_backend.fetch_rollup(pg_engine, table)
+    return rollups.fetch_rollup(supabase, table)
+
+
+@st.cache_resource(ttl=ROLLUP_TTL)
+def load_rollup_snapshot():
+    # agregaty (sql/delivery_rollups.sql) z lokalnego snapshotu parquet, współdzielone przez sesje;
+    # strona nigdy nie czyta tabeli traceability
+    with instrumentation.stage("rollup_load") as timing:
+        tables, synced_at = rollups.load_rollups(fetch_rollup, ROLLUP_TTL)
+        timing["rows"] = sum(len(df) for df in tables.values())
+    return tables, synced_at
+
+
+if st.sidebar.button(t("analytics_refresh")):
+    with instrumentation.stage("rollup_load"):
+        rollups.load_rollups(fetch_rollup, ROLLUP_TTL, force=True)
+    load_rollup_snapshot.clear()
+
+st.title(t("analytics_title"))
+try:
+    tables, synced_at = load_rollup_snapshot()
+except Exception as e:
+    st.error(t("analytics_unavailable").format(e))
+    st.stop()
+st.caption(t("analytics_snapshot").format(f"{datetime.fromtimestamp(synced_at):%Y-%m-%d %H:%M}"))
+
+# --- Wolumen: domyślnie sezon do dziś per eksporter ---
+period = st.date_input(t("analytics_period"), (rollups.season_start(), date.today()))
+start, end = (tuple(period) + (None, None))[:2]
+group_by = st.multiselect(t("analytics_group_by"), rollups.DIMENSIONS, default=["exporter"], format_func=t) or ["exporter"]
+
+with instrumentation.stage("analytics_query") as timing:
+    volume = rollups.volume_by(tables["delivery_rollup"], group_by, start, end)
+    timing["rows"] = len(volume)
+
+st.write(t("analytics_volume_title"))
+st.caption(t("analytics_total").format(volume["net_weight_mt"].sum(), int(volume["rows"].sum())))
+if len(group_by) == 1 and not volume.empty:
+    st.bar_chart(volume.head(30).set_index(group_by[0])["net_weight_mt"])
+st.dataframe(volume, hide_index=True, use_container_width=True,
+             column_config={"month": st.column_config.DateColumn(t("month"), format="YYYY-MM")})
+
+# --- Producenci blisko limitu, per kooperatywa ---
+st.write(t("analytics_quota_title"))
+threshold = st.slider(t("analytics_quota_threshold"), 50, 100, quota.QUOTA_WARNING_PCT, step=5)
+with instrumentation.stage("analytics_query") as timing:
+    near_quota = rollups.farmers_near_quota(tables["farmer_cooperative_rollup"], tables["quota_limits"], threshold)
+    timing["rows"] = len(near_quota)
+st.dataframe(near_quota, hide_index=True, use_container_width=True)
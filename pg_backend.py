@@ -0,0 +1,159 @@
+"""Optional direct-PostgreSQL backend.
+
+Enabled when ``[postgres] url = "postgresql+psycopg2://..."`` is present in
+the Streamlit secrets (the Supabase pooler/direct connection string). Writes
+go through ``COPY FROM STDIN`` into a temporary staging table followed by a
+set-based merge into ``traceability``; reads are single SQL queries instead
+of paged REST calls.
+"""
+import io
+import json
+
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+import quota
+import rollups
+
+POOL_SIZE = 5
+MAX_OVERFLOW = 5
+STATEMENT_TIMEOUT_MS = 120_000
+
+
+def make_engine(url):
+    return create_engine(
+        url,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+        connect_args={"options": f"-c statement_timeout={STATEMENT_TIMEOUT_MS}"}
+    )
+
+
+def _quote_columns(columns):
+    return ", ".join('"{}"'.format(column.replace('"', '""')) for column in columns)
+
+
+def replace_delivery(engine, df):
+    """Delete the delivery's (exporter, lot, farmer) keys and insert its rows in one transaction.
+
+    Returns the number of inserted rows.
+    """
+    column_list = _quote_columns(df.columns)
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cur:
+            # Staging copies only the column types, not constraints or identity columns.
+            cur.execute(
+                f"CREATE TEMP TABLE traceability_staging ON COMMIT DROP AS "
+                f"SELECT {column_list} FROM traceability WITH NO DATA"
+            )
+            cur.copy_expert(f"COPY traceability_staging ({column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+            cur.execute("""
+                DELETE FROM traceability t
+                USING (SELECT DISTINCT exporter, export_lot, farmer_id FROM traceability_staging) k
+                WHERE t.exporter = k.exporter AND t.export_lot = k.export_lot AND t.farmer_id = k.farmer_id
+            """)
+            cur.execute(f"INSERT INTO traceability ({column_list}) SELECT {column_list} FROM traceability_staging")
+            inserted = cur.rowcount
+        raw.commit()
+        return inserted
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+
+def delete_lots(engine, lots):
+    """Set-based delete for ``[{'exporter', 'export_lot', 'farmer_ids'}, ...]`` (see delivery_lot_keys)."""
+    keys = [(lot['exporter'], lot['export_lot'], farmer_id) for lot in lots for farmer_id in lot['farmer_ids']]
+    if not keys:
+        return 0
+    exporters, export_lots, farmer_ids = (list(column) for column in zip(*keys))
+    with engine.begin() as conn:
+        result = conn.execute(text("""
+            DELETE FROM traceability t
+            USING unnest(CAST(:exporters AS text[]), CAST(:export_lots AS text[]), CAST(:farmer_ids AS text[]))
+                  AS k(exporter, export_lot, farmer_id)
+            WHERE t.exporter = k.exporter AND t.export_lot::text = k.export_lot AND t.farmer_id = k.farmer_id
+        """), {"exporters": exporters, "export_lots": export_lots, "farmer_ids": farmer_ids})
+        return result.rowcount
+
+
+def fetch_existing_rows(engine, uploaded_df, columns):
+    """Stored rows under the upload's (exporter, lot, farmer) keys; same result as quota.fetch_existing_rows."""
+    keys = uploaded_df[['exporter', 'export_lot', 'farmer_id']].astype(str).drop_duplicates()
+    column_list = ", ".join("t." + column for column in _quote_columns(columns).split(", "))
+    with engine.connect() as conn:
+        return pd.read_sql(text(f"""
+            SELECT {column_list}
+            FROM traceability t
+            JOIN unnest(CAST(:exporters AS text[]), CAST(:export_lots AS text[]), CAST(:farmer_ids AS text[]))
+                 AS k(exporter, export_lot, farmer_id)
+              ON t.exporter = k.exporter AND t.export_lot::text = k.export_lot AND t.farmer_id = k.farmer_id
+        """), conn, params={
+            "exporters": keys['exporter'].tolist(),
+            "export_lots": keys['export_lot'].tolist(),
+            "farmer_ids": keys['farmer_id'].tolist()
+        })
+
+
+def apply_diff(engine, removed_rows, added_rows):
+    """Run sql/apply_delivery_diff.sql for record lists; returns {'deleted': n, 'inserted': m}."""
+    with engine.begin() as conn:
+        return conn.execute(text("SELECT apply_delivery_diff(CAST(:removed AS jsonb), CAST(:added AS jsonb))"), {
+            "removed": json.dumps(removed_rows, default=str),
+            "added": json.dumps(added_rows, default=str)
+        }).scalar()
+
+
+def load_farmers(engine, columns=("farmer_id",)):
+    with engine.connect() as conn:
+        farmers_df = pd.read_sql(text(f"SELECT {_quote_columns(columns)} FROM farmers"), conn)
+    farmers_df.columns = farmers_df.columns.str.lower()
+    farmers_df['farmer_id'] = farmers_df['farmer_id'].astype(str).str.strip().str.lower()
+    return farmers_df
+
+
+def _fetch_quota_rows(engine, farmer_ids):
+    with engine.connect() as conn:
+        quota_df = pd.read_sql(
+            text(f"SELECT {_quote_columns(quota.QUOTA_COLUMNS)} FROM quota_view WHERE farmer_id = ANY(:ids)"),
+            conn, params={"ids": [str(f) for f in farmer_ids]}
+        )
+    quota_df['farmer_id'] = quota_df['farmer_id'].astype(str).str.strip().str.lower()
+    return quota_df
+
+
+def fetch_delivery_quota(engine, uploaded_df):
+    """Same result as quota.fetch_delivery_quota, in two SQL round-trips."""
+    keys = uploaded_df[['exporter', 'export_lot', 'farmer_id']].astype(str).drop_duplicates()
+    with engine.connect() as conn:
+        replaced = pd.read_sql(text("""
+            SELECT t.farmer_id, sum(t.net_weight_kg) AS net_weight_kg
+            FROM traceability t
+            JOIN unnest(CAST(:exporters AS text[]), CAST(:export_lots AS text[]), CAST(:farmer_ids AS text[]))
+                 AS k(exporter, export_lot, farmer_id)
+              ON t.exporter = k.exporter AND t.export_lot::text = k.export_lot AND t.farmer_id = k.farmer_id
+            GROUP BY t.farmer_id
+        """), conn, params={
+            "exporters": keys['exporter'].tolist(),
+            "export_lots": keys['export_lot'].tolist(),
+            "farmer_ids": keys['farmer_id'].tolist()
+        })
+    replaced_kg = replaced.set_index('farmer_id')['net_weight_kg'].astype(float)
+    return _fetch_quota_rows(engine, uploaded_df['farmer_id'].unique()), replaced_kg
+
+
+def fetch_rollup(engine, table):
+    """One table of the local rollup snapshot (see rollups.ROLLUP_TABLES) in a single query."""
+    columns, _ = rollups.ROLLUP_TABLES[table]
+    source = rollups.SOURCES.get(table, table)
+    with engine.connect() as conn:
+        return pd.read_sql(text(f"SELECT {_quote_columns(columns)} FROM {_quote_columns([source])}"), conn)
@@ -0,0 +1,229 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote_plus
+
+import numpy as np
+import pandas as pd
+
+QUOTA_COLUMNS = ['farmer_id', 'max_quota_kg', 'total_net_weight_kg']
+# Same rule as quota_view's quota_status, see quota_status() below.
+QUOTA_WARNING_PCT = 80
+IN_BATCH_SIZE = 200
+# Encoded characters all `in.(...)` filters of one request may take: with the
+# path and select list that stays under the common 8 KB gateway URL limit.
+IN_FILTER_MAX_CHARS = 6000
+PAGE_SIZE = 1000  # PostgREST max-rows on Supabase
+FETCH_WORKERS = 4
+
+
+def _quoted(values):
+    # postgrest-py joins `in_` values verbatim; quote them so lot numbers or
+    # IDs containing commas or parentheses don't break the filter.
+    return ['"{}"'.format(str(v).replace('\\', '\\\\').replace('"', '\\"')) for v in values]
+
+
+def _url_chars(value):
+    # the value as it appears in the query string, plus the encoded comma before it
+    return len(quote_plus(_quoted([value])[0])) + 3
+
+
+def _batches(values, size=IN_BATCH_SIZE, max_chars=IN_FILTER_MAX_CHARS):
+    """Split values into `in` batches bounded by count and by encoded URL length."""
+    batch, chars = [], 0
+    for value in values:
+        value_chars = _url_chars(value)
+        if batch and (len(batch) >= size or chars + value_chars > max_chars):
+            yield batch
+            batch, chars = [], 0
+        batch.append(value)
+        chars += value_chars
+    if batch:
+        yield batch
+
+
+def _key_batches(uploaded_df, max_chars=IN_FILTER_MAX_CHARS):
+    """``(lots, farmer_ids)`` `in` filter pairs covering every (lot, farmer) key of the upload.
+
+    Lots are chunked to at most half of ``max_chars``; each chunk is paired
+    with batches of just the farmers delivering to those lots, sized to the
+    rest of the budget. The lot x farmer filter can match a few keys outside
+    the upload, which ``_exact_keys`` drops.
+    """
+    keys = uploaded_df[['export_lot', 'farmer_id']].astype(str).drop_duplicates()
+    farmers_by_lot = keys.groupby('export_lot')['farmer_id'].unique()
+    for lots in _batches(farmers_by_lot.index, size=len(farmers_by_lot), max_chars=max_chars // 2):
+        lot_chars = sum(map(_url_chars, lots))
+        farmer_ids = sorted(set(np.concatenate(farmers_by_lot[lots].tolist())))
+        for batch in _batches(farmer_ids, max_chars=max_chars - lot_chars):
+            yield lots, batch
+
+
+def _in(values):
+    return "in.({})".format(",".join(_quoted(values)))
+
+
+def _select_all(make_query):
+    rows = []
+    start = 0
+    while True:
+        page = make_query().range(start, start + PAGE_SIZE - 1).execute().data
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        start += PAGE_SIZE
+
+
+def _run_batched(make_query, batches, pool=None):
+    """Run ``make_query(*batch)`` for every batch of quoted ``in`` values concurrently, paging each one."""
+    if pool is None:
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as own_pool:
+            return _run_batched(make_query, batches, own_pool)
+    pages = pool.map(lambda batch: _select_all(lambda: make_query(*map(_quoted, batch))), batches)
+    return [row for page in pages for row in page]
+
+
+def _fetch_batched(make_query, values, pool=None):
+    """Run ``make_query(batch)`` for every ``in`` batch of values concurrently, paging each one."""
+    return _run_batched(make_query, [(batch,) for batch in _batches(sorted(set(values)))], pool)
+
+
+def fetch_quota_rows(supabase, farmer_ids, pool=None):
+    """Delivered totals and hectare-based limits from quota_view for the given farmers only."""
+    rows = _fetch_batched(
+        lambda batch: supabase.table("quota_view").select(",".join(QUOTA_COLUMNS)).in_("farmer_id", batch),
+        farmer_ids, pool
+    )
+    quota_df = pd.DataFrame(rows, columns=QUOTA_COLUMNS)
+    quota_df['farmer_id'] = quota_df['farmer_id'].astype(str).str.strip().str.lower()
+    return quota_df
+
+
+def fetch_existing_rows(supabase, uploaded_df, columns, pool=None):
+    """Stored traceability rows under the upload's (exporter, lot, farmer) keys, values as the API returns them."""
+    key_columns = ['exporter', 'export_lot', 'farmer_id']
+    columns = list(dict.fromkeys(key_columns + list(columns)))
+    rows = _run_batched(
+        lambda lots, farmer_ids: supabase.table("traceability")
+        .select(",".join(columns))
+        .in_("export_lot", lots)
+        .in_("farmer_id", farmer_ids),
+        list(_key_batches(uploaded_df)), pool
+    )
+    return _exact_keys(pd.DataFrame(rows, columns=columns), uploaded_df, key_columns)
+
+
+def _exact_keys(existing, uploaded_df, key_columns):
+    # lots and farmers are filtered separately, so keep only the exact key combinations
+    keys = pd.MultiIndex.from_frame(uploaded_df[key_columns].astype(str))
+    in_upload = pd.MultiIndex.from_frame(existing[key_columns].astype(str)).isin(keys)
+    return existing[in_upload].reset_index(drop=True)
+
+
+def weights_by_farmer(rows):
+    """Total ``net_weight_kg`` per ``farmer_id`` of a delivery or traceability frame."""
+    return pd.to_numeric(rows['net_weight_kg'], errors='coerce').groupby(rows['farmer_id'].astype(str)).sum()
+
+
+def fetch_replaced_weights(supabase, uploaded_df, pool=None):
+    """Kg per farmer already stored under the (exporter, lot, farmer) keys the upload will replace."""
+    return weights_by_farmer(fetch_existing_rows(supabase, uploaded_df, ['net_weight_kg'], pool))
+
+
+def fetch_delivery_quota(supabase, uploaded_df):
+    """Fetch quota rows and replaced weights for one delivery over a shared pool.
+
+    Both reads are pushed down as batched ``in`` filters with explicit
+    column lists, so the cost follows the size of the upload rather than
+    the size of the registry.
+    """
+    # The two readers get their own threads so they never wait on a batch
+    # queued behind them in the shared pool.
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool, ThreadPoolExecutor(max_workers=2) as readers:
+        quota_rows = readers.submit(fetch_quota_rows, supabase, uploaded_df['farmer_id'].unique(), pool)
+        replaced_kg = readers.submit(fetch_replaced_weights, supabase, uploaded_df, pool)
+        return quota_rows.result(), replaced_kg.result()
+
+
+async def _select_batches_async(rest, table, columns, filter_sets):
+    """Every filter set's rows, all requests in flight at once, capped by the client's semaphore."""
+    pages = await asyncio.gather(*(rest.select_all(table, columns, filters) for filters in filter_sets))
+    return [row for page in pages for row in page]
+
+
+async def _fetch_batched_async(rest, table, columns, values):
+    """Async ``_fetch_batched`` over ``farmer_id`` batches."""
+    return await _select_batches_async(
+        rest, table, columns, ([("farmer_id", _in(batch))] for batch in _batches(sorted(set(values))))
+    )
+
+
+async def fetch_quota_rows_async(rest, farmer_ids):
+    rows = await _fetch_batched_async(rest, "quota_view", QUOTA_COLUMNS, farmer_ids)
+    quota_df = pd.DataFrame(rows, columns=QUOTA_COLUMNS)
+    quota_df['farmer_id'] = quota_df['farmer_id'].astype(str).str.strip().str.lower()
+    return quota_df
+
+
+async def fetch_existing_rows_async(rest, uploaded_df, columns):
+    key_columns = ['exporter', 'export_lot', 'farmer_id']
+    columns = list(dict.fromkeys(key_columns + list(columns)))
+    rows = await _select_batches_async(rest, "traceability", columns, (
+        [("export_lot", _in(lots)), ("farmer_id", _in(farmer_ids))] for lots, farmer_ids in _key_batches(uploaded_df)
+    ))
+    return _exact_keys(pd.DataFrame(rows, columns=columns), uploaded_df, key_columns)
+
+
+async def fetch_delivery_quota_async(rest, uploaded_df):
+    """``fetch_delivery_quota`` over an ``async_rest.AsyncRest`` client: all batches of both reads run concurrently."""
+    quota_df, replaced = await asyncio.gather(
+        fetch_quota_rows_async(rest, uploaded_df['farmer_id'].unique()),
+        fetch_existing_rows_async(rest, uploaded_df, ['net_weight_kg'])
+    )
+    return quota_df, weights_by_farmer(replaced)
+
+
+def quota_status(total_kg, max_quota_kg, warning_pct=QUOTA_WARNING_PCT):
+    """quota_view's status rule over Series of delivered and allowed kg.
+
+    ``EXCEEDED`` when more kg were delivered than the quota allows
+    (``total > max``, so a farmer exactly at 100% is not over),
+    ``WARNING`` from ``warning_pct`` percent of the quota, ``OK`` below.
+    A zero or missing quota is never OK: any delivered kg exceed it, and
+    with nothing delivered the farmer is reported as ``NO_QUOTA``.
+    Returns ``(quota_used_pct, quota_status)``; the percentage is NaN
+    where there is no quota to divide by.
+    """
+    total_kg = total_kg.astype(float).fillna(0)
+    max_quota_kg = max_quota_kg.astype(float)
+    has_quota = max_quota_kg > 0
+    used_pct = total_kg / max_quota_kg.where(has_quota) * 100
+    status = np.select(
+        [total_kg > max_quota_kg.fillna(0), ~has_quota, used_pct >= warning_pct],
+        ['EXCEEDED', 'NO_QUOTA', 'WARNING'], default='OK'
+    )
+    return used_pct, pd.Series(status, index=total_kg.index)
+
+
+def project_quota(uploaded_df, quota_df, replaced_kg, warning_pct=QUOTA_WARNING_PCT):
+    """Quota status each farmer would have once the upload replaces its existing rows.
+
+    Returns the quota_view columns (``farmer_id``, ``max_quota_kg``,
+    ``total_net_weight_kg``, ``quota_used_pct``, ``quota_status``) with the
+    totals projected in-process, so nothing has to be written to find out
+    whether the file passes. Farmers missing from quota_view are left out,
+    as they were when the view was read back after inserting.
+    """
+    projected = quota_df.drop_duplicates(subset='farmer_id', keep='last').set_index('farmer_id')
+    new_kg = uploaded_df.groupby('farmer_id', observed=True)['net_weight_kg'].sum()
+    new_kg.index = new_kg.index.astype(str)
+
+    # kg from the farmer's other deliveries can't be negative, even when the view
+    # is older than the rows being replaced; the upload's own kg always count
+    total = (
+        projected['total_net_weight_kg'].astype(float).fillna(0)
+        - replaced_kg.reindex(projected.index, fill_value=0)
+    ).clip(lower=0) + new_kg.reindex(projected.index, fill_value=0)
+
+    projected['total_net_weight_kg'] = total
+    projected['quota_used_pct'], projected['quota_status'] = quota_status(total, projected['max_quota_kg'], warning_pct)
+    return projected.reset_index()
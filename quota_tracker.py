@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pandas as pd
+
+
+class QuotaTracker:
+    """Per-farmer running totals on top of a lazily refreshed quota_view.
+
+    quota_view is a materialized view, so it only sees deliveries written
+    before its last refresh. Instead of refreshing it on every rerun, each
+    successful write records its per-farmer kg delta here and ``overlay``
+    adds the deltas not yet in the view to rows read from it. A background
+    thread refreshes the view at most once per ``interval`` seconds, and
+    only after something was written.
+
+    Deltas are tracked per process; writes made by other workers show up
+    once their own tracker (or ours) refreshes the view.
+    """
+
+    def __init__(self, refresh, interval):
+        self.interval = interval
+        self._refresh = refresh
+        self._lock = threading.Lock()
+        self._written = threading.Event()
+        self._pending = {}
+        self._in_flight = {}
+        self._last_refresh = 0.0
+        threading.Thread(target=self._run, name="quota-view-refresher", daemon=True).start()
+
+    def record(self, deltas=None):
+        """Add per-farmer kg deltas (a Series or dict indexed by farmer_id) and schedule a refresh."""
+        with self._lock:
+            for farmer_id, kg in dict(deltas if deltas is not None else {}).items():
+                self._pending[farmer_id] = self._pending.get(farmer_id, 0.0) + float(kg)
+        self._written.set()
+
+    def pending_deltas(self):
+        with self._lock:
+            deltas = dict(self._in_flight)
+            for farmer_id, kg in self._pending.items():
+                deltas[farmer_id] = deltas.get(farmer_id, 0.0) + kg
+        return pd.Series(deltas, dtype=float)
+
+    def overlay(self, quota_df):
+        deltas = self.pending_deltas()
+        if deltas.empty:
+            return quota_df
+        quota_df = quota_df.copy()
+        quota_df['total_net_weight_kg'] = (
+            quota_df['total_net_weight_kg'].astype(float).fillna(0)
+            + quota_df['farmer_id'].map(deltas).fillna(0)
+        )
+        return quota_df
+
+    def _run(self):
+        while True:
+            self._written.wait()
+            delay = self._last_refresh + self.interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._refresh_once()
+
+    def _refresh_once(self):
+        with self._lock:
+            self._written.clear()
+            self._in_flight = self._pending
+            self._pending = {}
+
+        # A write landing while the refresh runs may already be in the new
+        # view and still sit in _pending; that over-counts (never under-counts)
+        # until the next refresh, which it also schedules.
+        refreshed = False
+        try:
+            refreshed = self._refresh()
+        finally:
+            with self._lock:
+                if not refreshed:
+                    # Keep the deltas until a refresh actually lands.
+                    for farmer_id, kg in self._in_flight.items():
+                        self._pending[farmer_id] = self._pending.get(farmer_id, 0.0) + kg
+                    self._written.set()
+                self._in_flight = {}
+            self._last_refresh = time.monotonic()
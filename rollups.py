@@ -0,0 +1,125 @@
+import time
+from datetime import date
+
+import pandas as pd
+
+import quota
+from local_cache import cache_path, read_json, write_json, write_parquet
+
+# Local, columnar (parquet) copy of the rollup tables maintained by
+# sql/delivery_rollups.sql plus the per-farmer quota limits, so the analytics
+# page answers its questions from a few thousand pre-aggregated rows in
+# memory instead of querying `traceability`.
+META_PATH = cache_path("rollups_meta.json")
+
+# table -> (columns, sort key used for stable paging)
+ROLLUP_TABLES = {
+    "delivery_rollup": (["exporter", "export_lot", "cooperative_name", "month", "rows", "net_weight_kg"],
+                        ["exporter", "export_lot", "cooperative_name", "month"]),
+    "farmer_cooperative_rollup": (["cooperative_name", "farmer_id", "rows", "net_weight_kg"],
+                                  ["cooperative_name", "farmer_id"]),
+    "quota_limits": (["farmer_id", "max_quota_kg"], ["farmer_id"])
+}
+# snapshot name -> database relation, where they differ
+SOURCES = {"quota_limits": "quota_view"}
+DIMENSIONS = ["exporter", "export_lot", "cooperative_name", "month"]
+# main crop season starts on 1 October
+SEASON_START_MONTH = 10
+# month stored for rows without a usable purchase date
+UNDATED_MONTH = pd.Timestamp("1900-01-01")
+
+
+def _snapshot_path(table):
+    return cache_path(f"{table}.parquet")
+
+
+def _normalize(df, table):
+    columns, _ = ROLLUP_TABLES[table]
+    df = df.reindex(columns=columns)
+    if "rows" in df:
+        df["rows"] = pd.to_numeric(df["rows"]).fillna(0).astype("int64")
+    for column in ("net_weight_kg", "max_quota_kg"):
+        if column in df:
+            df[column] = pd.to_numeric(df[column]).astype(float)
+    if "month" in df:
+        df["month"] = pd.to_datetime(df["month"])
+    for column in ("exporter", "export_lot", "cooperative_name"):
+        if column in df:
+            # dictionary-encoded on disk and in memory
+            df[column] = df[column].astype(str).astype("category")
+    if "farmer_id" in df:
+        df["farmer_id"] = df["farmer_id"].astype(str).str.strip().str.lower()
+    return df.reset_index(drop=True)
+
+
+def fetch_rollup(supabase, table):
+    columns, order = ROLLUP_TABLES[table]
+    source = SOURCES.get(table, table)
+    # PostgREST takes "a,b,c" as one multi-column order, which keeps range paging stable
+    rows = quota._select_all(lambda: supabase.table(source).select(",".join(columns)).order(",".join(order)))
+    return _normalize(pd.DataFrame(rows, columns=columns), table)
+
+
+def _write_snapshot(tables, meta):
+    for table, df in tables.items():
+        write_parquet(_snapshot_path(table), df)
+    write_json(META_PATH, meta)
+
+
+def load_rollups(fetch, ttl_seconds, force=False):
+    """Return ``({table: DataFrame}, synced_at)``, refreshing the local snapshot when stale.
+
+    ``fetch(table)`` reads one rollup from the database (``fetch_rollup``
+    or ``pg_backend.fetch_rollup``). A snapshot younger than ``ttl_seconds``
+    is read from disk without touching the database.
+    """
+    meta = read_json(META_PATH)
+    if not force and meta is not None and time.time() - meta.get("synced_at", 0) < ttl_seconds:
+        try:
+            return {table: pd.read_parquet(_snapshot_path(table)) for table in ROLLUP_TABLES}, meta["synced_at"]
+        except Exception:
+            pass
+    tables = {table: _normalize(fetch(table), table) for table in ROLLUP_TABLES}
+    meta = {"synced_at": time.time()}
+    _write_snapshot(tables, meta)
+    return tables, meta["synced_at"]
+
+
+def season_start(today=None):
+    today = today or date.today()
+    year = today.year if today.month >= SEASON_START_MONTH else today.year - 1
+    return date(year, SEASON_START_MONTH, 1)
+
+
+def volume_by(delivery_rollup, by, start=None, end=None):
+    """Rows, kg and MT per ``by`` dimensions for purchase months between ``start`` and ``end`` (inclusive).
+
+    Undated rows are only included when no date range is given.
+    """
+    df = delivery_rollup
+    if start is not None or end is not None:
+        df = df[df["month"] != UNDATED_MONTH]
+    if start is not None:
+        df = df[df["month"] >= pd.Timestamp(start).to_period("M").to_timestamp()]
+    if end is not None:
+        df = df[df["month"] <= pd.Timestamp(end)]
+    totals = df.groupby(list(by), observed=True)[["rows", "net_weight_kg"]].sum().reset_index()
+    totals["net_weight_mt"] = (totals["net_weight_kg"] / 1000).round(2)
+    return totals.sort_values("net_weight_kg", ascending=False, ignore_index=True)
+
+
+def farmers_near_quota(farmer_rollup, quota_limits, threshold_pct=quota.QUOTA_WARNING_PCT):
+    """Per cooperative: farmers who delivered there and how many of them used at least ``threshold_pct`` of their quota.
+
+    Quota use is a farmer's total over all cooperatives against ``max_quota_kg``.
+    """
+    totals = farmer_rollup.groupby("farmer_id")["net_weight_kg"].sum()
+    limits = quota_limits.drop_duplicates("farmer_id").set_index("farmer_id")["max_quota_kg"]
+    used_pct = (totals / limits.reindex(totals.index) * 100).rename("quota_used_pct")
+    farmers = farmer_rollup[["cooperative_name", "farmer_id"]].join(used_pct, on="farmer_id")
+    farmers["above"] = farmers["quota_used_pct"] >= threshold_pct
+    summary = farmers.groupby("cooperative_name", observed=True).agg(
+        farmers=("farmer_id", "nunique"), farmers_above=("above", "sum")
+    ).reset_index()
+    summary["share_above_pct"] = (summary["farmers_above"] / summary["farmers"] * 100).round(1)
+    return summary.sort_values(["farmers_above", "share_above_pct"], ascending=False, ignore_index=True)
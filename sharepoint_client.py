@@ -0,0 +1,57 @@
+import threading
+import time
+from io import BytesIO
+
+from office365.runtime.auth.client_credential import ClientCredential
+from office365.sharepoint.client_context import ClientContext
+
+# The ACS token cached inside a ClientContext is never refreshed by the
+# library, so pooled contexts are rebuilt before it can expire.
+CONTEXT_MAX_AGE = 30 * 60
+# Above this size the file goes through a chunked upload session instead of
+# a single PUT (SharePoint's simple upload tops out around a few MB).
+LARGE_FILE_BYTES = 4 * 1024 * 1024
+CHUNK_SIZE = 5 * 1024 * 1024
+
+_pool = {}
+_pool_lock = threading.Lock()
+
+
+def _get_context(site_url, client_id, client_secret):
+    key = (site_url, client_id)
+    with _pool_lock:
+        entry = _pool.get(key)
+        if entry is None or time.monotonic() - entry["created"] > CONTEXT_MAX_AGE:
+            entry = {
+                "ctx": ClientContext(site_url).with_credentials(ClientCredential(client_id, client_secret)),
+                "created": time.monotonic(),
+                # ClientContext queues requests on itself, so one upload at a time per context.
+                "lock": threading.Lock()
+            }
+            _pool[key] = entry
+    return entry
+
+
+def _discard_context(site_url, client_id):
+    with _pool_lock:
+        _pool.pop((site_url, client_id), None)
+
+
+def upload(site_url, client_id, client_secret, folder_path, file_name, file_content):
+    """Upload bytes into a SharePoint folder using a pooled, already-authenticated context.
+
+    Small files take a single request; large ones are sent in
+    ``CHUNK_SIZE`` pieces through an upload session. Any failure drops the
+    pooled context so the next attempt re-authenticates.
+    """
+    entry = _get_context(site_url, client_id, client_secret)
+    try:
+        with entry["lock"]:
+            folder = entry["ctx"].web.get_folder_by_server_relative_url(folder_path)
+            if len(file_content) > LARGE_FILE_BYTES:
+                folder.files.create_upload_session(BytesIO(file_content), CHUNK_SIZE, file_name=file_name).execute_query()
+            else:
+                folder.upload_file(file_name, file_content).execute_query()
+    except Exception:
+        _discard_context(site_url, client_id)
+        raise
@@ -0,0 +1,61 @@
+-- Applies a row-level diff computed by delivery_diff.py in one transaction.
+--
+-- removed: stored rows to delete, exactly as they were read back (same
+--          values, so they are matched column by column; a row listed n
+--          times deletes n identical copies).
+-- added:   new rows to insert.
+-- Returns {"deleted": n, "inserted": m}.
+
+create or replace function apply_delivery_diff(removed jsonb, added jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    deleted integer;
+    inserted integer;
+begin
+    with r as (
+        select cooperative_name, export_lot, purchase_date, certification,
+               farmer_id, farm_id, net_weight_kg, exporter,
+               row_number() over (
+                   partition by cooperative_name, export_lot, purchase_date, certification,
+                                farmer_id, farm_id, net_weight_kg, exporter
+               ) as n
+        from jsonb_populate_recordset(null::traceability, removed)
+    ), t as (
+        select ctid as row_ctid, cooperative_name, export_lot, purchase_date, certification,
+               farmer_id, farm_id, net_weight_kg, exporter,
+               row_number() over (
+                   partition by cooperative_name, export_lot, purchase_date, certification,
+                                farmer_id, farm_id, net_weight_kg, exporter
+               ) as n
+        from traceability
+        where (exporter, export_lot::text, farmer_id) in (
+            select distinct exporter, export_lot::text, farmer_id from r
+        )
+    )
+    delete from traceability
+    using t join r
+      on  t.cooperative_name is not distinct from r.cooperative_name
+      and t.export_lot is not distinct from r.export_lot
+      and t.purchase_date is not distinct from r.purchase_date
+      and t.certification is not distinct from r.certification
+      and t.farmer_id is not distinct from r.farmer_id
+      and t.farm_id is not distinct from r.farm_id
+      and t.net_weight_kg is not distinct from r.net_weight_kg
+      and t.exporter is not distinct from r.exporter
+      and t.n = r.n
+    where traceability.ctid = t.row_ctid;
+
+    get diagnostics deleted = row_count;
+
+    insert into traceability (cooperative_name, export_lot, purchase_date, certification,
+                              farmer_id, farm_id, net_weight_kg, exporter)
+    select cooperative_name, export_lot, purchase_date, certification,
+           farmer_id, farm_id, net_weight_kg, exporter
+    from jsonb_populate_recordset(null::traceability, added);
+
+    get diagnostics inserted = row_count;
+    return jsonb_build_object('deleted', deleted, 'inserted', inserted);
+end;
+$$;
@@ -0,0 +1,6 @@
+-- SHA-256 of the approved delivery file, so an identical re-upload can be
+-- recognised and skipped before any processing.
+
+alter table approvals add column if not exists file_hash text;
+
+create index if not exists approvals_file_hash_idx on approvals (file_hash);
@@ -0,0 +1,135 @@
+-- Pre-aggregated delivery volumes for the analytics page.
+--
+-- delivery_rollup holds rows/kg per (exporter, lot, cooperative, purchase
+-- month) and farmer_cooperative_rollup per (cooperative, farmer). Both are
+-- maintained incrementally by statement-level triggers on `traceability`:
+-- every insert/delete the upload pipeline applies (replace_delivery,
+-- apply_delivery_diff, delete_delivery, batched REST inserts, COPY from
+-- pg_backend) is folded in as one grouped delta in the same transaction,
+-- so reading the rollups never scans `traceability`.
+--
+-- Missing keys are stored as '' and rows without a usable purchase date
+-- under month 1900-01-01. TRUNCATE does not fire the triggers; run
+-- rebuild_delivery_rollups() after one (or to reconcile).
+
+create table if not exists delivery_rollup (
+    exporter text not null,
+    export_lot text not null,
+    cooperative_name text not null,
+    month date not null,
+    rows bigint not null default 0,
+    net_weight_kg numeric not null default 0,
+    primary key (exporter, export_lot, cooperative_name, month)
+);
+
+create table if not exists farmer_cooperative_rollup (
+    cooperative_name text not null,
+    farmer_id text not null,
+    rows bigint not null default 0,
+    net_weight_kg numeric not null default 0,
+    primary key (cooperative_name, farmer_id)
+);
+
+-- keys whose rows were all deleted are dropped after each delta
+create index if not exists delivery_rollup_empty on delivery_rollup (exporter) where rows <= 0;
+create index if not exists farmer_cooperative_rollup_empty on farmer_cooperative_rollup (farmer_id) where rows <= 0;
+
+create or replace function rollup_month(purchase_date text)
+returns date
+language sql
+immutable
+as $$
+    select case when purchase_date ~ '^\d{4}-(0[1-9]|1[0-2])'
+                then to_date(left(purchase_date, 7) || '-01', 'YYYY-MM-DD')
+                else date '1900-01-01' end;
+$$;
+
+-- tg_argv[0]: 1 for rows added (NEW TABLE), -1 for rows removed (OLD TABLE);
+-- the transition table is always named delta_rows.
+-- Concurrent writers (insert batches, per-exporter writes, resumed imports)
+-- often touch the same rollup keys; the upserts go in key order so their
+-- row locks are always taken in the same order and cannot deadlock.
+create or replace function rollup_traceability_delta()
+returns trigger
+language plpgsql
+as $$
+declare
+    sign integer := tg_argv[0]::integer;
+begin
+    insert into delivery_rollup as r (exporter, export_lot, cooperative_name, month, rows, net_weight_kg)
+    select coalesce(d.exporter, ''), coalesce(d.export_lot::text, ''), coalesce(d.cooperative_name, ''),
+           rollup_month(d.purchase_date::text), sign * count(*), sign * coalesce(sum(d.net_weight_kg), 0)
+    from delta_rows d
+    group by 1, 2, 3, 4
+    order by 1, 2, 3, 4
+    on conflict (exporter, export_lot, cooperative_name, month) do update
+        set rows = r.rows + excluded.rows,
+            net_weight_kg = r.net_weight_kg + excluded.net_weight_kg;
+
+    insert into farmer_cooperative_rollup as r (cooperative_name, farmer_id, rows, net_weight_kg)
+    select coalesce(d.cooperative_name, ''), lower(trim(d.farmer_id)),
+           sign * count(*), sign * coalesce(sum(d.net_weight_kg), 0)
+    from delta_rows d
+    where d.farmer_id is not null
+    group by 1, 2
+    order by 1, 2
+    on conflict (cooperative_name, farmer_id) do update
+        set rows = r.rows + excluded.rows,
+            net_weight_kg = r.net_weight_kg + excluded.net_weight_kg;
+
+    if sign < 0 then
+        delete from delivery_rollup where rows <= 0;
+        delete from farmer_cooperative_rollup where rows <= 0;
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists traceability_rollup_insert on traceability;
+create trigger traceability_rollup_insert
+    after insert on traceability
+    referencing new table as delta_rows
+    for each statement execute function rollup_traceability_delta('1');
+
+drop trigger if exists traceability_rollup_delete on traceability;
+create trigger traceability_rollup_delete
+    after delete on traceability
+    referencing old table as delta_rows
+    for each statement execute function rollup_traceability_delta('-1');
+
+-- an update is the old rows removed plus the new rows added
+drop trigger if exists traceability_rollup_update_old on traceability;
+create trigger traceability_rollup_update_old
+    after update on traceability
+    referencing old table as delta_rows
+    for each statement execute function rollup_traceability_delta('-1');
+
+drop trigger if exists traceability_rollup_update_new on traceability;
+create trigger traceability_rollup_update_new
+    after update on traceability
+    referencing new table as delta_rows
+    for each statement execute function rollup_traceability_delta('1');
+
+create or replace function rebuild_delivery_rollups()
+returns void
+language plpgsql
+as $$
+begin
+    lock table traceability in share mode;
+    truncate delivery_rollup, farmer_cooperative_rollup;
+
+    insert into delivery_rollup (exporter, export_lot, cooperative_name, month, rows, net_weight_kg)
+    select coalesce(exporter, ''), coalesce(export_lot::text, ''), coalesce(cooperative_name, ''),
+           rollup_month(purchase_date::text), count(*), coalesce(sum(net_weight_kg), 0)
+    from traceability
+    group by 1, 2, 3, 4;
+
+    insert into farmer_cooperative_rollup (cooperative_name, farmer_id, rows, net_weight_kg)
+    select coalesce(cooperative_name, ''), lower(trim(farmer_id)), count(*), coalesce(sum(net_weight_kg), 0)
+    from traceability
+    where farmer_id is not null
+    group by 1, 2;
+end;
+$$;
+
+select rebuild_delivery_rollups();
@@ -0,0 +1,57 @@
+-- Set-based replacement of a delivery in `traceability`.
+--
+-- replace_delivery(rows) deletes every (exporter, export_lot, farmer_id) key
+-- present in the normalized delivery and inserts the new rows in the same
+-- transaction, so the app needs a single RPC round-trip regardless of how
+-- many lots the file contains. delete_delivery(lots) is the matching
+-- rollback: one call removes all lots of a delivery.
+
+create or replace function replace_delivery(rows jsonb)
+returns integer
+language plpgsql
+as $$
+declare
+    inserted integer;
+begin
+    delete from traceability t
+    using (
+        select distinct r.exporter, r.export_lot, r.farmer_id
+        from jsonb_to_recordset(rows) as r(exporter text, export_lot text, farmer_id text)
+    ) k
+    where t.exporter = k.exporter
+      and t.export_lot::text = k.export_lot
+      and t.farmer_id = k.farmer_id;
+
+    insert into traceability (cooperative_name, export_lot, purchase_date, certification,
+                              farmer_id, farm_id, net_weight_kg, exporter)
+    select cooperative_name, export_lot, purchase_date, certification,
+           farmer_id, farm_id, net_weight_kg, exporter
+    from jsonb_populate_recordset(null::traceability, rows);
+
+    get diagnostics inserted = row_count;
+    return inserted;
+end;
+$$;
+
+-- lots: [{"exporter": "...", "export_lot": "...", "farmer_ids": ["...", ...]}, ...]
+create or replace function delete_delivery(lots jsonb)
+returns integer
+language plpgsql
+as $$
+declare
+    deleted integer;
+begin
+    delete from traceability t
+    using (
+        select l.exporter, l.export_lot, f.farmer_id
+        from jsonb_to_recordset(lots) as l(exporter text, export_lot text, farmer_ids text[]),
+             unnest(l.farmer_ids) as f(farmer_id)
+    ) k
+    where t.exporter = k.exporter
+      and t.export_lot::text = k.export_lot
+      and t.farmer_id = k.farmer_id;
+
+    get diagnostics deleted = row_count;
+    return deleted;
+end;
+$$;
@@ -0,0 +1,87 @@
+import httpx
+import pytest
+
+from async_rest import AsyncRest
+
+
+class FakeTable:
+    """In-memory PostgREST table: ``gte``/``gt``/``lt`` filters, ``order``, ``limit`` and ``offset``.
+
+    ``probe_keys`` overrides the row returned by a one-row offset probe, to
+    stand in for rows deleted between the probes.
+    """
+
+    def __init__(self, keys, content_range=True, probe_keys=None):
+        self.rows = [{'farmer_id': key, 'name': f'name {key}'} for key in keys]
+        self.content_range = content_range
+        self.probe_keys = probe_keys or {}
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(request)
+        if request.method == "HEAD":
+            headers = {"content-range": f"*/{len(self.rows)}"} if self.content_range else {}
+            return httpx.Response(200, headers=headers)
+
+        params = request.url.params
+        rows = self.rows
+        for column, value in params.multi_items():
+            op, _, operand = value.partition(".")
+            if op == "gte":
+                rows = [row for row in rows if row[column] >= operand]
+            elif op == "gt":
+                rows = [row for row in rows if row[column] > operand]
+            elif op == "lt":
+                rows = [row for row in rows if row[column] < operand]
+        if "order" in params:
+            rows = sorted(rows, key=lambda row: row[params["order"]])
+        offset = int(params.get("offset", 0))
+        limit = int(params.get("limit", len(rows)))
+        if offset in self.probe_keys and limit == 1:
+            return httpx.Response(200, json=[{'farmer_id': self.probe_keys[offset]}])
+        rows = rows[offset:offset + limit]
+        columns = params["select"].split(",")
+        return httpx.Response(200, json=[{column: row[column] for column in columns} for row in rows])
+
+    @property
+    def probes(self):
+        return [r for r in self.requests if r.method == "GET" and "offset" in r.url.params]
+
+
+def _select_ranges(table, page_size):
+    rest = AsyncRest("https://example.supabase.co", "key", transport=httpx.MockTransport(table))
+    try:
+        return rest.run(rest.select_ranges("farmers", ["farmer_id", "name"], "farmer_id", page_size=page_size))
+    finally:
+        rest.close()
+
+
+def _keys(n):
+    return [f'f{i:05d}' for i in range(n)]
+
+
+def test_select_ranges_returns_every_row_once():
+    table = FakeTable(_keys(95))
+    rows = _select_ranges(table, page_size=10)
+
+    assert [row['farmer_id'] for row in rows] == _keys(95)
+    assert rows[0] == {'farmer_id': 'f00000', 'name': 'name f00000'}
+    assert len(table.probes) == 10  # one per 9-row stride
+
+
+def test_select_ranges_survives_out_of_order_boundaries():
+    # rows deleted while probing: a later probe lands before an earlier one
+    table = FakeTable(_keys(95), probe_keys={27: 'f00012', 36: 'f00012'})
+    rows = _select_ranges(table, page_size=10)
+
+    keys = [row['farmer_id'] for row in rows]
+    assert sorted(keys) == _keys(95)
+    assert len(keys) == len(set(keys))
+
+
+@pytest.mark.parametrize("content_range", [True, False])  # */0, or no count at all
+def test_select_ranges_of_an_empty_table(content_range):
+    table = FakeTable([], content_range=content_range)
+
+    assert _select_ranges(table, page_size=10) == []
+    assert table.probes == []
@@ -0,0 +1,89 @@
+import httpx
+import pytest
+
+import bulk_writer
+from bulk_writer import is_retry_safe_error, may_have_committed, run_batches, split_batches
+
+
+class ApiError(Exception):
+    """Stands in for postgrest's APIError: an error response with a code."""
+
+    def __init__(self, code):
+        self.code = code
+        super().__init__(f"error {code}")
+
+
+class FailingFirst:
+    """``send`` that raises ``error`` on the first ``times`` calls, then succeeds."""
+
+    def __init__(self, error, times=1):
+        self.error = error
+        self.times = times
+        self.calls = 0
+
+    def __call__(self, batch):
+        self.calls += 1
+        if self.calls <= self.times:
+            raise self.error
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(bulk_writer, "BACKOFF_BASE", 0.0)
+
+
+def test_split_batches_bounds_rows_and_bytes():
+    records = [{'farmer_id': f'f{i}', 'note': 'x' * 100} for i in range(10)]
+    assert [len(b) for b in split_batches(records, max_rows=4)] == [4, 4, 2]
+    by_bytes = split_batches(records, max_bytes=300)
+    assert all(len(b) <= 2 for b in by_bytes) and sum(map(len, by_bytes)) == 10
+
+
+@pytest.mark.parametrize("error, safe, maybe", [
+    (httpx.ConnectError("refused"), True, False),
+    (httpx.ConnectTimeout("connect"), True, False),
+    (ApiError("503"), True, False),
+    (ApiError("40P01"), True, False),
+    (httpx.ReadTimeout("read"), False, True),
+    (httpx.RemoteProtocolError("disconnected"), False, True),
+    (ApiError(504), False, True),
+    (ApiError("23502"), False, False),
+    (ValueError("bad payload"), False, False),
+])
+def test_error_classification(error, safe, maybe):
+    assert is_retry_safe_error(error) is safe
+    assert may_have_committed(error) is maybe
+
+
+def test_plain_insert_is_retried_only_when_it_was_not_written():
+    refused = FailingFirst(httpx.ConnectError("refused"))
+    assert run_batches(refused, [[1]], idempotent=False)[0]['status'] == 'ok'
+    assert refused.calls == 2
+
+    timed_out = FailingFirst(httpx.ReadTimeout("read"))
+    result = run_batches(timed_out, [[1]], idempotent=False)[0]
+    assert timed_out.calls == 1
+    assert (result['status'], result['attempts']) == ('unknown', 1)
+
+
+def test_idempotent_write_is_retried_on_any_transient_error():
+    timed_out = FailingFirst(httpx.ReadTimeout("read"))
+    assert run_batches(timed_out, [[1]])[0]['status'] == 'ok'
+    assert timed_out.calls == 2
+
+
+def test_rejected_batch_fails_and_resume_skips_written_ones():
+    sent = []
+
+    def send(batch):
+        sent.append(batch[0])
+        if batch[0] == 2:
+            raise ApiError("23502")
+
+    results = run_batches(send, [[1], [2], [3]], idempotent=False)
+    assert [r['status'] for r in results] == ['ok', 'failed', 'ok']
+
+    sent.clear()
+    resumed = run_batches(lambda batch: sent.append(batch[0]), [[1], [2], [3]], previous_results=results,
+                          idempotent=False)
+    assert sent == [2] and all(r['status'] == 'ok' for r in resumed)
@@ -0,0 +1,115 @@
+import os
+import uuid
+
+import pandas as pd
+import pytest
+
+import delivery_diff
+import pg_backend
+from delivery_reader import to_records
+
+COLUMNS = delivery_diff.ROW_COLUMNS
+
+
+def _rows(*rows):
+    # (farmer_id, net_weight_kg) plus optional overrides of the other columns
+    records = []
+    for row in rows:
+        farmer_id, kg, overrides = (row + ({},))[:3]
+        records.append(dict({
+            'cooperative_name': 'COOP A', 'export_lot': 'LOT1', 'purchase_date': '2026-01-15',
+            'certification': 'RA', 'farmer_id': farmer_id, 'farm_id': 'F-' + farmer_id,
+            'net_weight_kg': kg, 'exporter': 'EXP A'
+        }, **overrides))
+    return pd.DataFrame(records, columns=COLUMNS)
+
+
+def test_identical_delivery_is_unchanged():
+    existing = _rows(('f1', 100.0), ('f2', 200.0))
+    diff = delivery_diff.diff_delivery(existing, existing.iloc[::-1].reset_index(drop=True))
+    assert diff == {'removed': [], 'added': [], 'changed': 0, 'unchanged': 2}
+
+
+def test_changed_weight_is_one_removed_and_one_added_row():
+    existing = _rows(('f1', 100.0), ('f2', 200.0))
+    uploaded = _rows(('f1', 100.0), ('f2', 250.0))
+    diff = delivery_diff.diff_delivery(existing, uploaded)
+    assert diff == {'removed': [1], 'added': [1], 'changed': 1, 'unchanged': 1}
+
+
+def test_removed_and_added_rows_are_not_counted_as_changed():
+    existing = _rows(('f1', 100.0), ('f2', 200.0))
+    uploaded = _rows(('f1', 100.0), ('f3', 300.0))
+    diff = delivery_diff.diff_delivery(existing, uploaded)
+    assert diff['removed'] == [1]
+    assert diff['added'] == [1]
+    assert diff['changed'] == 0
+
+
+def test_duplicate_rows_pair_up_one_to_one():
+    existing = _rows(('f1', 100.0), ('f1', 100.0))
+    more = delivery_diff.diff_delivery(existing, _rows(('f1', 100.0), ('f1', 100.0), ('f1', 100.0)))
+    assert (more['removed'], more['added'], more['unchanged']) == ([], [2], 2)
+    fewer = delivery_diff.diff_delivery(existing, _rows(('f1', 100.0)))
+    assert (fewer['removed'], fewer['added'], fewer['unchanged']) == ([1], [], 1)
+
+
+def test_values_as_read_back_match_the_cleaned_upload():
+    # the API returns weights as numbers with DB precision, dates as text and NULL for empty text
+    existing = _rows(('F1 ', 100.0004, {'certification': None, 'farm_id': 'F-1'}))
+    uploaded = _rows(('f1', 100.0, {'certification': '', 'farm_id': 'F-1', 'purchase_date': pd.Timestamp('2026-01-15')}))
+    diff = delivery_diff.diff_delivery(existing, uploaded)
+    assert diff['unchanged'] == 1 and not diff['removed'] and not diff['added']
+
+
+TRACEABILITY_DDL = """
+CREATE TABLE traceability (
+    id bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    cooperative_name text, export_lot text, purchase_date date, certification text,
+    farmer_id text, farm_id text, net_weight_kg numeric, exporter text
+)
+"""
+
+
+@pytest.fixture
+def pg_engine():
+    # sql/apply_delivery_diff.sql against a real database, in a throwaway schema
+    url = os.environ.get("CLOUDIA_TEST_PG_URL")
+    if not url:
+        pytest.skip("CLOUDIA_TEST_PG_URL not set")
+    from sqlalchemy import create_engine, text
+    schema = "test_" + uuid.uuid4().hex[:12]
+    admin = create_engine(url)
+    with admin.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+    engine = create_engine(url, connect_args={"options": f"-c search_path={schema}"})
+    with open(os.path.join(os.path.dirname(__file__), "..", "sql", "apply_delivery_diff.sql")) as f:
+        function_sql = f.read()
+    with engine.begin() as conn:
+        conn.execute(text(TRACEABILITY_DDL))
+        conn.exec_driver_sql(function_sql)
+    yield engine
+    engine.dispose()
+    with admin.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+    admin.dispose()
+
+
+def _stored(engine):
+    return pd.read_sql(f"SELECT {', '.join(COLUMNS)} FROM traceability", engine)
+
+
+def test_apply_delivery_diff_turns_stored_rows_into_the_upload(pg_engine):
+    existing = _rows(('f1', 100.0), ('f1', 100.0), ('f2', 200.0), ('f3', 300.0, {'certification': None}))
+    pg_backend.replace_delivery(pg_engine, existing)
+    uploaded = _rows(('f1', 100.0), ('f2', 250.0), ('f3', 300.0, {'certification': None}), ('f4', 400.0))
+
+    stored = pg_backend.fetch_existing_rows(pg_engine, uploaded, COLUMNS)
+    diff = delivery_diff.diff_delivery(stored, uploaded)
+    removed = stored.iloc[diff['removed']].astype(object)
+    result = pg_backend.apply_diff(pg_engine, removed.where(removed.notna(), None).to_dict(orient='records'),
+                                   to_records(uploaded.iloc[diff['added']]))
+
+    assert result == {'deleted': 2, 'inserted': 2}
+    after = delivery_diff.diff_delivery(_stored(pg_engine), uploaded)
+    assert (after['removed'], after['added'], after['unchanged']) == ([], [], 4)
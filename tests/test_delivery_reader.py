@@ -0,0 +1,91 @@
+import io
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from openpyxl import Workbook
+
+from delivery_reader import (EXCEL_EPOCH, EXPECTED_COLUMNS, MissingColumnsError, normalize_for_insert,
+                             read_delivery, to_records)
+from verification import prepare_delivery
+
+HEADERS = ['Cooperative Name', 'Export Lot N°/Connaissement', 'Date of purchase from cooperative',
+           'Certification', 'Farmer_ID', 'Farm_ID', 'Net Weight (kg)', 'Exporter']
+PURCHASED = datetime(2026, 1, 15)
+ROWS = [
+    ['COOP A', 'LOT1', PURCHASED, 'RA', ' F001 ', '007', 100.5, ' EXP A '],
+    ['COOP A', 'LOT1', PURCHASED, 'N/A', 'f002', '008', 200.0, 'EXP A'],
+    ['COOP B', 'LOT2', PURCHASED, None, 'F003', '009', 300.25, 'EXP A'],
+]
+EXPECTED = [
+    {'cooperative_name': 'COOP A', 'export_lot': 'LOT1', 'purchase_date': '2026-01-15', 'certification': 'RA',
+     'farmer_id': 'f001', 'farm_id': '007', 'net_weight_kg': 100.5, 'exporter': 'EXP A'},
+    {'cooperative_name': 'COOP A', 'export_lot': 'LOT1', 'purchase_date': '2026-01-15', 'certification': None,
+     'farmer_id': 'f002', 'farm_id': '008', 'net_weight_kg': 200.0, 'exporter': 'EXP A'},
+    {'cooperative_name': 'COOP B', 'export_lot': 'LOT2', 'purchase_date': '2026-01-15', 'certification': None,
+     'farmer_id': 'f003', 'farm_id': '009', 'net_weight_kg': 300.25, 'exporter': 'EXP A'},
+]
+
+
+def _xlsx():
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(HEADERS)
+    for row in ROWS:
+        sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    buffer.name = 'delivery.xlsx'
+    return buffer
+
+
+def _csv():
+    # semicolon-separated, one date as text and one as an Excel serial number
+    serial = (PURCHASED - EXCEL_EPOCH.to_pydatetime()).days
+    dates = [PURCHASED.strftime('%Y-%m-%d'), str(serial), PURCHASED.strftime('%Y-%m-%d')]
+    lines = [';'.join(HEADERS)]
+    for row, date in zip(ROWS, dates):
+        values = [date if i == 2 else ('' if value is None else str(value)) for i, value in enumerate(row)]
+        lines.append(';'.join(values))
+    buffer = io.BytesIO('\n'.join(lines).encode('utf-8'))
+    buffer.name = 'delivery.csv'
+    return buffer
+
+
+def _parquet():
+    columns = list(zip(*ROWS))
+    table = pa.table({header: list(values) for header, values in zip(HEADERS, columns)})
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer)
+    buffer.name = 'delivery.parquet'
+    return buffer
+
+
+@pytest.mark.parametrize('make_file', [_xlsx, _csv, _parquet], ids=['xlsx', 'csv', 'parquet'])
+def test_every_format_normalizes_to_the_same_records(make_file):
+    df = normalize_for_insert(prepare_delivery(read_delivery(make_file())))
+    assert to_records(df) == EXPECTED
+
+
+def test_normalize_for_insert_leaves_the_input_unchanged():
+    df = prepare_delivery(read_delivery(_csv()))
+    before = df.copy()
+    normalize_for_insert(df)
+    pd.testing.assert_frame_equal(df, before)
+
+
+def test_missing_required_column_is_reported():
+    df = prepare_delivery(read_delivery(_csv())).drop(columns=['net_weight_kg'])
+    with pytest.raises(MissingColumnsError) as error:
+        normalize_for_insert(df)
+    assert error.value.missing == ['net_weight_kg']
+
+
+def test_missing_header_is_reported_before_reading_rows():
+    buffer = io.BytesIO(';'.join(HEADERS[:-1]).encode('utf-8') + b'\nA;B;C;D;E;F;1\n')
+    buffer.name = 'delivery.csv'
+    with pytest.raises(MissingColumnsError) as error:
+        read_delivery(buffer)
+    assert error.value.missing == [EXPECTED_COLUMNS[-1]]
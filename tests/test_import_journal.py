@@ -0,0 +1,132 @@
+import threading
+
+import pytest
+
+import import_journal
+from bulk_writer import run_batches
+from import_journal import ImportJournal
+
+LOTS = [{'exporter': 'EXP A', 'export_lot': 'LOT1', 'farmer_ids': ['f1', 'f2']}]
+PREVIOUS_ROWS = [
+    {'export_lot': 'LOT1', 'exporter': 'EXP A', 'farmer_id': 'f1', 'net_weight_kg': 100.5, 'certification': None},
+    {'export_lot': 'LOT1', 'exporter': 'EXP A', 'farmer_id': 'f2', 'net_weight_kg': 200.0, 'certification': 'RA'},
+]
+
+
+def _batches(count, size=3):
+    return [[{'farmer_id': f'f{b}-{i}', 'net_weight_kg': float(i)} for i in range(size)] for b in range(count)]
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return ImportJournal(str(tmp_path / "imports.sqlite3"))
+
+
+class Rejecting:
+    """``send`` that rejects the given batches (by first farmer_id) with a non-transient error."""
+
+    def __init__(self, batches, failing=()):
+        self.failing = {batches[i][0]['farmer_id'] for i in failing}
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def __call__(self, batch):
+        with self.lock:
+            self.sent.append(batch[0]['farmer_id'])
+        if batch[0]['farmer_id'] in self.failing:
+            raise ValueError("request rejected")
+
+
+def _run(journal, import_id, send, previous_results=None):
+    return run_batches(send, journal.batches(import_id), previous_results=previous_results,
+                       on_result=lambda result: journal.record_batch(import_id, result))
+
+
+def test_begin_stores_lots_batches_and_previous_rows(journal):
+    batches = _batches(3)
+    import_id = journal.begin("hash", "EXP A", LOTS, batches, PREVIOUS_ROWS, label="big.csv")
+
+    entry = journal.get(import_id)
+    assert entry['status'] == 'running' and entry['lots'] == LOTS
+    assert (entry['total_batches'], entry['total_rows'], entry['has_previous_rows']) == (3, 9, 1)
+    assert journal.batches(import_id) == batches
+    assert journal.previous_rows(import_id) == PREVIOUS_ROWS
+    assert [r['status'] for r in journal.batch_results(import_id)] == ['pending'] * 3
+
+
+def test_failed_import_resumes_with_only_the_missing_batches(journal):
+    batches = _batches(4)
+    import_id = journal.begin("hash", "EXP A", LOTS, batches, PREVIOUS_ROWS)
+    results = _run(journal, import_id, Rejecting(batches, failing=[1, 3]))
+    journal.finish(import_id, 'failed', results[1]['error'])
+
+    assert journal.find_unfinished("hash", "EXP A")['id'] == import_id
+    assert journal.find_unfinished("hash", "EXP B") is None
+    assert journal.unfinished()[0]['committed_batches'] == 2
+
+    assert journal.claim(import_id)
+    assert not journal.claim(import_id)  # running and fresh: held by this worker
+    resend = Rejecting(batches)
+    results = _run(journal, import_id, resend, previous_results=journal.batch_results(import_id))
+    assert sorted(resend.sent) == sorted(batches[i][0]['farmer_id'] for i in (1, 3))
+    assert all(r['status'] == 'ok' for r in results)
+    assert [r['attempts'] for r in journal.batch_results(import_id)] == [1, 2, 1, 2]
+
+    journal.finish(import_id, 'committed')
+    assert journal.get(import_id)['status'] == 'committed'
+    assert journal.find_unfinished("hash", "EXP A") is None
+    assert not journal.claim(import_id)
+
+
+def test_abandoned_running_import_becomes_claimable_when_stale(journal, monkeypatch):
+    import_id = journal.begin("hash", "EXP A", LOTS, _batches(2))
+    assert journal.find_unfinished("hash", "EXP A") is None
+    assert not journal.claim(import_id)
+
+    monkeypatch.setattr(import_journal, "STALE_AFTER", -1)
+    assert journal.find_unfinished("hash", "EXP A")['id'] == import_id
+    assert [entry['id'] for entry in journal.unfinished()] == [import_id]
+    assert journal.claim(import_id)
+
+
+def test_rollback_state_restores_previous_rows_and_resets_batches(journal):
+    batches = _batches(2)
+    import_id = journal.begin("hash", "EXP A", LOTS, batches, PREVIOUS_ROWS)
+    journal.set_lots_deleted(import_id)
+    _run(journal, import_id, Rejecting(batches, failing=[1]))
+    journal.finish(import_id, 'failed', "request rejected")
+
+    # what rollback_journaled_import does before re-inserting the previous rows
+    assert journal.claim(import_id)
+    journal.reset_batches(import_id)
+    journal.set_lots_deleted(import_id, False)
+    assert journal.previous_rows(import_id) == PREVIOUS_ROWS
+    assert not journal.get(import_id)['lots_deleted']
+    assert {r['status'] for r in journal.batch_results(import_id)} == {'pending'}
+
+    journal.finish(import_id, 'rolled_back')
+    assert journal.get(import_id)['status'] == 'rolled_back'
+    assert journal.previous_rows(import_id) is None
+    assert journal.unfinished() == []
+
+
+def test_import_without_known_previous_rows(journal):
+    import_id = journal.begin("hash", None, LOTS, _batches(1))
+    assert journal.get(import_id)['has_previous_rows'] == 0
+    assert journal.previous_rows(import_id) is None
+    journal.finish(import_id, 'failed', "boom")
+    assert journal.find_unfinished("hash", None)['id'] == import_id
+
+
+def test_finished_imports_drop_payloads_and_are_pruned(journal, monkeypatch):
+    monkeypatch.setattr(import_journal, "KEEP_FINISHED", 2)
+    ids = [journal.begin(f"hash{i}", "EXP A", LOTS, _batches(1), PREVIOUS_ROWS) for i in range(4)]
+    failed = journal.begin("hash-failed", "EXP A", LOTS, _batches(1), PREVIOUS_ROWS)
+    journal.finish(failed, 'failed', "boom")
+    for import_id in ids:
+        journal.finish(import_id, 'committed')
+
+    assert [journal.get(import_id) is None for import_id in ids] == [True, True, False, False]
+    assert journal.batches(ids[-1]) == []  # the summary row stays, the payloads are gone
+    assert journal.batches(failed) == _batches(1)
+    assert journal.previous_rows(failed) == PREVIOUS_ROWS
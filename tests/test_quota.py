@@ -0,0 +1,134 @@
+import httpx
+import numpy as np
+import pandas as pd
+import pytest
+
+import quota
+from async_rest import AsyncRest
+from quota import project_quota, quota_status
+
+
+def _status(total, maximum):
+    used_pct, status = quota_status(pd.Series([total], dtype=float), pd.Series([maximum], dtype=float))
+    return used_pct.iloc[0], status.iloc[0]
+
+
+@pytest.mark.parametrize("total, maximum, expected", [
+    (1000.0, 1000.0, 'WARNING'),   # exactly 100% is at the limit, not over it
+    (1000.5, 1000.0, 'EXCEEDED'),
+    (800.0, 1000.0, 'WARNING'),    # exactly 80%
+    (799.9, 1000.0, 'OK'),
+    (0.0, 1000.0, 'OK'),
+    (np.nan, 1000.0, 'OK'),        # nothing delivered yet
+])
+def test_quota_status_boundaries(total, maximum, expected):
+    assert _status(total, maximum)[1] == expected
+
+
+@pytest.mark.parametrize("maximum", [0.0, np.nan])
+def test_zero_or_missing_quota_is_never_ok(maximum):
+    used_pct, status = _status(0.0, maximum)
+    assert status == 'NO_QUOTA' and np.isnan(used_pct)
+    used_pct, status = _status(1.0, maximum)
+    assert status == 'EXCEEDED' and np.isnan(used_pct)
+
+
+def test_quota_used_pct():
+    assert _status(250.0, 1000.0)[0] == pytest.approx(25.0)
+
+
+def _upload(rows):
+    return pd.DataFrame(rows, columns=['farmer_id', 'net_weight_kg'])
+
+
+def _quota(rows):
+    return pd.DataFrame(rows, columns=['farmer_id', 'max_quota_kg', 'total_net_weight_kg'])
+
+
+def test_project_quota_subtracts_the_replaced_kg():
+    uploaded = _upload([('f1', 300.0), ('f1', 200.0), ('f2', 100.0)])
+    quota_rows = _quota([('f1', 1000.0, 900.0), ('f2', 1000.0, 100.0)])
+    # f1's 400 kg stored under the upload's keys are replaced by the new 500 kg
+    replaced = pd.Series({'f1': 400.0})
+
+    projected = project_quota(uploaded, quota_rows, replaced).set_index('farmer_id')
+    assert projected.loc['f1', 'total_net_weight_kg'] == pytest.approx(1000.0)
+    assert projected.loc['f1', 'quota_status'] == 'WARNING'
+    assert projected.loc['f2', 'total_net_weight_kg'] == pytest.approx(200.0)
+    assert projected.loc['f2', 'quota_status'] == 'OK'
+
+    without_replaced = project_quota(uploaded, quota_rows, pd.Series(dtype=float)).set_index('farmer_id')
+    assert without_replaced.loc['f1', 'quota_status'] == 'EXCEEDED'
+
+
+def test_project_quota_keeps_the_upload_when_the_view_is_behind():
+    # quota_view not refreshed yet: less stored than the rows being replaced
+    projected = project_quota(_upload([('f1', 10.0)]), _quota([('f1', 1000.0, 50.0)]), pd.Series({'f1': 500.0}))
+    assert projected['total_net_weight_kg'].iloc[0] == pytest.approx(10.0)
+
+
+def test_project_quota_leaves_out_farmers_missing_from_quota_view():
+    uploaded = _upload([('f1', 100.0), ('f9', 5000.0)])
+    projected = project_quota(uploaded, _quota([('f1', 1000.0, 0.0)]), pd.Series(dtype=float))
+    assert projected['farmer_id'].tolist() == ['f1']
+
+
+def test_project_quota_flags_a_farmer_without_a_quota():
+    projected = project_quota(_upload([('f1', 100.0)]), _quota([('f1', 0.0, None)]), pd.Series(dtype=float))
+    assert projected['quota_status'].iloc[0] == 'EXCEEDED'
+    assert np.isnan(projected['quota_used_pct'].iloc[0])
+
+
+def _many_lots(lots=500, farmers=2000):
+    return pd.DataFrame({
+        'exporter': 'EXP A',
+        'export_lot': [f'BL-2026/{i % lots:05d}' for i in range(farmers * 2)],
+        'farmer_id': [f'ci-farmer-{i % farmers:06d}' for i in range(farmers * 2)],
+        'net_weight_kg': 10.0
+    })
+
+
+def test_key_batches_cover_every_key_within_the_url_budget():
+    uploaded = _many_lots()
+    batches = list(quota._key_batches(uploaded))
+
+    covered = {(lot, farmer_id) for lots, farmer_ids in batches for lot in lots for farmer_id in farmer_ids}
+    assert set(zip(uploaded['export_lot'], uploaded['farmer_id'])) <= covered
+    for lots, farmer_ids in batches:
+        request = httpx.Request("GET", "https://example.supabase.co/rest/v1/traceability", params=[
+            ("select", "exporter,export_lot,farmer_id,net_weight_kg"),
+            ("export_lot", quota._in(lots)), ("farmer_id", quota._in(farmer_ids))
+        ])
+        assert len(str(request.url)) < 8192
+
+
+def test_farmer_batches_stay_within_the_url_budget():
+    long_ids = [f'farmer-{"x" * 60}-{i}' for i in range(500)]
+    for batch in quota._batches(long_ids):
+        assert sum(map(quota._url_chars, batch)) <= quota.IN_FILTER_MAX_CHARS
+    assert sum(len(batch) for batch in quota._batches(long_ids)) == 500
+
+
+def test_fetch_existing_rows_async_returns_exact_keys():
+    stored = [
+        {'exporter': 'EXP A', 'export_lot': 'L1', 'farmer_id': 'f1', 'net_weight_kg': 1.0},
+        {'exporter': 'EXP A', 'export_lot': 'L2', 'farmer_id': 'f1', 'net_weight_kg': 2.0},  # f1 is not in L2 upload
+        {'exporter': 'EXP A', 'export_lot': 'L2', 'farmer_id': 'f2', 'net_weight_kg': 3.0},
+        {'exporter': 'EXP B', 'export_lot': 'L1', 'farmer_id': 'f1', 'net_weight_kg': 4.0},
+    ]
+
+    def handle(request):
+        rows = stored
+        for column, value in request.url.params.multi_items():
+            if value.startswith("in."):
+                allowed = {v.strip('"') for v in value[4:-1].split(",")}
+                rows = [row for row in rows if row[column] in allowed]
+        return httpx.Response(200, json=rows)
+
+    rest = AsyncRest("https://example.supabase.co", "key", transport=httpx.MockTransport(handle))
+    try:
+        uploaded = pd.DataFrame({'exporter': ['EXP A', 'EXP A'], 'export_lot': ['L1', 'L2'], 'farmer_id': ['f1', 'f2']})
+        existing = rest.run(quota.fetch_existing_rows_async(rest, uploaded, ['net_weight_kg']))
+    finally:
+        rest.close()
+    assert existing['net_weight_kg'].tolist() == [1.0, 3.0]
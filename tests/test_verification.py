@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+
+import verification
+
+
+def _delivery(rows):
+    return pd.DataFrame(rows, columns=['exporter', 'export_lot', 'farmer_id', 'net_weight_kg'])
+
+
+def _quota(rows):
+    return pd.DataFrame(rows, columns=['farmer_id', 'max_quota_kg', 'total_net_weight_kg'])
+
+
+@pytest.mark.parametrize("kg, ok", [(20999.0, False), (20999.99, False), (21000.0, True), (35000.0, True)])
+def test_check_lots_minimum(kg, ok):
+    lots = verification.check_lots(_delivery([('EXP A', 'LOT1', 'f1', kg / 2), ('EXP A', 'LOT1', 'f2', kg / 2)]))
+    assert lots['lot_ok'].tolist() == [ok]
+    assert lots['total_net_weight_kg'].tolist() == [pytest.approx(kg)]
+
+
+def test_verify_approves_a_delivery_within_lots_and_quotas():
+    delivery = _delivery([('EXP A', 'LOT1', 'f1', 11000.0), ('EXP A', 'LOT1', 'f2', 10000.0)])
+    quota_rows = _quota([('f1', 20000.0, 0.0), ('f2', 20000.0, 0.0)])
+
+    verdict = verification.verify(delivery, frozenset({'f1', 'f2'}), quota_rows)
+    assert verdict['status'] == 'approved' and verdict['reasons'] == []
+    assert verdict['exporters']['status'].tolist() == ['approved']
+
+
+def test_verify_rejects_low_lots_and_exceeded_quotas():
+    delivery = _delivery([('EXP A', 'LOT1', 'f1', 15000.0), ('EXP B', 'LOT2', 'f2', 25000.0)])
+    quota_rows = _quota([('f1', 20000.0, 0.0), ('f2', 20000.0, 0.0)])
+
+    verdict = verification.verify(delivery, frozenset({'f1', 'f2'}), quota_rows)
+    assert verdict['status'] == 'rejected'
+    assert verdict['reasons'] == [{'code': 'lot_too_low', 'lots': ['LOT1']},
+                                  {'code': 'quota_exceeded', 'farmer_ids': ['f2']}]
+    assert verdict['exporters'].set_index('exporter')['status'].to_dict() == {'EXP A': 'rejected', 'EXP B': 'rejected'}
+
+
+def test_verify_counts_replaced_kg_only_once():
+    delivery = _delivery([('EXP A', 'LOT1', 'f1', 21000.0)])
+    # the view already holds this lot's earlier 21000 kg, which the upload replaces
+    quota_rows = _quota([('f1', 30000.0, 21000.0)])
+
+    assert verification.verify(delivery, frozenset({'f1'}), quota_rows)['status'] == 'rejected'
+    verdict = verification.verify(delivery, frozenset({'f1'}), quota_rows, pd.Series({'f1': 21000.0}))
+    assert verdict['status'] == 'approved'
+
+
+def test_verify_rejects_unknown_farmers_without_projecting_quotas():
+    delivery = _delivery([('EXP A', 'LOT1', 'f1', 21000.0), ('EXP A', 'LOT1', 'zz', 1.0)])
+    verdict = verification.verify(delivery, frozenset({'f1'}), _quota([('f1', 30000.0, 0.0)]))
+    assert verdict['reasons'] == [{'code': 'unknown_farmers', 'farmer_ids': ['zz']}]
+    assert 'quota_df' not in verdict
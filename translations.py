@@ -0,0 +1,243 @@
+# UI texts for the Streamlit pages. Imported once per process: a Streamlit
+# rerun re-executes main.py but not the modules it imports, so the tables
+# below are built a single time instead of inside every t() call.
+
+LANGUAGES = ["English", "Français"]
+
+TRANSLATIONS = {
+    "upload_title": {
+        "English": "📤 Drag and drop a verification file here",
+        "Français": "📤 Glissez-déposez un fichier de vérification ici"
+    },
+    "or": {
+        "English": "or",
+        "Français": "ou"
+    },
+    "file_format_caption": {
+        "English": "✅ Format: .xlsx, .csv or .parquet (fastest for large ERP exports) | Max size: 200MB",
+        "Français": "✅ Format : .xlsx, .csv ou .parquet (le plus rapide pour les gros exports ERP) | Taille max : 200 Mo"
+    },
+    "title": {
+        "English": "☁️ CloudIA – Farmer Quota Verification System",
+        "Français": "☁️ CloudIA – Système de Vérification des Quotas"
+    },
+    "generate_pdf": {
+        "English": "Generate Approval PDF",
+        "Français": "Générer le certificat PDF"
+    },
+    "download_pdf": {
+        "English": "Download Approval PDF",
+        "Français": "Télécharger le certificat PDF"
+    },
+    "insert_success": {
+        "English": "✅ Data successfully inserted! {} new records added.",
+        "Français": "✅ Données insérées avec succès ! {} nouveaux enregistrements ajoutés."
+    },
+    "diff_applied": {
+        "English": "✅ Delivery updated: {} records added, {} removed ({} changed weights), {} unchanged.",
+        "Français": "✅ Livraison mise à jour : {} enregistrements ajoutés, {} supprimés ({} poids modifiés), {} inchangés."
+    },
+    "no_changes": {
+        "English": "ℹ️ This delivery is already stored exactly as uploaded – nothing to write.",
+        "Français": "ℹ️ Cette livraison est déjà enregistrée telle quelle – rien à écrire."
+    },
+    "already_approved": {
+        "English": "ℹ️ This exact file was already approved ({}, {}). Nothing to process.",
+        "Français": "ℹ️ Ce fichier identique a déjà été approuvé ({}, {}). Rien à traiter."
+    },
+    "exporter_write_title": {
+        "English": "### 🏭 Write result per exporter",
+        "Français": "### 🏭 Résultat de l'enregistrement par exportateur"
+    },
+    "exporter_write_failed": {
+        "English": "❌ Saving failed for: {}. The other exporters were saved; upload the same file again to write only what is missing.",
+        "Français": "❌ Échec de l'enregistrement pour : {}. Les autres exportateurs ont été enregistrés ; rechargez le même fichier pour n'écrire que ce qui manque."
+    },
+    "exporter_summary_title": {
+        "English": "### 🏭 Verification per exporter",
+        "Français": "### 🏭 Vérification par exportateur"
+    },
+    "insert_error": {
+        "English": "❌ Error while inserting into traceability table",
+        "Français": "❌ Erreur lors de l'insertion dans la table de traçabilité"
+    },
+    "approval_queued": {
+        "English": "🕒 Approval record and SharePoint upload of '{}' queued. Track them under \"Background jobs\" in the sidebar.",
+        "Français": "🕒 Enregistrement de l'approbation et envoi de '{}' vers SharePoint en file d'attente. Suivez-les dans « Tâches en arrière-plan » dans la barre latérale."
+    },
+    "pipeline_timings": {
+        "English": "⏱️ Pipeline timings (recent runs)",
+        "Français": "⏱️ Durées du traitement (exécutions récentes)"
+    },
+    "last_run_timings": {
+        "English": "This file",
+        "Français": "Ce fichier"
+    },
+    "rerun_budget": {
+        "English": "Page rerun p95: {:.0f} ms (budget {} ms)",
+        "Français": "Réexécution de la page p95 : {:.0f} ms (budget {} ms)"
+    },
+    "background_jobs": {
+        "English": "🕒 Background jobs",
+        "Français": "🕒 Tâches en arrière-plan"
+    },
+    "file_approved": {
+        "English": "✅ File approved. All farmers valid, quotas OK, and delivered kg per lot within allowed range.",
+        "Français": "✅ Fichier approuvé. Tous les producteurs sont valides, les quotas sont respectés et les kg par lot sont dans la plage autorisée."
+    },
+    "validation_rejected": {
+        "English": "❌ Uploaded delivery was rejected due to validation errors. Nothing was saved and the PDF cannot be generated.",
+        "Français": "❌ La livraison téléversée a été rejetée en raison d'erreurs de validation. Rien n'a été enregistré et le certificat PDF ne peut pas être généré."
+    },
+    "lot_status_out_of_range": {
+        "English": "### Lot Status Overview - Out of Range",
+        "Français": "### Aperçu de l'état des lots - Hors plage autorisée"
+    },
+    "quota_warning_count": {
+        "English": "⚠️ {} farmers in the uploaded file have quota warnings or exceeded limits.",
+        "Français": "⚠️ {} producteurs du fichier ont des avertissements de quota ou ont dépassé les limites."
+    },
+    "quota_ok": {
+        "English": "✅ All farmers in the uploaded file are within their assigned quotas.",
+        "Français": "✅ Tous les producteurs du fichier respectent leurs quotas assignés."
+    },
+    "quota_overview_title": {
+        "English": "### Quota Overview (Only Warnings and Exceeded)",
+        "Français": "### Aperçu des quotas (avertissements et dépassements uniquement)"
+    },
+    "quota_read_error": {
+        "English": "❌ Could not read quotas from quota_view: {}",
+        "Français": "❌ Impossible de lire les quotas depuis quota_view : {}"
+    },
+    "unknown_farmers_error": {
+        "English": "❌ The following farmers are NOT in the database:",
+        "Français": "❌ Les producteurs suivants ne sont PAS présents dans la base de données :"
+    },
+    "unsupported_format": {
+        "English": "❌ Could not read the file: {}. Upload an .xlsx, .csv or .parquet delivery.",
+        "Français": "❌ Impossible de lire le fichier : {}. Téléversez une livraison .xlsx, .csv ou .parquet."
+    },
+    "missing_columns": {
+        "English": "❌ Missing columns: {}",
+        "Français": "❌ Colonnes manquantes : {}"
+    },
+    "missing_exporter_column": {
+        "English": "❌ Missing 'exporter' column in the Excel file.",
+        "Français": "❌ La colonne 'exporter' est manquante dans le fichier Excel."
+    },
+    "lot_too_low": {
+        "English": "Too low",
+        "Français": "Trop faible"
+    },
+    "lot_within_range": {
+        "English": "Within range",
+        "Français": "Dans la plage autorisée"
+    },
+    "saving": {
+        "English": "💾 Saving data...",
+        "Français": "💾 Sauvegarde des données..."
+    },
+    "force_resync": {
+        "English": "🔄 Resync farmer registry",
+        "Français": "🔄 Resynchroniser le registre des producteurs"
+    },
+    "registry_resynced": {
+        "English": "✅ Farmer registry resynced ({} farmers).",
+        "Français": "✅ Registre des producteurs resynchronisé ({} producteurs)."
+    },
+    "unfinished_imports": {
+        "English": "⚠️ Unfinished imports",
+        "Français": "⚠️ Imports inachevés"
+    },
+    "unfinished_import_line": {
+        "English": "{} ({}): {}/{} batches committed. Last error: {}",
+        "Français": "{} ({}) : {}/{} lots d'envoi enregistrés. Dernière erreur : {}"
+    },
+    "resume_import": {
+        "English": "Resume",
+        "Français": "Reprendre"
+    },
+    "rollback_import": {
+        "English": "Roll back",
+        "Français": "Annuler"
+    },
+    "import_resumed": {
+        "English": "ℹ️ An interrupted import of this file was resumed from the journal; batches already saved were not sent again.",
+        "Français": "ℹ️ Un import interrompu de ce fichier a été repris depuis le journal ; les lots d'envoi déjà enregistrés n'ont pas été renvoyés."
+    },
+    "import_resumable": {
+        "English": "ℹ️ The batches already saved are kept. Upload the same file again to resume, or roll the import back under \"Unfinished imports\" in the sidebar.",
+        "Français": "ℹ️ Les lots d'envoi déjà enregistrés sont conservés. Rechargez le même fichier pour reprendre, ou annulez l'import dans « Imports inachevés » dans la barre latérale."
+    },
+    "import_rolled_back": {
+        "English": "✅ Import rolled back; the previous records were restored.",
+        "Français": "✅ Import annulé ; les enregistrements précédents ont été restaurés."
+    },
+    "import_rollback_failed": {
+        "English": "❌ Rollback failed; it can be retried.",
+        "Français": "❌ L'annulation a échoué ; elle peut être relancée."
+    },
+    "analytics_title": {
+        "English": "📊 Delivery analytics",
+        "Français": "📊 Analyse des livraisons"
+    },
+    "analytics_snapshot": {
+        "English": "Pre-aggregated volumes, snapshot from {}.",
+        "Français": "Volumes pré-agrégés, instantané du {}."
+    },
+    "analytics_refresh": {
+        "English": "🔄 Refresh snapshot",
+        "Français": "🔄 Actualiser l'instantané"
+    },
+    "analytics_unavailable": {
+        "English": "❌ Delivery rollups are not available: {}",
+        "Français": "❌ Les agrégats de livraisons ne sont pas disponibles : {}"
+    },
+    "analytics_period": {
+        "English": "Purchase period",
+        "Français": "Période d'achat"
+    },
+    "analytics_group_by": {
+        "English": "Group by",
+        "Français": "Regrouper par"
+    },
+    "analytics_volume_title": {
+        "English": "### Delivered volume",
+        "Français": "### Volume livré"
+    },
+    "analytics_total": {
+        "English": "Total: {:,.2f} MT in {:,} records",
+        "Français": "Total : {:,.2f} t sur {:,} enregistrements"
+    },
+    "analytics_quota_title": {
+        "English": "### Farmers near their quota, per cooperative",
+        "Français": "### Producteurs proches de leur quota, par coopérative"
+    },
+    "analytics_quota_threshold": {
+        "English": "Quota used at least (%)",
+        "Français": "Quota utilisé d'au moins (%)"
+    },
+    "exporter": {
+        "English": "Exporter",
+        "Français": "Exportateur"
+    },
+    "export_lot": {
+        "English": "Export lot",
+        "Français": "Lot d'exportation"
+    },
+    "cooperative_name": {
+        "English": "Cooperative",
+        "Français": "Coopérative"
+    },
+    "month": {
+        "English": "Month",
+        "Français": "Mois"
+    }
+}
+
+# key -> text, one flat table per language
+TABLES = {lang: {key: texts[lang] for key, texts in TRANSLATIONS.items() if lang in texts} for lang in LANGUAGES}
+
+
+def translate(key, lang):
+    return TABLES.get(lang, {}).get(key, key)
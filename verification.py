@@ -0,0 +1,107 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import quota
+
+# Streamlit-free verification steps shared by the page (main.py) and the
+# batch CLI (verify_deliveries.py).
+
+LOT_MIN_MT = 21
+DEDUPE_COLUMNS = ['export_lot', 'exporter', 'farmer_id', 'net_weight_kg']
+
+
+def prepare_delivery(uploaded_df):
+    uploaded_df['purchase_date'] = uploaded_df['purchase_date'].fillna(datetime.today().strftime('%Y-%m-%d'))
+    return uploaded_df.drop_duplicates(subset=DEDUPE_COLUMNS, keep='last')
+
+
+def find_unknown_farmers(uploaded_df, known_farmer_ids):
+    """Farmer IDs in the upload that are not in the registry.
+
+    ``known_farmer_ids`` should be the frozenset built once per registry
+    version: only the upload's distinct IDs are probed against it, so no
+    hash table over the whole registry is rebuilt per file.
+    """
+    if not isinstance(known_farmer_ids, (set, frozenset)):
+        known_farmer_ids = frozenset(known_farmer_ids)
+    return np.array([f for f in uploaded_df['farmer_id'].unique() if f not in known_farmer_ids], dtype=object)
+
+
+def check_lots(uploaded_df):
+    """Total kg per lot and whether it reaches the LOT_MIN_MT minimum (truncated to 0.01 MT)."""
+    lot_totals = uploaded_df.groupby('export_lot', observed=True)['net_weight_kg'].sum()
+    lot_ok = np.floor(lot_totals / 1000 * 100) >= LOT_MIN_MT * 100
+    return pd.DataFrame({
+        'export_lot': lot_totals.index,
+        'total_net_weight_kg': lot_totals.values,
+        'lot_ok': lot_ok.values
+    })
+
+
+def summarize_exporters(uploaded_df, lots, unknown_farmers=(), exceeded_farmers=()):
+    """Rows, lots, kg and verdict per exporter from one groupby over (exporter, export_lot).
+
+    Lot minimums and quotas stay file-wide (a farmer's quota spans every
+    exporter), so an exporter is ``rejected`` when one of its lots is too low
+    or one of its farmers is unknown or over quota.
+    """
+    per_lot = uploaded_df.groupby(['exporter', 'export_lot'], sort=False, observed=True).agg(
+        rows=('net_weight_kg', 'size'), total_net_weight_kg=('net_weight_kg', 'sum')
+    ).reset_index()
+    low_lots = set(lots.loc[~lots['lot_ok'], 'export_lot'])
+    per_lot['lot_too_low'] = per_lot['export_lot'].isin(low_lots)
+    summary = per_lot.groupby('exporter', sort=False, observed=True).agg(
+        lots=('export_lot', 'size'), rows=('rows', 'sum'),
+        total_net_weight_kg=('total_net_weight_kg', 'sum'), lots_too_low=('lot_too_low', 'sum')
+    )
+
+    flagged = uploaded_df['farmer_id'].isin(set(unknown_farmers) | set(exceeded_farmers))
+    flagged_farmers = uploaded_df.loc[flagged].groupby('exporter', observed=True)['farmer_id'].nunique()
+    summary['flagged_farmers'] = flagged_farmers.reindex(summary.index, fill_value=0)
+    summary['status'] = np.where((summary['lots_too_low'] > 0) | (summary['flagged_farmers'] > 0), 'rejected', 'approved')
+    return summary.reset_index().astype({'exporter': str})
+
+
+def verify(uploaded_df, known_farmer_ids, quota_rows=None, replaced_kg=None):
+    """Run every check on a prepared delivery and return a machine-readable verdict.
+
+    Quota projection is skipped when ``quota_rows`` is None. The result has
+    ``status`` (``approved``/``rejected``), a list of ``reasons`` and the
+    lot totals, plus the ``lots`` and per-exporter ``exporters`` frames and
+    (when quotas were checked) the projected ``quota_df`` for display.
+    """
+    reasons = []
+    result = {'rows': int(len(uploaded_df)), 'farmers': int(uploaded_df['farmer_id'].nunique())}
+
+    if uploaded_df.empty:
+        reasons.append({'code': 'empty_file'})
+
+    unknown_farmers = find_unknown_farmers(uploaded_df, known_farmer_ids)
+    if unknown_farmers.size > 0:
+        reasons.append({'code': 'unknown_farmers', 'farmer_ids': sorted(map(str, unknown_farmers))})
+
+    lots = check_lots(uploaded_df)
+    result['lots'] = lots
+    result['lot_totals'] = {str(lot): float(kg) for lot, kg in zip(lots['export_lot'], lots['total_net_weight_kg'])}
+    low_lots = lots[~lots['lot_ok']]
+    if not low_lots.empty:
+        reasons.append({'code': 'lot_too_low', 'lots': [str(lot) for lot in low_lots['export_lot']]})
+
+    exceeded_farmers = []
+    if quota_rows is not None and unknown_farmers.size == 0 and not uploaded_df.empty:
+        if replaced_kg is None:
+            replaced_kg = pd.Series(dtype=float)
+        quota_df = quota.project_quota(uploaded_df, quota_rows, replaced_kg)
+        result['quota_df'] = quota_df
+        exceeded = quota_df[quota_df['quota_status'] == 'EXCEEDED']
+        exceeded_farmers = exceeded['farmer_id'].tolist()
+        if not exceeded.empty:
+            reasons.append({'code': 'quota_exceeded', 'farmer_ids': exceeded['farmer_id'].astype(str).tolist()})
+
+    result['exporters'] = summarize_exporters(uploaded_df, lots, unknown_farmers, exceeded_farmers)
+
+    result['status'] = 'rejected' if reasons else 'approved'
+    result['reasons'] = reasons
+    return result
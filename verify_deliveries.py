@@ -0,0 +1,112 @@
+"""Verify a folder of delivery workbooks without the Streamlit page.
+
+    python verify_deliveries.py deliveries/ --workers 8 --output results.jsonl
+
+Every ``.xlsx``, ``.csv`` and ``.parquet`` file gets the same checks as an upload in main.py (columns,
+farmer lookup, dedupe, lot minimum, projected quotas) and one JSON line with
+its verdict. Nothing is written to the database.
+"""
+import argparse
+import json
+import os
+import sys
+import tomllib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from supabase import create_client
+
+import farmer_registry
+import quota
+import verification
+from delivery_reader import read_delivery, MissingColumnsError, UnsupportedFormatError, SUPPORTED_EXTENSIONS
+
+SECRETS_PATH = os.path.join(".streamlit", "secrets.toml")
+FARMERS_SYNC_TTL = 15 * 60
+
+# Per-process state set by _init_worker: the registry is shipped to each
+# worker once instead of once per file.
+_known_farmer_ids = None
+_supabase = None
+
+
+def create_supabase(secrets_path=SECRETS_PATH):
+    url = os.environ.get("SUPABASE_URL")
+    key = os.environ.get("SUPABASE_KEY")
+    if not (url and key):
+        with open(secrets_path, "rb") as f:
+            secrets = tomllib.load(f)["supabase"]
+        url, key = secrets["url"], secrets["key"]
+    return create_client(url, key)
+
+
+def _init_worker(known_farmer_ids, secrets_path, check_quota):
+    global _known_farmer_ids, _supabase
+    _known_farmer_ids = known_farmer_ids
+    _supabase = create_supabase(secrets_path) if check_quota else None
+
+
+def verify_file(path):
+    result = {'file': os.path.basename(path)}
+    try:
+        uploaded_df = verification.prepare_delivery(read_delivery(path))
+    except UnsupportedFormatError as e:
+        result.update(status='rejected', reasons=[{'code': 'unsupported_format', 'message': str(e)}])
+        return result
+    except MissingColumnsError as e:
+        result.update(status='rejected', reasons=[{'code': 'missing_columns', 'columns': e.missing}])
+        return result
+
+    quota_rows = replaced_kg = None
+    if _supabase is not None and not uploaded_df.empty:
+        quota_rows, replaced_kg = quota.fetch_delivery_quota(_supabase, uploaded_df)
+
+    verdict = verification.verify(uploaded_df, _known_farmer_ids, quota_rows, replaced_kg)
+    verdict.pop('lots')
+    verdict.pop('quota_df', None)
+    verdict['exporters'] = verdict['exporters'].to_dict(orient='records')
+    result.update(verdict)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory", help="folder containing .xlsx/.csv/.parquet delivery files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--output", help="write JSON lines here instead of stdout")
+    parser.add_argument("--secrets", default=SECRETS_PATH, help="Streamlit secrets.toml with [supabase] url/key")
+    parser.add_argument("--skip-quota", action="store_true", help="do not read quotas from the database")
+    parser.add_argument("--force-resync", action="store_true", help="rebuild the local farmer registry snapshot")
+    args = parser.parse_args(argv)
+
+    paths = sorted(
+        os.path.join(args.directory, name) for name in os.listdir(args.directory)
+        if name.lower().endswith(tuple("." + ext for ext in SUPPORTED_EXTENSIONS)) and not name.startswith("~$")
+    )
+    registry = farmer_registry.load_registry(create_supabase(args.secrets), FARMERS_SYNC_TTL, force=args.force_resync)
+    known_farmer_ids = frozenset(registry['farmer_id'])
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    counts = {'approved': 0, 'rejected': 0, 'error': 0}
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                 initargs=(known_farmer_ids, args.secrets, not args.skip_quota)) as pool:
+            futures = {pool.submit(verify_file, path): path for path in paths}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'file': os.path.basename(futures[future]), 'status': 'error', 'error': repr(e)}
+                counts[result['status']] += 1
+                out.write(json.dumps(result, default=str) + "\n")
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"{len(paths)} files: {counts['approved']} approved, {counts['rejected']} rejected, "
+          f"{counts['error']} errors", file=sys.stderr)
+    return 1 if counts['error'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())